@@ -1,7 +1,7 @@
 {
     'name': 'Coflow Codex Assistant',
     'summary': 'Use a configurable LLM (Codex) to assist in Discuss and Helpdesk (reply drafting & reporting)',
-    'version': '17.0.2.0.0',
+    'version': '17.0.2.1.0',
     'category': 'Productivity',
     'license': 'LGPL-3',
     'author': 'Coflow Teknoloji',
@@ -14,6 +14,14 @@
         'views/res_config_settings_views.xml',
         'views/res_config_settings_rag_views.xml',
         'views/codex_document_views.xml',
+        'views/codex_provider_views.xml',
+        'views/codex_index_views.xml',
+        'views/codex_indexer_state_views.xml',
+        'views/codex_cache_views.xml',
+        'views/codex_job_views.xml',
+        'wizard/codex_batch_wizard_views.xml',
+        'views/codex_metric_views.xml',
+        'wizard/codex_metric_summary_views.xml',
         'data/cron.xml',
         'views/codex_history_views.xml',
         'views/helpdesk_views.xml',
@@ -21,8 +29,14 @@
     ],
     'assets': {
         'web.assets_backend': [
+            'co_codex_assistant/static/src/js/codex_stream_button.js',
+            'co_codex_assistant/static/src/js/codex_job_service.js',
+            'co_codex_assistant/static/src/xml/codex_stream_button.xml',
         ],
     },
+    'external_dependencies': {
+        'python': ['numpy', 'requests'],
+    },
     'installable': True,
     'application': False,
 }
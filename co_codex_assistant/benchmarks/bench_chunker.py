@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Compare the former fixed-size character slicer with the sentence chunker.
+
+Runs without Odoo or network access; embeddings are a local feature-hashing
+stand-in, so hit rates are comparable between chunkers, not absolute:
+
+    python3 co_codex_assistant/benchmarks/bench_chunker.py --tickets 2000
+
+A query is one sentence of a ticket. It is a hit when one of the top-k
+retrieved chunks contains that whole sentence.
+"""
+import argparse
+
+import numpy as np
+
+from common import hash_embed, load_tools, make_ticket
+
+
+def legacy_chunks(html, chunk_size):
+    # former rag_index_now behaviour: raw field value sliced every chunk_size chars
+    return [html[i:i + chunk_size] for i in range(0, len(html), chunk_size)]
+
+
+def evaluate(name, chunks_per_ticket, queries, k, tools):
+    chunks = [c for chunks in chunks_per_ticket for c in chunks]
+    tokens = [tools.text.estimate_tokens(c) for c in chunks]
+    matrix = tools.vector_engine.VectorMatrix(
+        np.arange(len(chunks)), tools.vector_engine.normalize_rows(hash_embed(chunks)))
+    qvecs = hash_embed(queries)
+    hits = 0
+    for query, qvec in zip(queries, qvecs):
+        ids, _scores = matrix.search(qvec, k)
+        hits += any(query in chunks[i] for i in ids)
+    print(f"{name:<22} {len(chunks):>8} {np.mean(tokens):>10.1f} {sum(tokens):>12} "
+          f"{sum(t < 32 for t in tokens):>8} {hits / len(queries):>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--chars', type=int, default=1000, help='legacy slice size')
+    parser.add_argument('--tokens', type=int, default=256, help='chunker token budget')
+    parser.add_argument('--overlap', type=int, default=32)
+    args = parser.parse_args()
+
+    tools = load_tools()
+    rng = np.random.default_rng(7)
+    tickets = [make_ticket(rng) for _ in range(args.tickets)]
+    sentences = [s for _html, ticket_sentences in tickets for s in ticket_sentences]
+    queries = [sentences[i] for i in rng.choice(len(sentences), args.queries, replace=False)]
+
+    print(f"{'chunker':<22} {'chunks':>8} {'tok/chunk':>10} {'total tokens':>12} {'<32 tok':>8} {'hit@k':>9}")
+    evaluate(f"slice {args.chars} chars", [legacy_chunks(html, args.chars) for html, _s in tickets],
+             queries, args.k, tools)
+    evaluate(f"sentences {args.tokens}/{args.overlap}",
+             [tools.text.chunk_text(tools.text.html_to_text(html), args.tokens, args.overlap) for html, _s in tickets],
+             queries, args.k, tools)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""End-to-end RAG benchmark: indexing throughput, retrieval latency, memory and recall.
+
+Runs without Odoo or network access. A synthetic helpdesk corpus is chunked
+like the indexer does, embedded through a local stand-in embeddings server
+(``stub_server.py``) in batches on a thread pool, appended to an embedding
+store file and searched with the retrieval engine:
+
+    python3 co_codex_assistant/benchmarks/bench_harness.py --tickets 20000 --nprobe 8
+    python3 co_codex_assistant/benchmarks/bench_harness.py --tokens 128 --json > small_chunks.json
+
+Reported figures:
+
+- indexing: chunks/s of chunking + embedding + store append (``--latency-ms``
+  adds a fixed delay per embeddings request, to mimic a remote provider)
+- retrieval p50/p95: search only, and with the query embedding round trip
+- memory per 10k chunks: matrix, row ids and ANN index
+- recall@k of the ANN search against the exact brute-force search
+- hit@k: share of queries (one sentence of a ticket) whose top-k chunks
+  contain that sentence; comparable between runs, not absolute
+
+Compare runs with different ``--tokens``, ``--k``, ``--nprobe`` or
+``--batch-items`` to see what a setting change costs or gains.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from common import load_tools, make_ticket
+from stub_server import serve
+
+
+def batches(texts, max_items, max_tokens, estimate):
+    # same bounds as codex.client._embed_batches
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        cost = estimate(text) + 1
+        if i > start and (i - start >= max_items or tokens + cost > max_tokens):
+            yield start, i
+            start, tokens = i, 0
+        tokens += cost
+    if start < len(texts):
+        yield start, len(texts)
+
+
+def embed(session, url, texts):
+    resp = session.post(f"{url}/embeddings", json={'model': 'stub', 'input': texts}, timeout=60)
+    resp.raise_for_status()
+    return [d['embedding'] for d in sorted(resp.json()['data'], key=lambda d: d['index'])]
+
+
+def percentiles(samples):
+    return np.percentile(np.array(samples) * 1000, [50, 95])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--tokens', type=int, default=256, help='chunk size (tokens)')
+    parser.add_argument('--overlap', type=int, default=32, help='chunk overlap (tokens)')
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--batch-items', type=int, default=64)
+    parser.add_argument('--batch-tokens', type=int, default=8000)
+    parser.add_argument('--concurrency', type=int, default=4, help='embedding requests in flight')
+    parser.add_argument('--latency-ms', type=float, default=0, help='stub server delay per request')
+    parser.add_argument('--nprobe', type=int, default=0, help='also train and measure the IVF index')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    tools = load_tools()
+    text = tools.text
+    rng = np.random.default_rng(11)
+    server, url = serve(dim=args.dim, latency_ms=args.latency_ms)
+    session = requests.Session()
+    results = {'args': vars(args)}
+
+    try:
+        tickets = [make_ticket(rng) for _ in range(args.tickets)]
+
+        # indexing: chunk, embed in concurrent batches, append to the store
+        with tempfile.TemporaryDirectory() as tmp:
+            store = tools.embedding_store.EmbeddingStore(os.path.join(tmp, 'bench.f32'), args.dim)
+            t0 = time.perf_counter()
+            chunks = [c for html, _s in tickets
+                      for c in text.chunk_text(text.html_to_text(html), args.tokens, args.overlap)]
+            t_chunk = time.perf_counter() - t0
+            ranges = list(batches(chunks, args.batch_items, args.batch_tokens, text.estimate_tokens))
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                vectors = pool.map(lambda r: embed(session, url, chunks[r[0]:r[1]]), ranges)
+                for block in vectors:
+                    store.append(block)
+            t_index = time.perf_counter() - t0
+            results['indexing'] = {
+                'chunks': len(chunks),
+                'batches': len(ranges),
+                'chunking_s': round(t_chunk, 3),
+                'total_s': round(t_index, 3),
+                'chunks_per_s': round(len(chunks) / t_index, 1),
+            }
+
+            matrix = tools.vector_engine.VectorMatrix(np.arange(len(chunks)), np.array(store.open()))
+
+        # retrieval: exact search, then IVF if requested
+        sentences = [s for _html, ticket_sentences in tickets for s in ticket_sentences]
+        queries = [sentences[i] for i in rng.choice(len(sentences), min(args.queries, len(sentences)),
+                                                     replace=False)]
+        round_trip, search, exact_ids, hits = [], [], [], 0
+        for query in queries:
+            t0 = time.perf_counter()
+            qvec = np.array(embed(session, url, [query])[0], dtype=np.float32)
+            t1 = time.perf_counter()
+            ids, _scores = matrix.search(qvec, args.k)
+            t2 = time.perf_counter()
+            round_trip.append(t2 - t0)
+            search.append(t2 - t1)
+            exact_ids.append((qvec, set(ids)))
+            hits += any(query in chunks[i] for i in ids)
+        ann_bytes = 0
+        results['exact'] = {
+            'search_ms_p50_p95': [round(x, 3) for x in percentiles(search)],
+            'with_embedding_ms_p50_p95': [round(x, 3) for x in percentiles(round_trip)],
+            'hit_at_k': round(hits / len(queries), 3),
+        }
+        if args.nprobe:
+            t0 = time.perf_counter()
+            matrix.ann = tools.ivf.IVFIndex.train(matrix.matrix)
+            t_train = time.perf_counter() - t0
+            ann = matrix.ann
+            ann_bytes = ann.centroids.nbytes + ann.labels.nbytes + ann.order.nbytes + ann.offsets.nbytes
+            ann_search, recall, hits = [], [], 0
+            for query, (qvec, exact) in zip(queries, exact_ids):
+                t0 = time.perf_counter()
+                ids, _scores = matrix.search(qvec, args.k, nprobe=args.nprobe)
+                ann_search.append(time.perf_counter() - t0)
+                recall.append(len(exact & set(ids)) / max(len(exact), 1))
+                hits += any(query in chunks[i] for i in ids)
+            results['ann'] = {
+                'nlist': ann.nlist,
+                'train_s': round(t_train, 3),
+                'search_ms_p50_p95': [round(x, 3) for x in percentiles(ann_search)],
+                'recall_at_k': round(float(np.mean(recall)), 3),
+                'hit_at_k': round(hits / len(queries), 3),
+            }
+        per_10k = 10000 / max(len(chunks), 1) / 2 ** 20
+        results['memory_mb_per_10k_chunks'] = {
+            'matrix': round(matrix.matrix.nbytes * per_10k, 2),
+            'ids': round(matrix.ids.nbytes * per_10k, 2),
+            'ann': round(ann_bytes * per_10k, 2),
+        }
+    finally:
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    idx = results['indexing']
+    print(f"corpus      {args.tickets} tickets -> {idx['chunks']} chunks ({args.tokens}/{args.overlap} tokens), "
+          f"dim {args.dim}")
+    print(f"indexing    {idx['chunks_per_s']:.0f} chunks/s ({idx['batches']} batches, "
+          f"{args.concurrency} in flight, chunking {idx['chunking_s']:.2f}s of {idx['total_s']:.2f}s)")
+    ex = results['exact']
+    print(f"exact       search p50/p95 {ex['search_ms_p50_p95'][0]:.2f}/{ex['search_ms_p50_p95'][1]:.2f} ms, "
+          f"with query embedding {ex['with_embedding_ms_p50_p95'][0]:.2f}/{ex['with_embedding_ms_p50_p95'][1]:.2f} ms, "
+          f"hit@{args.k} {ex['hit_at_k']:.3f}")
+    if 'ann' in results:
+        ann = results['ann']
+        print(f"ivf         nlist {ann['nlist']} nprobe {args.nprobe}: search p50/p95 "
+              f"{ann['search_ms_p50_p95'][0]:.2f}/{ann['search_ms_p50_p95'][1]:.2f} ms, "
+              f"recall@{args.k} {ann['recall_at_k']:.3f}, hit@{args.k} {ann['hit_at_k']:.3f} "
+              f"(trained in {ann['train_s']:.2f}s)")
+    mem = results['memory_mb_per_10k_chunks']
+    print(f"memory      per 10k chunks: matrix {mem['matrix']:.2f} MB, ids {mem['ids']:.2f} MB, "
+          f"ann {mem['ann']:.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Compare the legacy per-row cosine loop with the NumPy retrieval engine.
+
+Runs without Odoo:
+
+    python3 co_codex_assistant/benchmarks/bench_rag_retrieve.py --sizes 2000,20000,200000
+
+The legacy loop is timed on at most ``--legacy-cap`` rows and extrapolated
+linearly beyond that (it is O(n * dim) pure Python, 200k rows take minutes).
+With ``--nprobe`` the IVF index is trained too and its latency and recall@k
+against the exact search are reported. Random vectors have no cluster
+structure, so the recall shown is a worst case.
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from common import load_tools
+
+
+def legacy_cosine(a, b):
+    # Verbatim copy of the former CodexClient._cosine
+    if not a or not b:
+        return 0.0
+    s = 0.0
+    na = 0.0
+    nb = 0.0
+    ln = min(len(a), len(b))
+    for i in range(ln):
+        x = float(a[i])
+        y = float(b[i])
+        s += x * y
+        na += x * x
+        nb += y * y
+    if na <= 0 or nb <= 0:
+        return 0.0
+    return s / (math.sqrt(na) * math.sqrt(nb))
+
+
+def legacy_retrieve(query, rows, k):
+    scored = [(legacy_cosine(query, v), i) for i, v in rows]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [i for _s, i in scored[:k]]
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='2000,20000,200000')
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--legacy-cap', type=int, default=2000)
+    parser.add_argument('--nprobe', type=int, default=0, help='also benchmark the IVF index')
+    args = parser.parse_args()
+
+    tools = load_tools()
+    VectorMatrix = tools.vector_engine.VectorMatrix
+    rng = np.random.default_rng(42)
+    query = rng.standard_normal(args.dim).astype(np.float32)
+    query_list = query.tolist()
+
+    print(f"dim={args.dim} k={args.k}")
+    header = f"{'chunks':>8} {'legacy ms':>12} {'numpy ms':>10} {'speedup':>9} {'matrix MB':>10}"
+    if args.nprobe:
+        header += f" {'ivf ms':>8} {'recall@k':>9}"
+    print(header)
+    for n in (int(x) for x in args.sizes.split(',')):
+        data = rng.standard_normal((n, args.dim), dtype=np.float32)
+
+        legacy_n = min(n, args.legacy_cap)
+        legacy_rows = [(i, data[i].tolist()) for i in range(legacy_n)]
+        legacy = timed(lambda: legacy_retrieve(query_list, legacy_rows, args.k), 1) * n / legacy_n
+        del legacy_rows
+
+        matrix = VectorMatrix(np.arange(n), tools.vector_engine.normalize_rows(data))
+        engine = timed(lambda: matrix.search(query, args.k), args.repeat)
+
+        mark = '*' if legacy_n < n else ' '
+        line = (f"{n:>8} {legacy * 1000:>11.1f}{mark} {engine * 1000:>10.2f} "
+                f"{legacy / engine:>8.0f}x {matrix.nbytes / 2 ** 20:>10.1f}")
+        if args.nprobe:
+            matrix.ann = tools.ivf.IVFIndex.train(matrix.matrix)
+            ivf = timed(lambda: matrix.search(query, args.k, nprobe=args.nprobe), args.repeat)
+            exact = set(matrix.search(query, args.k)[0])
+            found = set(matrix.search(query, args.k, nprobe=args.nprobe)[0])
+            line += f" {ivf * 1000:>8.2f} {len(exact & found) / args.k:>9.2f}"
+        print(line)
+        del matrix, data
+    print('* extrapolated from --legacy-cap rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Provider routing benchmark: tail latency and errors with one degraded provider.
+
+Runs without Odoo or network access. Three local stand-in chat servers
+(``stub_server.py``) play the providers: a fast one having a bad day (a
+share of its calls is very slow, some fail with 503) and two healthy but
+slower ones. The same completions are sent:
+
+- ``single``: to the degraded provider alone, as with one configured provider
+- ``routed``: through ``tools.router.Router`` over the three, with failover
+- ``hedged``: the same, also hedging calls slower than the provider's p95
+
+    python3 co_codex_assistant/benchmarks/bench_router.py --calls 400 --concurrency 8
+    python3 co_codex_assistant/benchmarks/bench_router.py --error-ratio 1 --json
+
+p50/p95/p99 and max are wall times per completion, errors are the calls
+that failed on every provider tried, ``calls per provider`` counts upstream
+requests (hedges included).
+"""
+import argparse
+import json
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from common import load_tools
+from stub_server import serve
+
+
+def complete(session, url, counter, timeout):
+    # same request and error handling as codex_client._call_llm for a chat provider
+    counter[url] += 1
+    resp = session.post(f"{url}/chat/completions", timeout=timeout, json={
+        'model': 'stub', 'messages': [{'role': 'user', 'content': 'Summarize the ticket.'}]})
+    if resp.status_code != 200:
+        raise ValueError(f"HTTP error {resp.status_code}")
+    return resp.json()['choices'][0]['message']['content']
+
+
+def run(name, calls, concurrency, once):
+    walls, errors = [], 0
+
+    def timed(_i):
+        t0 = time.perf_counter()
+        try:
+            once()
+            return time.perf_counter() - t0, False
+        except Exception:
+            return time.perf_counter() - t0, True
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for wall, failed in pool.map(timed, range(calls)):
+            walls.append(wall)
+            errors += failed
+    p50, p95, p99 = np.percentile(np.array(walls) * 1000, [50, 95, 99])
+    return {'scenario': name, 'p50_ms': round(p50, 1), 'p95_ms': round(p95, 1), 'p99_ms': round(p99, 1),
+            'max_ms': round(max(walls) * 1000, 1), 'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=60, help='usual latency of the degraded provider')
+    parser.add_argument('--slow-ratio', type=float, default=0.1, help='share of its calls that are slow')
+    parser.add_argument('--slow-ms', type=float, default=2000)
+    parser.add_argument('--error-ratio', type=float, default=0.05, help='share of its calls answering 503')
+    parser.add_argument('--healthy-ms', default='90,150', help='latencies of the healthy providers')
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='show the router log (failovers, breakers)')
+    args = parser.parse_args()
+
+    tools = load_tools()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR, format='%(message)s')
+    servers = [serve(latency_ms=args.latency_ms, slow_ratio=args.slow_ratio, slow_ms=args.slow_ms,
+                     error_ratio=args.error_ratio)]
+    servers += [serve(latency_ms=float(ms)) for ms in args.healthy_ms.split(',')]
+    urls = [url for _server, url in servers]
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=4 * args.concurrency))
+    providers = [(url, tools.router.DEFAULT_WEIGHT, url) for url in urls]
+    results = []
+
+    try:
+        counter = Counter()
+        results.append(run('single', args.calls, args.concurrency,
+                           lambda: complete(session, urls[0], counter, args.timeout)))
+        results[-1]['calls_per_provider'] = [counter[url] for url in urls]
+        for name, hedge in (('routed', False), ('hedged', True)):
+            router, counter = tools.router.Router(), Counter()
+            results.append(run(name, args.calls, args.concurrency, lambda: router.call(
+                providers, lambda url: complete(session, url, counter, args.timeout), hedge=hedge)))
+            results[-1]['calls_per_provider'] = [counter[url] for url in urls]
+    finally:
+        for server, _url in servers:
+            server.shutdown()
+
+    if args.json:
+        print(json.dumps({'args': vars(args), 'results': results}, indent=2))
+        return
+    print(f"degraded    {args.latency_ms:.0f} ms, {args.slow_ratio:.0%} of calls {args.slow_ms:.0f} ms, "
+          f"{args.error_ratio:.0%} errors; healthy {args.healthy_ms} ms; "
+          f"{args.calls} calls, {args.concurrency} in flight")
+    for r in results:
+        print(f"{r['scenario']:<11} p50/p95/p99 {r['p50_ms']:.0f}/{r['p95_ms']:.0f}/{r['p99_ms']:.0f} ms, "
+              f"max {r['max_ms']:.0f} ms, {r['errors']} errors, calls per provider {r['calls_per_provider']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Helpers shared by the standalone Codex benchmarks (no Odoo, no network)."""
+import hashlib
+import importlib.util
+import os
+import re
+import sys
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TOPICS = {
+    'printer': 'printer toner paper jam tray driver spooler cartridge duplex scan',
+    'network': 'vpn router switch dns dhcp latency packet firewall wifi gateway',
+    'billing': 'invoice payment refund credit card subscription vat receipt overdue',
+    'mobile': 'phone screen battery imei charger sim warranty repair display camera',
+    'account': 'password login reset twofactor locked email username session token',
+    'erp': 'odoo module upgrade report stock picking warehouse journal partner',
+}
+FILLER = ('the customer reports that after the last update it stopped working and '
+          'they already tried restarting the device several times without success '
+          'please advise on next steps because the team is blocked').split()
+
+
+def load_tools():
+    """Import ``co_codex_assistant/tools`` without importing odoo."""
+    if 'codex_tools' in sys.modules:
+        return sys.modules['codex_tools']
+    path = os.path.join(os.path.dirname(HERE), 'tools')
+    spec = importlib.util.spec_from_file_location(
+        'codex_tools', os.path.join(path, '__init__.py'), submodule_search_locations=[path])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['codex_tools'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_sentence(rng, topic):
+    words = TOPICS[topic].split()
+    picked = list(rng.choice(words, 3)) + list(rng.choice(FILLER, int(rng.integers(6, 14))))
+    rng.shuffle(picked)
+    ref = f"#{int(rng.integers(10000, 99999))}"
+    return ' '.join([picked[0].capitalize()] + picked[1:] + [ref]) + '.'
+
+
+def make_ticket(rng, n_paragraphs=None):
+    """Return ``(html, sentences)`` of a synthetic helpdesk ticket."""
+    topic = rng.choice(list(TOPICS))
+    sentences, paragraphs = [], []
+    for _ in range(n_paragraphs or int(rng.integers(1, 7))):
+        para = [make_sentence(rng, topic) for _ in range(int(rng.integers(1, 6)))]
+        sentences.extend(para)
+        paragraphs.append('<p>' + ' '.join(para) + '</p>')
+    return ''.join(paragraphs), sentences
+
+
+def hash_embed(texts, dim=512):
+    """Deterministic bag-of-words/bigrams feature-hashing embedding."""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = re.findall(r'\w+', text.lower())
+        for feature in words + [a + ' ' + b for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+            out[row, h % dim] += 1.0 if (h >> 63) else -1.0
+    return out
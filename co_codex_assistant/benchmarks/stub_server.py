@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Local stand-in for an OpenAI-compatible embeddings and chat API (no network access).
+
+``POST /embeddings`` answers with the deterministic feature-hashing vectors
+of ``common.hash_embed``, ``POST /chat/completions`` with an echo of the
+last message, optionally after a fixed delay to mimic provider latency.
+``--slow-ratio``/``--slow-ms`` make a share of the calls much slower and
+``--error-ratio`` a share fail with 503, to mimic a degraded provider.
+Run it alone to point a test database at it (API base
+``http://127.0.0.1:<port>``, any key and model):
+
+    python3 co_codex_assistant/benchmarks/stub_server.py --port 8099 --latency-ms 40
+    python3 co_codex_assistant/benchmarks/stub_server.py --port 8098 --latency-ms 300 --slow-ratio 0.1 --slow-ms 8000
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import hash_embed
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    dim = 512
+    latency = 0.0
+    slow_ratio = 0.0
+    slow_latency = 0.0
+    error_ratio = 0.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        path = self.path.rstrip('/')
+        if not path.endswith(('/embeddings', '/chat/completions')):
+            return self._reply(404, {'error': {'message': 'only /embeddings and /chat/completions are served'}})
+        draw = random.random()
+        if draw < self.slow_ratio:
+            time.sleep(self.slow_latency)
+        elif self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.error_ratio:
+            return self._reply(503, {'error': {'message': 'stub overloaded'}})
+        if path.endswith('/chat/completions'):
+            return self._chat(body)
+        texts = body.get('input') or []
+        if isinstance(texts, str):
+            texts = [texts]
+        vectors = hash_embed(texts, self.dim)
+        self._reply(200, {
+            'object': 'list',
+            'model': body.get('model'),
+            'data': [{'object': 'embedding', 'index': i, 'embedding': v.tolist()} for i, v in enumerate(vectors)],
+            'usage': {'prompt_tokens': sum(len(t.split()) for t in texts)},
+        })
+
+    def _chat(self, body):
+        prompt = ((body.get('messages') or [{}])[-1].get('content') or '')
+        text = f"[{self.server.server_address[1]}] {prompt[:200]}"
+        self._reply(200, {
+            'object': 'chat.completion',
+            'model': body.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': len(prompt.split()), 'completion_tokens': len(text.split())},
+        })
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port=0, dim=512, latency_ms=0, slow_ratio=0.0, slow_ms=0, error_ratio=0.0):
+    """Start the server in a daemon thread; return ``(server, base_url)``."""
+    handler = type('Handler', (StubHandler,), {
+        'dim': dim,
+        'latency': latency_ms / 1000.0,
+        'slow_ratio': slow_ratio,
+        'slow_latency': slow_ms / 1000.0,
+        'error_ratio': error_ratio,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--slow-ratio', type=float, default=0, help='share of the calls taking --slow-ms')
+    parser.add_argument('--slow-ms', type=float, default=0)
+    parser.add_argument('--error-ratio', type=float, default=0, help='share of the calls answering 503')
+    args = parser.parse_args()
+    server, url = serve(args.port, args.dim, args.latency_ms, args.slow_ratio, args.slow_ms, args.error_ratio)
+    print(f"serving {url}/embeddings and {url}/chat/completions (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
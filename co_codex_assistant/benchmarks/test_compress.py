@@ -0,0 +1,62 @@
+"""Unit tests of tools/compress.py (no Odoo needed)."""
+from common import load_tools
+
+tools = load_tools()
+compress, estimate_tokens = tools.compress, tools.text.estimate_tokens
+
+LONG_LINE = ' '.join(f"word{n}" for n in range(200))
+
+
+def test_truncate_middle_fits():
+    assert compress.truncate_middle('a short text', 50) == 'a short text'
+
+
+def test_truncate_middle_single_long_line_keeps_both_ends():
+    out = compress.truncate_middle(LONG_LINE, 5)
+    head, marker, tail = out.split('\n')
+    assert marker == '[…]'
+    assert head.startswith('word0')
+    assert tail.endswith('word199')
+
+
+def test_truncate_middle_keeps_first_and_last_lines():
+    lines = ['Instructions: summarize.'] + [f"message line {n} " + 'x ' * 20 for n in range(50)] + ['Latest reply.']
+    out = compress.truncate_middle('\n'.join(lines), 60)
+    assert out.startswith('Instructions: summarize.')
+    assert out.endswith('Latest reply.')
+    assert '[…]' in out
+    assert estimate_tokens(out) <= 60 + 10
+
+
+def test_truncate_middle_long_first_and_last_lines():
+    out = compress.truncate_middle(LONG_LINE + '\nmiddle\n' + LONG_LINE, 30)
+    head, tail = out.split('\n[…]\n')
+    assert head.startswith('word0') and head.endswith('…')
+    assert tail.startswith('…') and tail.endswith('word199')
+    assert estimate_tokens(out) <= 30 + 5
+
+
+def test_take_within():
+    kept, skipped = compress.take_within(['a b c', 'd e f g h i j k', 'l'], 4)
+    # the second text does not fit, the third, smaller one still does
+    assert kept == ['a b c', 'l']
+    assert skipped == 8
+
+
+def test_take_within_zero_budget():
+    kept, skipped = compress.take_within(['a b', 'c'], 0)
+    assert kept == []
+    assert skipped == 3
+
+
+def test_compress_text_drops_quote_and_signature():
+    body = 'The VPN drops every hour.\n\nBest regards,\nAli\n\nOn Mon, Bob wrote:\n> old text'
+    assert compress.compress_text(body) == 'The VPN drops every hour.'
+
+
+def test_dedupe_lines():
+    repeated = 'This long line is repeated in every reply of the thread.'
+    first, second = compress.dedupe_lines([f"Hi\n{repeated}", f"Hi\n{repeated}\nNew content"])
+    assert first == f"Hi\n{repeated}"
+    # short lines are kept, long repeated ones dropped
+    assert second == 'Hi\nNew content'
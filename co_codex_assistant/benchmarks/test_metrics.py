@@ -0,0 +1,37 @@
+"""Unit tests of tools/metrics.py (no Odoo needed)."""
+from common import load_tools
+
+metrics = load_tools().metrics
+
+
+def test_latency_bucket_bounds():
+    assert metrics.latency_bucket(0) == 0
+    assert metrics.latency_bucket(25) == 0
+    assert metrics.latency_bucket(26) == 1
+    assert metrics.latency_bucket(10 ** 6) == len(metrics.LATENCY_BOUNDS_MS)
+
+
+def test_merge_histograms():
+    merged = metrics.merge_histograms([[1, 2], None, [0, 1, 3]])
+    assert merged[:3] == [1, 3, 3]
+    assert len(merged) == len(metrics.LATENCY_BOUNDS_MS) + 1
+
+
+def test_histogram_percentile():
+    hist = metrics.empty_histogram()
+    assert metrics.histogram_percentile(hist, 95) == 0.0
+    hist[1] = 10  # ten calls between 25 and 50 ms
+    assert metrics.histogram_percentile(hist, 50) == 37.5
+    assert metrics.histogram_percentile(hist, 100) == 50.0
+    slow = metrics.empty_histogram()
+    slow[-1] = 1
+    assert metrics.histogram_percentile(slow, 99) == float(metrics.LATENCY_BOUNDS_MS[-1])
+
+
+def test_meter():
+    meter = metrics.Meter()
+    meter.add(0.5, sent=10, received=20, endpoint='completions')
+    meter.add(0.25, retries=1)
+    assert meter.upstream == 0.75
+    assert (meter.bytes_sent, meter.bytes_received, meter.retries) == (10, 20, 1)
+    assert meter.endpoint == 'completions'
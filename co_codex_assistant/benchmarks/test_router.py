@@ -0,0 +1,124 @@
+"""Unit tests of tools/router.py (no Odoo needed)."""
+import random
+
+import pytest
+
+from common import load_tools
+
+router = load_tools().router
+
+
+class Clock:
+    """Stand-in for the ``time`` module of the router, moved by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(router, 'time', clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    r = router.Router()
+    for _ in range(router.BREAKER_FAILURES - 1):
+        r.record('a', 1.0, False)
+    assert r.snapshot('a')['state'] == 'closed'
+    r.record('a', 1.0, False)
+    assert r.snapshot('a')['state'] == 'open'
+
+
+def test_success_resets_the_failure_count(clock):
+    r = router.Router()
+    r.record('a', 1.0, False)
+    r.record('a', 1.0, False)
+    r.record('a', 1.0, True)
+    r.record('a', 1.0, False)
+    assert r.snapshot('a')['state'] == 'closed'
+
+
+def test_breaker_half_open_trial(clock):
+    r = router.Router()
+    for _ in range(router.BREAKER_FAILURES):
+        r.record('a', 1.0, False)
+    clock.now += router.BREAKER_COOLDOWN
+    assert r.snapshot('a')['state'] == 'half_open'
+    # the trial call keeps others away until its outcome is known
+    r.begin('a')
+    assert r.snapshot('a')['state'] == 'open'
+    r.record('a', 0.5, True)
+    assert r.snapshot('a')['state'] == 'closed'
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    r = router.Router()
+    for _ in range(router.BREAKER_FAILURES):
+        r.record('a', 1.0, False)
+    clock.now += router.BREAKER_COOLDOWN
+    r.begin('a')
+    r.record('a', 1.0, False)
+    assert r.snapshot('a')['state'] == 'open'
+    clock.now += router.BREAKER_COOLDOWN - 1
+    assert r.snapshot('a')['state'] == 'open'
+
+
+def test_order_puts_open_breakers_last(clock):
+    r = router.Router(rng=random.Random(0))
+    for _ in range(router.BREAKER_FAILURES):
+        r.record('a', 0.1, False)
+    for _ in range(20):
+        assert r.order({'a': 1000, 'b': 1, 'c': 1})[-1] == 'a'
+
+
+def test_order_prefers_fast_providers():
+    r = router.Router(rng=random.Random(0))
+    for _ in range(10):
+        r.record('fast', 0.1, True)
+        r.record('slow', 2.0, True)
+    firsts = [r.order({'fast': 10, 'slow': 10})[0] for _ in range(200)]
+    assert firsts.count('fast') > 150
+
+
+def test_hedge_delay():
+    r = router.Router()
+    for _ in range(router.HEDGE_MIN_SAMPLES - 1):
+        r.record('a', 2.0, True)
+    assert r.hedge_delay('a') is None
+    r.record('a', 2.0, True)
+    assert r.hedge_delay('a') == 2.0
+    fast = router.Router()
+    for _ in range(router.HEDGE_MIN_SAMPLES):
+        fast.record('b', 0.01, True)
+    assert fast.hedge_delay('b') == router.HEDGE_MIN_DELAY
+
+
+def test_call_fails_over_and_reports_the_provider():
+    r = router.Router()
+
+    def call(provider):
+        if provider == 'down':
+            raise ValueError('unavailable')
+        return provider.upper()
+
+    # the weights make 'a' the first provider tried
+    assert r.call([('a', 10 ** 6, 'down'), ('b', 10 ** -6, 'up')], call) == ('b', 'UP')
+    assert r.snapshot('a')['error_rate'] > 0
+    assert r.snapshot('b')['calls'] == 1
+
+
+def test_call_raises_the_last_error():
+    r = router.Router()
+
+    def call(provider):
+        raise ValueError(provider)
+
+    with pytest.raises(ValueError):
+        r.call([('a', 10, 'a'), ('b', 10, 'b')], call)
+    with pytest.raises(ValueError, match='only'):
+        r.call([('a', 10, 'only')], call)
@@ -0,0 +1,50 @@
+"""Unit tests of tools/text.py (no Odoo needed): python3 -m pytest co_codex_assistant/benchmarks"""
+from common import load_tools
+
+text = load_tools().text
+
+
+def test_estimate_tokens():
+    assert text.estimate_tokens('') == 0
+    assert text.estimate_tokens(None) == 0
+    assert text.estimate_tokens('hello') == 1
+    # one token per 3 digits, one per punctuation mark
+    assert text.estimate_tokens('123456789') == 3
+    assert text.estimate_tokens('a, b.') == 4
+
+
+def test_truncate_tokens():
+    assert text.truncate_tokens('short text', 10) == 'short text'
+    cut = text.truncate_tokens('one two three four five six', 3)
+    assert cut == 'one two three …'
+    # the first word is always kept
+    assert text.truncate_tokens('first second', 0) == 'first …'
+
+
+def test_chunk_text_budget_and_coverage():
+    sentences = [f"Sentence number {n} talks about the printer tray." for n in range(60)]
+    source = ' '.join(sentences[:30]) + '\n\n' + ' '.join(sentences[30:])
+    chunks = text.chunk_text(source, max_tokens=40, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert all(text.estimate_tokens(chunk) <= 40 * 1.25 for chunk in chunks)
+    joined = ' '.join(chunks)
+    assert all(sentence in joined for sentence in sentences)
+
+
+def test_chunk_text_splits_long_sentence():
+    sentence = ' '.join(['word'] * 100)
+    chunks = text.chunk_text(sentence, max_tokens=16, overlap_tokens=0)
+    assert all(text.estimate_tokens(chunk) <= 16 for chunk in chunks)
+    assert sum(len(chunk.split()) for chunk in chunks) == 100
+
+
+def test_chunk_text_empty():
+    assert text.chunk_text('') == []
+    assert text.chunk_text(None) == []
+
+
+def test_query_terms_digits_first():
+    terms = text.query_terms('The printer shows error E1234 on ticket 98765 and the printer jams')
+    assert set(terms[:2]) == {'98765', 'e1234'}
+    assert 'the' not in terms
+    assert terms.count('printer') == 1
@@ -0,0 +1,105 @@
+"""Unit tests of tools/vector_engine.py and tools/ivf.py (no Odoo needed)."""
+import numpy as np
+
+from common import load_tools
+
+tools = load_tools()
+vector_engine, ivf = tools.vector_engine, tools.ivf
+
+
+def test_top_k():
+    scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+    assert vector_engine.top_k(scores, 2).tolist() == [1, 3]
+    assert vector_engine.top_k(scores, 10).tolist() == [1, 3, 2, 0]
+    assert vector_engine.top_k(scores, 0).tolist() == []
+
+
+def test_rrf_fuse_ordering():
+    ids, scores = vector_engine.rrf_fuse([[1, 2, 3], [3, 1, 4]], k=4)
+    # found by both rankings beats found by one; a better rank beats a worse one
+    assert ids == [1, 3, 2, 4]
+    assert scores == sorted(scores, reverse=True)
+    assert scores[0] == 1 / 61 + 1 / 62
+
+
+def test_rrf_fuse_limit_and_empty():
+    assert vector_engine.rrf_fuse([[5, 6, 7]], k=2)[0] == [5, 6]
+    assert vector_engine.rrf_fuse([], k=3) == ([], [])
+
+
+def test_merge_results():
+    ids, scores = vector_engine.merge_results([([1, 2], [0.9, 0.3]), ([3], [0.5])], k=2)
+    assert ids == [1, 3]
+    assert scores == [0.9, 0.5]
+
+
+def _matrix(n=40, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    matrix, skipped = vector_engine.VectorMatrix.from_rows([(100 + i, v.tolist()) for i, v in enumerate(vectors)])
+    assert skipped == 0
+    return matrix, vectors
+
+
+def test_search_finds_itself():
+    matrix, vectors = _matrix()
+    ids, scores = matrix.search(vectors[7], 3)
+    assert ids[0] == 107
+    assert abs(scores[0] - 1.0) < 1e-5
+
+
+def test_from_rows_skips_other_dimensions():
+    matrix, skipped = vector_engine.VectorMatrix.from_rows([(1, [1.0, 0.0]), (2, [0.0, 1.0]), (3, [1.0, 0.0, 0.0])])
+    assert skipped == 1
+    assert matrix.ids.tolist() == [1, 2]
+
+
+def test_search_rows_small_subset_and_mask():
+    matrix, vectors = _matrix()
+    # a small subset is scored alone, a large one applied as a mask: both only return allowed rows
+    for rows in ([3, 5, 9], list(range(0, 40, 2))):
+        ids, _scores = matrix.search(vectors[7], 5, rows=rows)
+        assert ids and set(ids) <= {100 + r for r in rows}
+        assert 107 not in ids
+
+
+def test_search_skips_dead_rows():
+    matrix, vectors = _matrix()
+    ids = matrix.ids.copy()
+    ids[7] = -1
+    dead = vector_engine.VectorMatrix(ids, matrix.matrix)
+    assert 107 not in dead.search(vectors[7], 5)[0]
+    assert -1 not in dead.search(vectors[7], 40)[0]
+
+
+def test_search_bad_query():
+    matrix, _vectors = _matrix()
+    assert matrix.search([0.0] * 8, 3) == ([], [])
+    assert matrix.search([1.0] * 5, 3) == ([], [])
+
+
+def test_ivf_candidates():
+    rng = np.random.default_rng(1)
+    centers = vector_engine.normalize_rows(rng.standard_normal((4, 16)).astype(np.float32))
+    data = np.repeat(centers, 50, axis=0) + 0.01 * rng.standard_normal((200, 16)).astype(np.float32)
+    data = vector_engine.normalize_rows(data.astype(np.float32))
+    index = ivf.IVFIndex.train(data, nlist=4)
+    assert len(index) == 200
+    # every probe gives every row; one probe gives the query's cluster, not the whole matrix
+    assert index.candidates(data[0], 4).tolist() == list(range(200))
+    candidates = index.candidates(data[0], 1).tolist()
+    assert set(range(50)) <= set(candidates)
+    assert len(candidates) < 200
+    assert candidates == sorted(candidates)
+
+
+def test_ivf_extend_and_ann_search():
+    rng = np.random.default_rng(2)
+    data = vector_engine.normalize_rows(rng.standard_normal((300, 8)).astype(np.float32))
+    index = ivf.IVFIndex.train(data[:250], nlist=8)
+    index.extend(data)
+    assert len(index) == 300
+    matrix = vector_engine.VectorMatrix(np.arange(300), data, ann=index)
+    ids, _scores = matrix.search(data[280], 1, nprobe=8)
+    assert ids == [280]
+    assert index.remap([0, 280]).labels.tolist() == [index.labels[0], index.labels[280]]
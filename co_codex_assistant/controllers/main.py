@@ -1,5 +1,99 @@
-from odoo import http
+import json
+import logging
+
+from odoo import api, http
+from odoo.http import request, Response
+from odoo.modules.registry import Registry
+
+from ..models.codex_client import _route_stream
+from ..models.codex_metric import record_metric
+from ..tools.metrics import Meter
+from ..tools.text import estimate_tokens
+
+_logger = logging.getLogger(__name__)
+
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 
 class CodexController(http.Controller):
-    # Reserved for future streaming endpoints if needed
-    pass
+
+    @http.route('/codex/generate/stream', type='http', auth='user', methods=['POST'])
+    def generate_stream(self, wizard_id, **kwargs):
+        """Stream a wizard generation as server-sent events.
+
+        Events: ``delta`` (``{"text": ...}``) per piece of text, ``error``
+        (``{"message": ...}``) and a final ``done`` with the token usage.
+        Settings and the response cache are resolved here; the provider is
+        called while the response body is sent, after this request's
+        transaction has ended, so the result is saved on a new cursor.
+        """
+        wizard = request.env['codex.generate.wizard'].browse(int(wizard_id)).exists()
+        if not wizard:
+            return request.not_found()
+        plan = request.env['codex.client']._prepare_stream(wizard._build_messages(), purpose=wizard.purpose)
+        env = request.env
+        body = self._stream_events(env.cr.dbname, env.uid, dict(env.context), wizard.id, plan)
+        return Response(body, mimetype='text/event-stream', direct_passthrough=True, headers=[
+            ('Cache-Control', 'no-cache'),
+            ('X-Accel-Buffering', 'no'),
+        ])
+
+    @staticmethod
+    def _stream_events(dbname, uid, context, wizard_id, plan):
+        parts, usage, provider, error = [], {}, {}, None
+        hit = plan['hit']
+        meter = Meter()
+        try:
+            if hit:
+                parts.append(hit['text'])
+                yield _event('delta', {'text': hit['text']})
+            else:
+                for kind, value in _route_stream(plan['request'], plan['messages'], meter):
+                    if kind == 'delta':
+                        parts.append(value)
+                        yield _event('delta', {'text': value})
+                    elif kind == 'provider':
+                        provider = value
+                    else:
+                        usage = value
+        except Exception as e:
+            _logger.exception('Codex stream failed')
+            error = str(e)
+            yield _event('error', {'message': error})
+
+        text = ''.join(parts)
+        if hit:
+            out = dict(hit, saved_tokens=plan['saved_tokens'])
+        else:
+            # usage is only reported by providers supporting it; estimate otherwise
+            out = {
+                'text': text,
+                'input_tokens': usage.get('prompt_tokens') or usage.get('input_tokens')
+                or sum(estimate_tokens(m['content']) for m in plan['messages']),
+                'output_tokens': usage.get('completion_tokens') or usage.get('output_tokens')
+                or estimate_tokens(text),
+                'cached': False,
+                'saved_tokens': plan['saved_tokens'],
+                'model': provider.get('model') or plan['request']['model'],
+            }
+        record_metric(dbname, 'generate', meter, uid, purpose=plan['purpose'],
+                      model=out.get('model') or plan['request']['model'],
+                      error=bool(error), cached=bool(hit), input_tokens=out['input_tokens'],
+                      output_tokens=out['output_tokens'])
+        if text or not error:
+            try:
+                with Registry(dbname).cursor() as cr:
+                    env = api.Environment(cr, uid, context)
+                    env['codex.generate.wizard'].browse(wizard_id)._record_result(out)
+                    # the key is the primary provider's: another one's answer is not cached under it
+                    if plan['cache_key'] and not hit and not error and provider.get('key') == plan['request']['key']:
+                        env['codex.response.cache'].sudo()._store(plan['cache_key'], out['model'], out)
+            except Exception:
+                _logger.exception('Could not save the streamed Codex result')
+        yield _event('done', {
+            'input_tokens': out['input_tokens'],
+            'output_tokens': out['output_tokens'],
+            'cached': bool(out.get('cached')),
+        })
@@ -0,0 +1,9 @@
+from odoo import SUPERUSER_ID, api
+
+
+def migrate(cr, version):
+    """Store the partner and date of their source records on the chunks indexed before 17.0.2.1.0."""
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['codex.client']._rag_backfill_meta()
@@ -1,5 +1,15 @@
 from . import res_config_settings
+from . import codex_config
 from . import codex_history
 from . import codex_client
+from . import codex_provider
+from . import codex_context
+from . import codex_index
 from . import codex_document
+from . import codex_indexer_state
+from . import codex_embedding_cache
+from . import codex_response_cache
+from . import codex_batch
+from . import codex_job
+from . import codex_metric
 from . import helpdesk_ticket
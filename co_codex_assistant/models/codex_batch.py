@@ -0,0 +1,108 @@
+from odoo import api, fields, models, _
+
+
+class CodexBatch(models.Model):
+    """A batch generation: one background job per ticket, and its report.
+
+    Batch jobs run in their own lane of the job queue (see
+    ``codex.job._claim``): they are claimed after the interactive jobs,
+    within ``job_batch_concurrency``, and do not count against the
+    per-user limit. The figures are computed from the jobs and their
+    history rows, so they follow the batch while it runs.
+    """
+    _name = 'codex.batch'
+    _description = 'Codex Batch Generation Run'
+    _order = 'id desc'
+
+    name = fields.Char(required=True, readonly=True)
+    user_id = fields.Many2one('res.users', string='User', required=True, index=True, readonly=True,
+                              default=lambda self: self.env.user)
+    purpose = fields.Selection([
+        ('reply', 'Reply Draft'),
+        ('summary', 'Summary'),
+        ('report', 'Report'),
+    ], readonly=True)
+    prepare_seconds = fields.Float('Preparation (s)', readonly=True, help='Time spent building the contexts.')
+    saved_tokens = fields.Integer(readonly=True, help='Tokens saved while building the contexts.')
+    job_ids = fields.One2many('codex.job', 'batch_id', string='Jobs', readonly=True)
+    state = fields.Selection([
+        ('running', 'Running'),
+        ('done', 'Done'),
+    ], compute='_compute_stats')
+    job_count = fields.Integer('Tickets', compute='_compute_stats')
+    pending_count = fields.Integer('Pending', compute='_compute_stats')
+    done_count = fields.Integer('Done', compute='_compute_stats')
+    failed_count = fields.Integer('Failed', compute='_compute_stats')
+    cached_count = fields.Integer('Cached', compute='_compute_stats')
+    input_tokens = fields.Integer(compute='_compute_stats')
+    output_tokens = fields.Integer(compute='_compute_stats')
+    elapsed_seconds = fields.Float('Elapsed (s)', compute='_compute_stats',
+                                   help='From the submission to the last finished job, or to now while running.')
+    report = fields.Text(compute='_compute_stats')
+
+    @api.depends('job_ids.state')
+    def _compute_stats(self):
+        stats = {}
+        if self.ids:
+            self.env['codex.job'].flush_model(['batch_id', 'state', 'history_id', 'date_done'])
+            self.env.cr.execute("""
+                SELECT j.batch_id,
+                       count(*),
+                       count(*) FILTER (WHERE j.state IN ('queued', 'running')),
+                       count(*) FILTER (WHERE j.state = 'done'),
+                       count(*) FILTER (WHERE j.state = 'failed'),
+                       count(*) FILTER (WHERE h.cached),
+                       coalesce(sum(h.input_tokens), 0),
+                       coalesce(sum(h.output_tokens), 0),
+                       max(j.date_done)
+                FROM codex_job j
+                LEFT JOIN codex_history h ON h.id = j.history_id
+                WHERE j.batch_id IN %s
+                GROUP BY j.batch_id
+            """, (tuple(self.ids),))
+            stats = {row[0]: row[1:] for row in self.env.cr.fetchall()}
+        now = fields.Datetime.now()
+        for batch in self:
+            total, pending, done, failed, cached, tokens_in, tokens_out, last_done = \
+                stats.get(batch.id, (0, 0, 0, 0, 0, 0, 0, None))
+            end = last_done if not pending and last_done else now
+            elapsed = max((end - batch.create_date).total_seconds(), 0.0) if batch.create_date else 0.0
+            batch.update({
+                'state': 'running' if pending else 'done',
+                'job_count': total,
+                'pending_count': pending,
+                'done_count': done,
+                'failed_count': failed,
+                'cached_count': cached,
+                'input_tokens': tokens_in,
+                'output_tokens': tokens_out,
+                'elapsed_seconds': elapsed,
+            })
+            batch.report = batch._report()
+
+    def _report(self):
+        self.ensure_one()
+        lines = [
+            _('%(done)s of %(total)s tickets generated, %(failed)s failed, %(pending)s pending, '
+              'in %(seconds).1f s (%(rate).2f tickets/s).',
+              done=self.done_count, total=self.job_count, failed=self.failed_count, pending=self.pending_count,
+              seconds=self.elapsed_seconds,
+              rate=self.done_count / self.elapsed_seconds if self.elapsed_seconds else 0.0),
+            _('Context preparation: %(seconds).2f s.', seconds=self.prepare_seconds),
+            _('Tokens: %(input)s input, %(output)s output, %(saved)s saved by compression; '
+              '%(cached)s answers from the response cache.',
+              input=self.input_tokens, output=self.output_tokens, saved=self.saved_tokens,
+              cached=self.cached_count),
+        ]
+        failed = self.job_ids.filtered(lambda j: j.state == 'failed')
+        if failed:
+            lines.append(_('%s failed:', len(failed)))
+            lines.extend(f"- {job.ticket_id.display_name or job.name}: {job.error}" for job in failed)
+        return '\n'.join(lines)
+
+    def action_open_jobs(self):
+        self.ensure_one()
+        action = self.env['ir.actions.act_window']._for_xml_id('co_codex_assistant.action_codex_job')
+        action['domain'] = [('batch_id', '=', self.id)]
+        action['context'] = {}
+        return action
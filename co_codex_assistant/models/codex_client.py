@@ -1,69 +1,248 @@
+import email.utils
+import hashlib
 import json
 import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from odoo import api, models, _
+from odoo.tools import SQL
+
+from ..tools.compress import take_within, truncate_middle
+from ..tools.metrics import Meter
+from ..tools.router import DEFAULT_WEIGHT, Router
+from ..tools.text import chunk_text, estimate_tokens, html_to_text
+from ..tools.vector_engine import merge_results, rrf_fuse
+from .codex_metric import record_metric
 
 _logger = logging.getLogger(__name__)
 
-class CodexClient(models.AbstractModel):
-    _name = 'codex.client'
-    _description = 'Codex HTTP Client'
+# Per-worker cache of mapped embedding stores: (dbname, codex.index id) -> (generation, VectorMatrix)
+_MATRIX_CACHE = {}
+_MATRIX_LOCK = threading.Lock()
+# Per-worker cache of retrieval results: key -> (expires_at, ids, scores), see _result_key()
+_RESULT_CACHE = OrderedDict()
+_RESULT_CACHE_SIZE = 512
+_RESULT_LOCK = threading.Lock()
 
-    def _get_conf(self):
-        ICP = self.env['ir.config_parameter'].sudo()
-        return {
-            'api_base': ICP.get_param('co_codex_assistant.api_base', ''),
-            'api_model': ICP.get_param('co_codex_assistant.api_model', ''),
-            'api_key': ICP.get_param('co_codex_assistant.api_key', ''),
-            'temperature': float(ICP.get_param('co_codex_assistant.temperature', '0.3')),
-            'max_tokens': int(ICP.get_param('co_codex_assistant.max_tokens', '512')),
-            'timeout': int(ICP.get_param('co_codex_assistant.timeout', '60')),
-        }
+# Upstream statuses worth retrying (rate limited or temporarily unavailable)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Statuses retried for requests that must not run twice (completions): the provider did no work
+NOT_PROCESSED_STATUSES = (429,)
+# Never sleep longer than this between two attempts, whatever Retry-After says
+MAX_RETRY_DELAY = 60.0
+# chat/completions answers meaning "this provider has no such endpoint"
+CHAT_UNSUPPORTED_STATUSES = (404, 405, 501)
+# How long the endpoint style that worked for an API base is trusted before probing again
+ENDPOINT_MEMO_TTL = 6 * 3600
+# Advisory lock held by a running indexer (an arbitrary constant)
+INDEXER_LOCK = 0x636F6478
+# Hybrid retrieval: each ranking fed to the fusion is this many times deeper than the result
+RRF_DEPTH = 4
 
-    def generate(self, messages, **kwargs):
-        """Call the configured LLM provider.
+# Pooled keep-alive HTTP session of this process, see _session()
+_SESSION = {'pid': None, 'session': None}
+_SESSION_LOCK = threading.Lock()
+# api_base -> (endpoint style 'chat' or 'responses', expiry timestamp)
+_ENDPOINT_STYLE = {}
+# Latency, errors and circuit breakers of the LLM providers, as seen by this process
+ROUTER = Router()
 
-        messages: list of dicts like [{'role': 'system'|'user'|'assistant', 'content': '...'}]
-        Returns: dict with keys: text, input_tokens, output_tokens, raw
-        """
-        conf = self._get_conf()
-        api_base = conf['api_base'].rstrip('/')
-        api_key = conf['api_key']
-        model = conf['api_model']
-        temperature = kwargs.get('temperature', conf['temperature'])
-        max_tokens = kwargs.get('max_tokens', conf['max_tokens'])
-        timeout = kwargs.get('timeout', conf['timeout'])
 
-        if not api_base or not api_key or not model:
-            raise ValueError(_('Codex Assistant is not configured (API base/model/key). Please configure in Settings > General Settings > Codex.'))
+def _session():
+    """Return this process's pooled ``requests.Session``.
 
-        # Two common patterns are supported automatically:
-        # 1) OpenAI-compatible /v1/chat/completions
-        # 2) OpenAI "responses" API emulation when providers proxy it under /v1/responses
-        # We try chat/completions first, then fallback to responses.
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json',
-        }
-        payload_chat = {
-            'model': model,
-            'messages': messages,
-            'temperature': temperature,
-            'max_tokens': max_tokens,
-        }
-        payload_responses = {
-            'model': model,
-            'input': messages,
-            'temperature': temperature,
-            'max_output_tokens': max_tokens,
-        }
+    Connections (TCP + TLS) are kept alive and reused between calls. A new
+    session is created after a fork, so prefork workers never share sockets.
+    """
+    pid = os.getpid()
+    with _SESSION_LOCK:
+        if _SESSION['pid'] != pid:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _SESSION.update(pid=pid, session=session)
+        return _SESSION['session']
 
-        import requests
 
-        # Try chat/completions
+def _result_key(*parts):
+    """Retrieval cache key; ``parts`` include the store generations, so any index change misses."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _result_get(key):
+    with _RESULT_LOCK:
+        entry = _RESULT_CACHE.get(key)
+        if entry and entry[0] > time.time():
+            _RESULT_CACHE.move_to_end(key)
+            return entry[1], entry[2]
+        _RESULT_CACHE.pop(key, None)
+        return None
+
+
+def _result_put(key, ttl, ids, scores):
+    with _RESULT_LOCK:
+        _RESULT_CACHE[key] = (time.time() + ttl, list(ids), [float(s) for s in scores])
+        _RESULT_CACHE.move_to_end(key)
+        while len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+            _RESULT_CACHE.popitem(last=False)
+
+
+def _router_key(api_base, model):
+    return f"{api_base} {model}"
+
+
+def _endpoint_style(api_base):
+    style, expires = _ENDPOINT_STYLE.get(api_base, (None, 0))
+    return style if expires > time.time() else None
+
+
+def _remember_endpoint_style(api_base, style):
+    if _endpoint_style(api_base) != style:
+        _logger.info('Codex: using %s endpoint for %s', style, api_base)
+    _ENDPOINT_STYLE[api_base] = (style, time.time() + ENDPOINT_MEMO_TTL)
+
+
+def _retry_delay(resp, attempt):
+    """Seconds to wait before retry ``attempt``: Retry-After when given, else exponential backoff."""
+    value = resp.headers.get('Retry-After') if resp is not None else None
+    if value:
+        try:
+            return min(max(float(value), 0.0), MAX_RETRY_DELAY)
+        except ValueError:
+            try:
+                when = email.utils.parsedate_to_datetime(value)
+                return min(max(when.timestamp() - time.time(), 0.0), MAX_RETRY_DELAY)
+            except (TypeError, ValueError):
+                pass
+    return min(2 ** attempt + random.random(), MAX_RETRY_DELAY)
+
+
+def _not_sent(error):
+    """Whether a requests connection error happened before anything reached the server."""
+    import requests
+    from urllib3.exceptions import NewConnectionError
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _post_json(url, headers, payload, timeout, max_retries=3, meter=None, idempotent=True, deadline=None):
+    """POST ``payload``, retrying throttled/unavailable responses and connection errors.
+
+    Requests that are not ``idempotent`` (completions, billed even when the
+    answer is lost) are only retried when the provider did not process
+    them: a 429 answer, or a connection that failed before the request
+    was sent; timeouts and 5xx answers are returned or raised at once.
+    When a ``deadline`` (monotonic) is given, no attempt or backoff goes
+    past it. Does not touch the ORM, so it is safe to call from worker
+    threads. The time, bytes and retries of all attempts are added to
+    ``meter``, if given.
+    """
+    import requests
+    session = _session()
+    retry_statuses = RETRY_STATUSES if idempotent else NOT_PROCESSED_STATUSES
+    for attempt in range(max_retries + 1):
+        t0 = time.monotonic()
+        if deadline is not None:
+            if deadline - t0 <= 0:
+                raise requests.Timeout(_('No time left to call %s.') % url)
+            timeout = min(timeout, deadline - t0)
         try:
-            url = f"{api_base}/chat/completions" if not api_base.endswith('/v1') else f"{api_base}/chat/completions"
-            resp = requests.post(url, headers=headers, json=payload_chat, timeout=timeout)
+            resp = session.post(url, headers=headers, json=payload, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if meter:
+                meter.add(time.monotonic() - t0, retries=int(attempt > 0))
+            if attempt >= max_retries or not (idempotent or _not_sent(e)):
+                raise
+            delay = _retry_delay(None, attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            _logger.info('Codex: %s unreachable, retrying in %.1fs', url, delay)
+        else:
+            if meter:
+                meter.add(time.monotonic() - t0, sent=len(resp.request.body or b''), received=len(resp.content),
+                          retries=int(attempt > 0), endpoint=url.rsplit('/', 1)[-1])
+            if resp.status_code not in retry_statuses or attempt >= max_retries:
+                return resp
+            delay = _retry_delay(resp, attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                return resp
+            _logger.info('Codex: %s answered %s, retrying in %.1fs', url, resp.status_code, delay)
+        time.sleep(delay)
+
+
+def _fetch_embeddings(request, texts, meter=None):
+    """Embed ``texts`` using a request prepared by ``codex.client._embed_request``."""
+    payload = {'model': request['model'], 'input': texts}
+    r = _post_json(request['url'], request['headers'], payload, request['timeout'], request['max_retries'], meter)
+    if r.status_code != 200:
+        raise ValueError(_('Embeddings HTTP error %s: %s') % (r.status_code, r.text))
+    data = r.json()
+    items = sorted(data.get('data', []), key=lambda d: d.get('index', 0))
+    vecs = [d.get('embedding') for d in items]
+    if len(vecs) != len(texts):
+        raise ValueError(_('Embeddings endpoint returned %s vectors for %s inputs.') % (len(vecs), len(texts)))
+    return vecs
+
+
+def _call_llm(request, messages, meter=None):
+    """Run one completion using a request prepared by ``codex.client._generate_request``.
+
+    Does not touch the ORM, so it is safe to call from worker threads.
+    """
+    api_base = request['api_base']
+    headers = request['headers']
+    model = request['model']
+    temperature = request['temperature']
+    max_tokens = request['max_tokens']
+    timeout = request['timeout']
+    max_retries = request.get('max_retries', 0)
+    # a completion may be billed even when its answer is lost: it is not
+    # retried once sent, and all attempts together last at most ``timeout``
+    deadline = time.monotonic() + timeout
+
+    # Two common patterns are supported automatically:
+    # 1) OpenAI-compatible /v1/chat/completions
+    # 2) OpenAI "responses" API emulation when providers proxy it under /v1/responses
+    # We try chat/completions first, then fallback to responses. Once an API base
+    # is known to lack chat/completions, it goes straight to responses.
+    payload_chat = {
+        'model': model,
+        'messages': messages,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+    }
+    payload_responses = {
+        'model': model,
+        'input': messages,
+        'temperature': temperature,
+        'max_output_tokens': max_tokens,
+    }
+
+    # once chat/completions is known to work, its failures are not sent again to
+    # /responses: the provider may already have processed (and billed) the completion
+    style = _endpoint_style(api_base)
+    chat_unsupported = False
+    if style != 'responses':
+        url = f"{api_base}/chat/completions"
+        try:
+            resp = _post_json(url, headers, payload_chat, timeout, max_retries, meter,
+                              idempotent=False, deadline=deadline)
+        except Exception as e:
+            if style == 'chat':
+                raise
+            _logger.exception('Error calling chat/completions: %s', e)
+        else:
             if resp.status_code == 200:
+                _remember_endpoint_style(api_base, 'chat')
                 data = resp.json()
                 text = data.get('choices', [{}])[0].get('message', {}).get('content', '')
                 usage = data.get('usage', {})
@@ -73,133 +252,835 @@ class CodexClient(models.AbstractModel):
                     'output_tokens': usage.get('completion_tokens'),
                     'raw': data,
                 }
+            chat_unsupported = resp.status_code in CHAT_UNSUPPORTED_STATUSES
             _logger.warning('chat/completions failed (%s): %s', resp.status_code, resp.text[:500])
+            if style == 'chat' and not chat_unsupported:
+                raise ValueError(_('Codex HTTP error %s: %s') % (resp.status_code, resp.text))
+
+    # Fallback to /responses
+    url2 = f"{api_base}/responses"
+    resp2 = _post_json(url2, headers, payload_responses, timeout, max_retries, meter,
+                       idempotent=False, deadline=deadline)
+    if resp2.status_code != 200:
+        raise ValueError(_('Codex HTTP error %s: %s') % (resp2.status_code, resp2.text))
+    if chat_unsupported:
+        _remember_endpoint_style(api_base, 'responses')
+    data = resp2.json()
+    # Try to normalize different provider formats
+    text = ''
+    usage = {}
+    # OpenAI "responses" style
+    if 'output_text' in data:
+        text = data['output_text']
+    elif 'content' in data and isinstance(data['content'], list) and data['content']:
+        # Sometimes providers return [{"type":"output_text","text":"..."}]
+        for part in data['content']:
+            if isinstance(part, dict) and part.get('type') in ('output_text', 'message') and part.get('text'):
+                text += part.get('text', '')
+    elif 'choices' in data:
+        text = data.get('choices', [{}])[0].get('message', {}).get('content', '')
+    usage = data.get('usage', usage)
+    return {
+        'text': text,
+        'input_tokens': usage.get('prompt_tokens') or usage.get('input_tokens'),
+        'output_tokens': usage.get('completion_tokens') or usage.get('output_tokens'),
+        'raw': data,
+    }
+
+
+def _sse_data(resp):
+    """Yield the ``data:`` payloads of a server-sent-events HTTP response."""
+    for line in resp.iter_lines(decode_unicode=True):
+        if line and line.startswith('data:'):
+            yield line[5:].strip()
+
+
+def _stream_llm(request, messages, meter=None):
+    """Stream one completion: yield ``('delta', text)`` pieces, then ``('usage', dict)``.
+
+    Same endpoint selection as ``_call_llm``, using the providers' SSE
+    streaming mode. Does not touch the ORM. The time from each request to
+    the end of its stream is added to ``meter``, if given.
+    """
+    api_base = request['api_base']
+    headers = request['headers']
+    timeout = request['timeout']
+    session = _session()
+    meter = meter or Meter()
+    style = _endpoint_style(api_base)
+    chat_unsupported = False
+    if style != 'responses':
+        payload = {
+            'model': request['model'],
+            'messages': messages,
+            'temperature': request['temperature'],
+            'max_tokens': request['max_tokens'],
+            'stream': True,
+            'stream_options': {'include_usage': True},
+        }
+        url = f"{api_base}/chat/completions"
+        t0 = time.monotonic()
+        resp = session.post(url, headers=headers, json=payload, timeout=timeout, stream=True)
+        if resp.status_code == 400:
+            # some gateways reject stream_options; usage is then estimated
+            resp.close()
+            del payload['stream_options']
+            meter.add(time.monotonic() - t0, sent=len(resp.request.body or b''), retries=1)
+            t0 = time.monotonic()
+            resp = session.post(url, headers=headers, json=payload, timeout=timeout, stream=True)
+        if resp.status_code == 200:
+            _remember_endpoint_style(api_base, 'chat')
+            usage = {}
+            received = 0
+            with resp:
+                for data in _sse_data(resp):
+                    received += len(data)
+                    if data == '[DONE]':
+                        break
+                    chunk = json.loads(data)
+                    for choice in chunk.get('choices') or []:
+                        piece = (choice.get('delta') or {}).get('content')
+                        if piece:
+                            yield 'delta', piece
+                    usage = chunk.get('usage') or usage
+            meter.add(time.monotonic() - t0, sent=len(resp.request.body or b''), received=received,
+                      endpoint='completions')
+            yield 'usage', usage
+            return
+        chat_unsupported = resp.status_code in CHAT_UNSUPPORTED_STATUSES
+        _logger.warning('chat/completions stream failed (%s): %s', resp.status_code, resp.text[:500])
+        resp.close()
+        if style == 'chat' and not chat_unsupported:
+            meter.add(time.monotonic() - t0, sent=len(resp.request.body or b''), received=len(resp.content))
+            raise ValueError(_('Codex HTTP error %s: %s') % (resp.status_code, resp.text))
+        meter.add(time.monotonic() - t0, sent=len(resp.request.body or b''), retries=1)
+
+    payload = {
+        'model': request['model'],
+        'input': messages,
+        'temperature': request['temperature'],
+        'max_output_tokens': request['max_tokens'],
+        'stream': True,
+    }
+    t0 = time.monotonic()
+    resp = session.post(f"{api_base}/responses", headers=headers, json=payload, timeout=timeout, stream=True)
+    if resp.status_code != 200:
+        meter.add(time.monotonic() - t0, sent=len(resp.request.body or b''), received=len(resp.content))
+        raise ValueError(_('Codex HTTP error %s: %s') % (resp.status_code, resp.text))
+    if chat_unsupported:
+        _remember_endpoint_style(api_base, 'responses')
+    usage = {}
+    received = 0
+    with resp:
+        for data in _sse_data(resp):
+            received += len(data)
+            if data == '[DONE]':
+                break
+            event = json.loads(data)
+            kind = event.get('type')
+            if kind == 'response.output_text.delta' and event.get('delta'):
+                yield 'delta', event['delta']
+            elif kind == 'response.completed':
+                usage = (event.get('response') or {}).get('usage') or usage
+    meter.add(time.monotonic() - t0, sent=len(resp.request.body or b''), received=received, endpoint='responses')
+    yield 'usage', usage
+
+
+def _route_llm(request, messages, meter=None):
+    """Run one completion on the provider pool of ``request`` (see ``ROUTER.call``).
+
+    The result also gets the ``provider`` key and ``model`` of the provider
+    that answered. Hedged and failed-over calls count as retries in
+    ``meter``. Does not touch the ORM.
+    """
+    providers = request.get('providers') or [request]
+    launched = []
+
+    def call(provider):
+        if launched and meter:
+            meter.add(0.0, retries=1)
+        launched.append(provider['key'])
+        return _call_llm(provider, messages, meter)
+
+    key, out = ROUTER.call([(p['key'], p['weight'], p) for p in providers], call, hedge=request.get('hedge'))
+    return dict(out, provider=key, model=next(p['model'] for p in providers if p['key'] == key))
+
+
+def _route_stream(request, messages, meter=None):
+    """Stream one completion from the provider pool of ``request``, like ``_stream_llm``.
+
+    Streams are not hedged: the providers are tried in the router's order,
+    failing over to the next one only while nothing has been streamed yet.
+    A last ``('provider', {'key', 'model'})`` item tells which one answered.
+    """
+    providers = {p['key']: p for p in request.get('providers') or [request]}
+    order = ROUTER.order({key: p['weight'] for key, p in providers.items()})
+    for n, key in enumerate(order):
+        ROUTER.begin(key)
+        started = False
+        try:
+            for item in _stream_llm(providers[key], messages, meter):
+                started = True
+                yield item
         except Exception as e:
-            _logger.exception('Error calling chat/completions: %s', e)
+            # the duration of a stream depends on its length, only its outcome is recorded
+            ROUTER.record(key, None, False)
+            if started or n == len(order) - 1:
+                raise
+            _logger.warning('Codex router: stream from %s failed (%s), failing over', key, e)
+            if meter:
+                meter.add(0.0, retries=1)
+            continue
+        ROUTER.record(key, None, True)
+        yield 'provider', {'key': key, 'model': providers[key]['model']}
+        return
+
+
+class CodexClient(models.AbstractModel):
+    _name = 'codex.client'
+    _description = 'Codex HTTP Client'
+
+    def _get_conf(self):
+        """Settings snapshot (``codex.config``), shared by the requests of this worker."""
+        return self.env['codex.config']._get()
+
+    def _generate_request(self, **kwargs):
+        """Resolve everything a completion call needs, so it can run off the ORM.
+
+        The request is the one of the settings' provider; ``providers`` lists
+        the whole pool (that one first, then the ``codex.provider`` records)
+        for ``_route_llm``.
+        """
+        conf = self._get_conf()
+        api_base = conf.api_base.rstrip('/')
+        api_key = conf.api_key
+        model = conf.api_model
+        if not api_base or not api_key or not model:
+            raise ValueError(_('Codex Assistant is not configured (API base/model/key). Please configure in Settings > General Settings > Codex.'))
+        pool = self.env['codex.provider']._get_pool()
+        request = {
+            'api_base': api_base,
+            'headers': {
+                'Authorization': f'Bearer {api_key}',
+                'Content-Type': 'application/json',
+            },
+            'model': model,
+            'temperature': kwargs.get('temperature', conf.temperature),
+            'max_tokens': kwargs.get('max_tokens', conf.max_tokens),
+            'timeout': kwargs.get('timeout', conf.timeout),
+            # with other providers to fail over to, waiting out a backoff is slower than switching
+            'max_retries': min(conf.max_retries, 1) if pool else conf.max_retries,
+            'key': _router_key(api_base, model),
+            'weight': DEFAULT_WEIGHT,
+        }
+        providers = [dict(request)] + [dict(
+            request,
+            api_base=base,
+            headers=dict(request['headers'], Authorization=f'Bearer {key}'),
+            model=pool_model,
+            key=_router_key(base, pool_model),
+            weight=weight,
+        ) for base, pool_model, key, weight in pool]
+        return dict(request, providers=providers, hedge=conf.router_hedge)
+
+    @staticmethod
+    def _count_tokens(messages):
+        """Approximate prompt size of ``messages``, including ~4 tokens of framing per message."""
+        return sum(estimate_tokens(m.get('content') or '') + 4 for m in messages)
+
+    @api.model
+    def _input_budget(self):
+        return self._get_conf().input_tokens
+
+    @api.model
+    def _compress_messages(self, messages):
+        """Fit ``messages`` in the input budget; return ``(messages, saved_tokens)``.
+
+        When over budget, the longest messages are cut in their middle,
+        keeping their beginning (instructions) and end (latest messages).
+        """
+        budget = self._input_budget()
+        total = self._count_tokens(messages)
+        if budget <= 0 or total <= budget:
+            return messages, 0
+        messages = [dict(m) for m in messages]
+        for message in sorted(messages, key=lambda m: estimate_tokens(m.get('content') or ''), reverse=True):
+            excess = self._count_tokens(messages) - budget
+            if excess <= 0:
+                break
+            size = estimate_tokens(message.get('content') or '')
+            message['content'] = truncate_middle(message['content'], max(size - excess, size // 4))
+        return messages, total - self._count_tokens(messages)
+
+    def generate(self, messages, **kwargs):
+        """Call the configured LLM provider.
+
+        messages: list of dicts like [{'role': 'system'|'user'|'assistant', 'content': '...'}]
+        kwargs: temperature, max_tokens, timeout override the settings; cache=True/False
+            forces the response cache on/off (by default it is used when temperature is 0);
+            purpose is recorded with the usage metrics
+        Returns: dict with keys: text, input_tokens, output_tokens, raw, cached, saved_tokens
+        """
+        request = self._generate_request(**kwargs)
+        messages, saved = self._compress_messages(messages)
+        meter = Meter()
+        try:
+            out = self._generate_cached(request, messages, kwargs.get('cache'), meter)
+        except Exception:
+            record_metric(self.env.cr.dbname, 'generate', meter, self.env.uid, error=True,
+                          purpose=kwargs.get('purpose'), model=request['model'])
+            raise
+        # metered under the model that answered, which a failover may have changed
+        record_metric(self.env.cr.dbname, 'generate', meter, self.env.uid, cached=out['cached'],
+                      purpose=kwargs.get('purpose'), model=out.get('model') or request['model'],
+                      input_tokens=out.get('input_tokens'), output_tokens=out.get('output_tokens'))
+        return dict(out, saved_tokens=saved)
+
+    def _generate_cached(self, request, messages, use_cache, meter):
+        Cache = self.env['codex.response.cache'].sudo()
+        if use_cache is None:
+            use_cache = not request['temperature']
+        if not use_cache or not Cache._ttl():
+            return dict(_route_llm(request, messages, meter), cached=False)
+        key = Cache._make_key(request, messages)
+        hit = Cache._lookup(key)
+        if hit is None:
+            with Cache._inflight(key, request['timeout']):
+                # a concurrent caller may have produced it while we waited
+                hit = Cache._lookup(key)
+                if hit is None:
+                    out = _route_llm(request, messages, meter)
+                    # the key is the primary provider's: another one's answer is not cached under it
+                    if out['provider'] == request['key']:
+                        Cache._store(key, out['model'], out)
+                    return dict(out, cached=False)
+        return hit
+
+    def _prepare_stream(self, messages, **kwargs):
+        """Resolve a streamed generation on the ORM side.
 
-        # Fallback to /responses
-        url2 = f"{api_base}/responses"
-        resp2 = requests.post(url2, headers=headers, json=payload_responses, timeout=timeout)
-        if resp2.status_code != 200:
-            raise ValueError(_('Codex HTTP error %s: %s') % (resp2.status_code, resp2.text))
-        data = resp2.json()
-        # Try to normalize different provider formats
-        text = ''
-        usage = {}
-        # OpenAI "responses" style
-        if 'output_text' in data:
-            text = data['output_text']
-        elif 'content' in data and isinstance(data['content'], list) and data['content']:
-            # Sometimes providers return [{"type":"output_text","text":"..."}]
-            for part in data['content']:
-                if isinstance(part, dict) and part.get('type') in ('output_text', 'message') and part.get('text'):
-                    text += part.get('text', '')
-        elif 'choices' in data:
-            text = data.get('choices', [{}])[0].get('message', {}).get('content', '')
-        usage = data.get('usage', usage)
+        Returns a dict with the upstream ``request``, the (compressed)
+        ``messages`` and the ``saved_tokens`` this took, the response cache key
+        (``None`` when the cache does not apply) and a cache ``hit`` to replay
+        instead of calling the provider.
+        """
+        request = self._generate_request(**kwargs)
+        messages, saved = self._compress_messages(messages)
+        Cache = self.env['codex.response.cache'].sudo()
+        use_cache = kwargs.get('cache')
+        if use_cache is None:
+            use_cache = not request['temperature']
+        key = Cache._make_key(request, messages) if use_cache and Cache._ttl() else None
         return {
-            'text': text,
-            'input_tokens': usage.get('prompt_tokens') or usage.get('input_tokens'),
-            'output_tokens': usage.get('completion_tokens') or usage.get('output_tokens'),
-            'raw': data,
+            'request': request,
+            'messages': messages,
+            'saved_tokens': saved,
+            'purpose': kwargs.get('purpose'),
+            'cache_key': key,
+            'hit': Cache._lookup(key) if key else None,
         }
 
-    def _embed(self, texts, embed_model=None, timeout=None):
+    def _embed_request(self, embed_model=None, timeout=None):
+        """Resolve everything an ``/embeddings`` call needs, so it can run off the ORM."""
         conf = self._get_conf()
-        api_base = conf['api_base'].rstrip('/')
-        api_key = conf['api_key']
-        timeout = timeout or conf['timeout']
+        api_base = conf.api_base.rstrip('/')
+        api_key = conf.api_key
         if not api_base or not api_key:
             raise ValueError(_('Codex Assistant is not configured (API base/key).'))
-        ICP = self.env['ir.config_parameter'].sudo()
-        embed_model = embed_model or ICP.get_param('co_codex_assistant.embed_model', '')
+        embed_model = embed_model or conf.embed_model
         if not embed_model:
             raise ValueError(_('Embeddings model is not set in Settings.'))
-        payload = {'model': embed_model, 'input': texts}
-        headers = {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
-        import requests
-        url = f"{api_base}/embeddings"
-        r = requests.post(url, headers=headers, json=payload, timeout=timeout)
-        if r.status_code != 200:
-            raise ValueError(_('Embeddings HTTP error %s: %s') % (r.status_code, r.text))
-        data = r.json()
-        vecs = [d.get('embedding') for d in data.get('data', [])]
+        return {
+            'url': f"{api_base}/embeddings",
+            'headers': {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'},
+            'model': embed_model,
+            'timeout': timeout or conf.timeout,
+            'max_retries': conf.max_retries,
+        }
+
+    def _embed(self, texts, embed_model=None, timeout=None, meter=None):
+        return _fetch_embeddings(self._embed_request(embed_model, timeout), texts, meter)
+
+    @staticmethod
+    def _estimate_tokens(text):
+        return estimate_tokens(text) + 1
+
+    def _embed_batches(self, texts):
+        """Split ``texts`` into consecutive index ranges bounded by item and token count."""
+        conf = self._get_conf()
+        max_items = max(1, conf.rag_embed_batch_items)
+        max_tokens = max(1, conf.rag_embed_batch_tokens)
+        start = 0
+        tokens = 0
+        for i, text in enumerate(texts):
+            cost = self._estimate_tokens(text)
+            if i > start and (i - start >= max_items or tokens + cost > max_tokens):
+                yield start, i, tokens
+                start, tokens = i, 0
+            tokens += cost
+        if start < len(texts):
+            yield start, len(texts), tokens
+
+    def _embed_many(self, texts, embed_model=None, stats=None):
+        """Embed ``texts`` with one ``/embeddings`` call per batch.
+
+        Up to ``rag_embed_concurrency`` batches are in flight at once on a
+        thread pool; the threads only do HTTP, so the caller keeps writing to
+        the ORM from its own cursor. Returns the vectors in the order of
+        ``texts``. When ``stats`` is a dict, batch/chunk/token counters, the
+        summed upstream seconds and the wall time are accumulated into it.
+        """
+        request = self._embed_request(embed_model)
+        batches = list(self._embed_batches(texts))
+        if not batches:
+            return []
+        meter = Meter()
+        concurrency = max(1, self._get_conf().rag_embed_concurrency)
+        stats = stats if stats is not None else {}
+
+        def run(batch):
+            start, end, tokens = batch
+            t0 = time.monotonic()
+            vecs = _fetch_embeddings(request, texts[start:end], meter)
+            elapsed = time.monotonic() - t0
+            _logger.debug('Codex embed batch: %s chunks, ~%s tokens in %.2fs (%.1f chunks/s)',
+                          end - start, tokens, elapsed, (end - start) / elapsed if elapsed else 0.0)
+            return vecs, elapsed
+
+        wall = time.monotonic()
+        metric = dict(model=request['model'], input_tokens=sum(tokens for _s, _e, tokens in batches))
+        try:
+            if concurrency == 1 or len(batches) == 1:
+                results = [run(batch) for batch in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=min(concurrency, len(batches)),
+                                        thread_name_prefix='codex-embed') as pool:
+                    # map() yields results in submission order
+                    results = list(pool.map(run, batches))
+        except Exception:
+            record_metric(self.env.cr.dbname, 'embed', meter, self.env.uid, error=True, **metric)
+            raise
+        record_metric(self.env.cr.dbname, 'embed', meter, self.env.uid, **metric)
+        vecs = []
+        for (start, end, tokens), (batch_vecs, elapsed) in zip(batches, results):
+            vecs.extend(batch_vecs)
+            stats['batches'] = stats.get('batches', 0) + 1
+            stats['chunks'] = stats.get('chunks', 0) + (end - start)
+            stats['tokens'] = stats.get('tokens', 0) + tokens
+            stats['seconds'] = stats.get('seconds', 0.0) + elapsed
+        stats['wall'] = stats.get('wall', 0.0) + time.monotonic() - wall
         return vecs
 
+    def _embed_query(self, text, embed_model, parent_meter=None):
+        """Embed a retrieval query, going through ``codex.embedding.cache``.
+
+        The upstream time, bytes and retries are also added to ``parent_meter``.
+        """
+        Cache = self.env['codex.embedding.cache'].sudo()
+        meter = Meter()
+        metric = dict(model=embed_model, input_tokens=estimate_tokens(text))
+        vec = Cache._lookup(text, embed_model)
+        if vec is None:
+            try:
+                vec = self._embed([text], embed_model=embed_model, meter=meter)[0]
+            except Exception:
+                record_metric(self.env.cr.dbname, 'embed', meter, self.env.uid, error=True, **metric)
+                raise
+            Cache._store(text, embed_model, vec)
+            record_metric(self.env.cr.dbname, 'embed', meter, self.env.uid, **metric)
+        else:
+            record_metric(self.env.cr.dbname, 'embed', meter, self.env.uid, cached=True, model=embed_model)
+        if parent_meter:
+            parent_meter.add(meter.upstream, meter.bytes_sent, meter.bytes_received, meter.retries, meter.endpoint)
+        return vec
+
+    def _rag_generations(self, company_id, embed_model):
+        """``[(index_id, generation)]`` of the stores of ``embed_model`` visible to ``company_id``."""
+        self.env.cr.execute("""
+            SELECT id, generation FROM codex_index
+            WHERE embed_model = %s AND (company_id IS NULL OR company_id = %s)
+            ORDER BY id
+        """, (embed_model, company_id))
+        return self.env.cr.fetchall()
+
+    def _rag_matrices(self, company_id, embed_model, generations=None):
+        """Return ``{index_id: VectorMatrix}`` (cached) for every store visible to ``company_id``.
+
+        Each store file is mapped read-only once per worker and re-mapped
+        only when its ``generation`` changes.
+        """
+        cr = self.env.cr
+        if generations is None:
+            generations = self._rag_generations(company_id, embed_model)
+        matrices = {}
+        for index_id, generation in generations:
+            key = (cr.dbname, index_id)
+            with _MATRIX_LOCK:
+                cached = _MATRIX_CACHE.get(key)
+            if cached and cached[0] == generation:
+                matrices[index_id] = cached[1]
+                continue
+            matrix = self.env['codex.index'].sudo().browse(index_id)._load_matrix()
+            with _MATRIX_LOCK:
+                _MATRIX_CACHE[key] = (generation, matrix)
+            matrices[index_id] = matrix
+        return matrices
+
+    def rag_retrieve(self, query_text, limit=None, filters=None, stats=None):
+        """Documents relevant to ``query_text``, best first.
+
+        In hybrid mode the full-text and embedding rankings (each
+        ``RRF_DEPTH`` times deeper than ``limit``) are fused by reciprocal
+        rank; without a usable embeddings model the full-text ranking is
+        used alone.
+
+        ``filters`` (see ``codex.document._filter_clauses``) are applied in
+        SQL before any scoring: the full-text query gets them as conditions
+        and the vector search only scores the store rows that pass them.
+        When ``stats`` is a dict, it gets the per-filter counts and the
+        number of rows ``scored``.
+
+        Results (ids and scores) are kept per worker for
+        ``rag_result_cache_ttl`` seconds under a key made of the query,
+        company, settings (indexed models included), filters and the
+        ``generation`` of every store searched. Any indexer change bumps a generation, so a cached result
+        is only reused while the index is unchanged, e.g. when the wizard of
+        the same ticket is opened again.
+        """
+        meter = Meter()
+        conf = self._get_conf()
+        embed_model = conf.embed_model
+        nprobe = conf.rag_ann_nprobe
+        mode = conf.rag_mode
+        limit = limit or conf.rag_topk
+        depth = limit * RRF_DEPTH if mode == 'hybrid' else limit
+        Document = self.env['codex.document'].sudo()
+        company_id = self.env.company.id
+        generations = self._rag_generations(company_id, embed_model) if embed_model else []
+        key = None
+        if conf.rag_result_cache_ttl and stats is None:
+            # the indexed models decide which chunks without a partner are shared
+            partner_models = Document._partner_models() if (filters or {}).get('partner_id') else []
+            key = _result_key(self.env.cr.dbname, query_text, company_id, limit, mode, embed_model, nprobe,
+                              filters or {}, conf.rag_models, partner_models, generations)
+            hit = _result_get(key)
+            if hit is not None:
+                record_metric(self.env.cr.dbname, 'retrieve', meter, self.env.uid, cached=True,
+                              model=embed_model if mode != 'lexical' else None)
+                return Document.browse(hit[0])
+        rankings = []
+        scores = None
+        if mode != 'vector':
+            rankings.append(Document._lexical_search(query_text, company_id, depth, filters=filters))
+        if mode != 'lexical' and (embed_model or mode == 'vector'):
+            try:
+                # Compute query embedding (cached across workers)
+                qv = self._embed_query(query_text, embed_model, meter)
+                # Shared stores plus the current company's
+                matrices = self._rag_matrices(company_id, embed_model, generations)
+                allowed = Document._filtered_rows(filters, company_id, stats) if filters else None
+                results = []
+                for index_id, matrix in matrices.items():
+                    rows = allowed.get(index_id, ()) if allowed is not None else None
+                    if stats is not None:
+                        stats['scored'] = stats.get('scored', 0) + (len(matrix) if rows is None else len(rows))
+                    results.append(matrix.search(qv, depth, nprobe=nprobe, rows=rows))
+                ids, scores = merge_results(results, depth)
+                rankings.append(ids)
+            except Exception as e:
+                if mode == 'vector':
+                    record_metric(self.env.cr.dbname, 'retrieve', meter, self.env.uid, model=embed_model, error=True)
+                    raise
+                _logger.warning('Codex RAG: embeddings unavailable, using full-text results only: %s', e)
+                # do not keep the degraded result
+                key = None
+        if len(rankings) > 1:
+            ids, scores = rrf_fuse(rankings, limit)
+        elif scores is not None:
+            ids, scores = ids[:limit], scores[:limit]
+        else:
+            # full-text ranks, scored like a single-ranking fusion
+            ids, scores = rrf_fuse(rankings, limit)
+        if key:
+            _result_put(key, conf.rag_result_cache_ttl, ids, scores)
+        record_metric(self.env.cr.dbname, 'retrieve', meter, self.env.uid,
+                      model=embed_model if mode != 'lexical' else None)
+        return Document.browse(ids)
+
+    @api.model
+    def _rag_filters(self, record=None):
+        """Retrieval filters configured for a wizard opened on ``record`` (a ticket or channel)."""
+        conf = self._get_conf()
+        filters = {'max_age_days': conf.rag_max_age_days}
+        if record and record._name == 'helpdesk.ticket':
+            filters['models'] = [m.strip() for m in conf.rag_ticket_models.split(',') if m.strip()]
+            if conf.rag_same_partner and record.partner_id:
+                filters['partner_id'] = record.partner_id.id
+        return {key: value for key, value in filters.items() if value}
+
+    def _rag_context(self, query_text, budget, stats=None, filters=None):
+        """Retrieved documents as a context block, best first, within ``budget`` tokens.
+
+        Documents that do not fit are skipped; their tokens are added to
+        ``stats['saved_tokens']``. A ``budget`` of None keeps them all.
+        """
+        docs = self.rag_retrieve(query_text, filters=filters)
+        blocks = [f"[RAG:{d.model}#{d.res_id}] {d.title}\n{d.body}\n---" for d in docs]
+        if budget is None:
+            kept, skipped = blocks, 0
+        else:
+            kept, skipped = take_within(blocks, max(budget, 0))
+        if stats is not None:
+            stats['saved_tokens'] = stats.get('saved_tokens', 0) + skipped
+        return '\n'.join(kept)
+
     @staticmethod
-    def _cosine(a, b):
-        # a, b are Python lists
-        if not a or not b:
-            return 0.0
-        s = 0.0
-        na = 0.0
-        nb = 0.0
-        ln = min(len(a), len(b))
-        for i in range(ln):
-            x = float(a[i])
-            y = float(b[i])
-            s += x * y
-            na += x * x
-            nb += y * y
-        if na <= 0 or nb <= 0:
-            return 0.0
-        import math
-        return s / (math.sqrt(na) * math.sqrt(nb))
-
-    def rag_retrieve(self, query_text, limit=None):
-        ICP = self.env['ir.config_parameter'].sudo()
-        topk = int(ICP.get_param('co_codex_assistant.rag_topk', '5'))
-        limit = limit or topk
-        # Compute query embedding
-        qv = self._embed([query_text])[0]
-        # Filter by company for multi-company environments (optional)
-        domain = ['|', ('company_id', '=', False), ('company_id', '=', self.env.company.id)]
-        docs = self.env['codex.document'].sudo().search(domain, limit=2000)  # simple cap
-        scored = []
-        for d in docs:
-            v = d.embedding or []
-            score = self._cosine(qv, v)
-            scored.append((score, d))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return [d for (s, d) in scored[:limit]]
+    def _rag_chunks(text, max_tokens, overlap_tokens):
+        return chunk_text(text, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
 
     def rag_index_now(self):
-        ICP = self.env['ir.config_parameter'].sudo()
-        models_csv = (ICP.get_param('co_codex_assistant.rag_models', '') or '').strip()
-        fields_csv = (ICP.get_param('co_codex_assistant.rag_fields', '') or '').strip()
-        chunk_size = int(ICP.get_param('co_codex_assistant.rag_chunk', '1000'))
+        """Index records changed since the last run, in committed slices.
+
+        Each (model, record, field set, chunk index) maps to one
+        ``codex.document``; only chunks whose text hash changed are
+        re-embedded, leftover chunks and chunks of deleted records are
+        archived. The models take turns: a slice of at most
+        ``rag_index_limit`` records of one model is chunked, embedded,
+        written and checkpointed (the model's ``write_date`` watermark in
+        ``codex.indexer.state``) in its own transaction. Slices are started
+        for ``rag_index_budget`` seconds at most; if work is left, the cron
+        is triggered again and resumes from the checkpoints. A failing slice
+        is rolled back, its error kept on the model's state, and that model
+        is left for the next run.
+
+        Commits: only call it from the cron or a shell.
+        Returns the number of chunks embedded.
+        """
+        conf = self._get_conf()
+        models_csv = conf.rag_models.strip()
+        fields_csv = conf.rag_fields.strip()
         if not models_csv or not fields_csv:
             return 0
         models = [m.strip() for m in models_csv.split(',') if m.strip()]
         fields = [f.strip() for f in fields_csv.split(',') if f.strip()]
-        created = 0
-        Doc = self.env['codex.document'].sudo()
-        base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
-        for model_name in models:
-            Model = self.env[model_name]
-            # Only index records readable by current user to respect ACLs
-            recs = Model.search([], limit=1000, order='write_date desc')
-            for rec in recs:
-                # Concatenate target fields
-                parts = []
-                for fname in fields:
-                    if fname in rec and isinstance(rec[fname], str) and rec[fname]:
-                        parts.append(rec[fname])
-                if not parts:
-                    continue
-                text = '\n'.join(parts)
-                # Split into chunks
-                for idx in range(0, len(text), chunk_size):
-                    chunk = text[idx: idx + chunk_size]
-                    vec = self._embed([chunk])[0]
-                    Doc.create({
-                        'title': f"{rec.display_name} (part {idx // chunk_size + 1})",
+        cr = self.env.cr
+        # the cron's own lock does not survive our commits; keep manual runs out as well
+        cr.execute("SELECT pg_try_advisory_lock(%s)", (INDEXER_LOCK,))
+        if not cr.fetchone()[0]:
+            _logger.info('Codex RAG index: another run is in progress')
+            return 0
+        try:
+            return self._rag_index_slices(models, fields, conf)
+        except Exception:
+            # the unlock below needs a usable transaction
+            cr.rollback()
+            raise
+        finally:
+            cr.execute("SELECT pg_advisory_unlock(%s)", (INDEXER_LOCK,))
+
+    def _rag_index_slices(self, models, fields, conf):
+        cr = self.env.cr
+        deadline = time.monotonic() + max(conf.rag_index_budget, 1)
+        limit = max(conf.rag_index_limit, 1)
+        self.env['codex.index']._migrate_legacy_embeddings()
+        cr.commit()
+        stats = {}
+        counts = dict.fromkeys(('created', 'updated', 'unchanged', 'archived'), 0)
+        States = self.env['codex.indexer.state']
+        pending, slices, rewound = list(models), 0, set()
+        while pending and time.monotonic() < deadline:
+            for model_name in list(pending):
+                if time.monotonic() >= deadline:
+                    break
+                # the first slice of a model in a run goes back rag_index_margin minutes
+                margin = 0 if model_name in rewound else conf.rag_index_margin
+                rewound.add(model_name)
+                try:
+                    done = self._rag_index_model(model_name, fields, stats, counts, limit, margin)
+                    cr.commit()
+                except Exception as e:
+                    cr.rollback()
+                    _logger.exception('Codex RAG index: slice of %s failed, resuming at the next run', model_name)
+                    States._record_error(model_name, str(e))
+                    cr.commit()
+                    done = 0
+                slices += 1
+                if done < limit:
+                    pending.remove(model_name)
+        _logger.info('Codex RAG index: %(created)s created, %(updated)s re-embedded, '
+                     '%(unchanged)s unchanged, %(archived)s archived', counts)
+        if stats:
+            _logger.info('Codex RAG index: %s chunks in %s embedding batches, ~%s tokens, '
+                         '%.1fs upstream, %.1fs wall (%.1f chunks/s)',
+                         stats['chunks'], stats['batches'], stats['tokens'], stats['seconds'], stats['wall'],
+                         stats['chunks'] / stats['wall'] if stats['wall'] else 0.0)
+        if pending:
+            _logger.info('Codex RAG index: time budget spent after %s slices, %s still pending',
+                         slices, ', '.join(pending))
+            self.env.ref('co_codex_assistant.ir_cron_codex_reindex')._trigger()
+        else:
+            self.env['codex.index']._maintain_ann()
+        return counts['created'] + counts['updated']
+
+    def _rag_index_model(self, model_name, fields, stats, counts, limit, margin=0):
+        """Index one slice: the next ``limit`` records of ``model_name`` past its watermark.
+
+        ``margin`` (minutes) also re-checks the records written just before
+        the watermark, see ``codex.indexer.state._pending_domain``.
+
+        Returns the number of records processed; fewer than ``limit`` means
+        the model is caught up.
+        """
+        conf = self._get_conf()
+        chunk_tokens = max(16, conf.rag_chunk_tokens)
+        overlap_tokens = max(0, conf.rag_chunk_overlap)
+        base_url = conf.web_base_url
+        Model = self.env[model_name]
+        field_names = sorted(f for f in fields if f in Model._fields)
+        if not field_names:
+            return 0
+        field_set = ','.join(field_names)
+        state = self.env['codex.indexer.state']._get_for(
+            model_name, field_set, chunker=f"sentences:{chunk_tokens}/{overlap_tokens}")
+        Doc = self.env['codex.document'].sudo().with_context(active_test=False)
+
+        # Only index records readable by current user to respect ACLs
+        recs = Model.search(state._pending_domain(margin), limit=limit, order='write_date asc, id asc')
+        docs = Doc.search([('model', '=', model_name), ('res_id', 'in', recs.ids)]) if recs else Doc
+        by_key = {(d.res_id, d.chunk_index): d for d in docs if d.field_set == field_set}
+        # chunks of another field set (or from the former non-incremental indexer)
+        obsolete = docs.filtered(lambda d: d.field_set != field_set)
+
+        new_vals, changed, changed_vals, reactivate = [], Doc, [], Doc
+        for rec in recs:
+            parts = [html_to_text(rec[f]) if Model._fields[f].type == 'html' else rec[f]
+                     for f in field_names if isinstance(rec[f], str) and rec[f]]
+            company_id = rec.company_id.id if 'company_id' in rec else False
+            meta = self._rag_source_meta(rec)
+            for idx, chunk in enumerate(self._rag_chunks('\n\n'.join(parts), chunk_tokens, overlap_tokens)):
+                vals = {
+                    'title': f"{rec.display_name} (part {idx + 1})",
+                    'body': chunk,
+                    'content_hash': hashlib.sha256(chunk.encode()).hexdigest(),
+                }
+                doc = by_key.pop((rec.id, idx), None)
+                # a document without a vector lost it in an embeddings migration
+                if doc and doc.content_hash == vals['content_hash'] and doc.index_id:
+                    counts['unchanged'] += 1
+                    if not doc.active:
+                        reactivate |= doc
+                    if doc.partner_id.id != meta['partner_id'] or doc.source_date != meta['source_date']:
+                        doc.write(meta)
+                elif doc:
+                    if doc.company_id.id != company_id:
+                        vals['company_id'] = company_id
+                    vals.update(meta)
+                    changed |= doc
+                    changed_vals.append(vals)
+                else:
+                    vals.update(meta)
+                    vals.update({
+                        'company_id': company_id,
                         'model': model_name,
                         'res_id': rec.id,
-                        'company_id': rec.company_id.id if 'company_id' in rec else False,
-                        'body': chunk,
-                        'embedding': vec,
+                        'field_set': field_set,
+                        'chunk_index': idx,
                         'url': f"{base_url}/web#id={rec.id}&model={model_name}&view_type=form",
                     })
-                    created += 1
-        return created
+                    new_vals.append(vals)
+        # chunks past the new end of a shortened text
+        for doc in by_key.values():
+            obsolete |= doc
+
+        vecs = self._embed_many([v['body'] for v in changed_vals + new_vals], stats=stats)
+        for doc, vals in zip(changed, changed_vals):
+            doc.write(dict(vals, active=True))
+        changed._set_vectors(vecs[:len(changed_vals)])
+        for vals, vec in zip(new_vals, vecs[len(changed_vals):]):
+            vals['embedding'] = vec
+        Doc.create(new_vals)
+        if reactivate:
+            reactivate.write({'active': True})
+        obsolete = obsolete.filtered('active')
+        obsolete.write({'active': False})
+        counts['created'] += len(new_vals)
+        counts['updated'] += len(changed_vals)
+        counts['archived'] += len(obsolete)
+        if len(recs) < limit:
+            # caught up: look for deleted records once per pass
+            counts['archived'] += self._rag_archive_deleted(model_name)
+        if recs:
+            state._advance(recs[-1])
+        elif state.last_error:
+            state.last_error = False
+        return len(recs)
+
+    @staticmethod
+    def _rag_source_meta(rec):
+        """Partner and date of a source record, stored on its chunks for retrieval filters."""
+        fields = rec._fields
+        name = CodexClient._rag_partner_field(rec)
+        partner = rec[name].id if name else False
+        date = rec.date if 'date' in fields and fields['date'].type == 'datetime' else rec.create_date
+        return {'partner_id': partner, 'source_date': date}
+
+    @staticmethod
+    def _rag_partner_field(model):
+        """Name of the customer (or author) field of ``model``, None if it has none."""
+        fields = model._fields
+        for name in ('partner_id', 'author_id'):
+            if name in fields and fields[name].type == 'many2one' and fields[name].comodel_name == 'res.partner':
+                return name
+        return None
+
+    def _rag_backfill_meta(self, batch=1000):
+        """Store the partner and date of their source records on chunks indexed without them.
+
+        Chunks indexed before these columns existed keep them empty until
+        their record changes; the ``17.0.2.1.0`` migration fills them at
+        once. Returns the number of chunks updated.
+        """
+        cr = self.env.cr
+        cr.execute("SELECT DISTINCT model FROM codex_document WHERE model IS NOT NULL AND source_date IS NULL")
+        updated = 0
+        for (model_name,) in cr.fetchall():
+            if model_name not in self.env:
+                continue
+            cr.execute("SELECT DISTINCT res_id FROM codex_document WHERE model = %s AND source_date IS NULL",
+                       (model_name,))
+            res_ids = [r[0] for r in cr.fetchall()]
+            Model = self.env[model_name].sudo().with_context(active_test=False)
+            for start in range(0, len(res_ids), batch):
+                recs = Model.browse(res_ids[start:start + batch]).exists()
+                metas = [(rec.id, self._rag_source_meta(rec)) for rec in recs]
+                cr.execute("""
+                    UPDATE codex_document d
+                    SET partner_id = v.partner_id, source_date = v.source_date
+                    FROM unnest(%s::int[], %s::int[], %s::timestamp[]) AS v(res_id, partner_id, source_date)
+                    WHERE d.model = %s AND d.res_id = v.res_id
+                """, ([res_id for res_id, _meta in metas],
+                      [meta['partner_id'] or None for _res_id, meta in metas],
+                      [meta['source_date'] for _res_id, meta in metas], model_name))
+                updated += cr.rowcount
+                self.env.invalidate_all()
+        _logger.info('Codex RAG: partner and date stored on %s chunks indexed without them', updated)
+        return updated
+
+    def _rag_archive_deleted(self, model_name):
+        """Archive the chunks of records of ``model_name`` that no longer exist.
+
+        One anti-join against the model's table, so the ids of the indexed
+        records are never loaded.
+        """
+        Model = self.env[model_name]
+        if Model._abstract:
+            return 0
+        self.env['codex.document'].flush_model(['model', 'res_id', 'active'])
+        self.env.cr.execute(SQL("""
+            SELECT d.id FROM codex_document d
+            WHERE d.model = %s AND d.active
+              AND NOT EXISTS (SELECT 1 FROM %s t WHERE t.id = d.res_id)
+        """, model_name, SQL.identifier(Model._table)))
+        docs = self.env['codex.document'].sudo().browse([r[0] for r in self.env.cr.fetchall()])
+        docs.write({'active': False})
+        return len(docs)
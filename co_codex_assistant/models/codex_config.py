@@ -0,0 +1,87 @@
+import dataclasses
+
+from odoo import api, models, tools
+
+PARAM_PREFIX = 'co_codex_assistant.'
+
+
+@dataclasses.dataclass(frozen=True)
+class CodexConfig:
+    """Values of the ``co_codex_assistant.*`` parameters, typed, with their defaults.
+
+    Each attribute is read from the parameter of the same name; empty or
+    missing parameters get the default.
+    """
+    api_base: str = ''
+    api_model: str = ''
+    api_key: str = ''
+    temperature: float = 0.3
+    max_tokens: int = 512
+    timeout: int = 60
+    max_retries: int = 3
+    router_hedge: bool = True
+    response_cache_ttl: int = 24
+    job_run_seconds: int = 90
+    job_concurrency: int = 4
+    job_user_concurrency: int = 2
+    job_batch_concurrency: int = 2
+    context_tokens: int = 3000
+    input_tokens: int = 6000
+    embed_model: str = ''
+    embed_model_next: str = ''
+    rag_models: str = ''
+    rag_fields: str = ''
+    rag_topk: int = 5
+    rag_mode: str = 'hybrid'
+    rag_ticket_models: str = ''
+    rag_same_partner: bool = False
+    rag_max_age_days: int = 0
+    rag_chunk_tokens: int = 256
+    rag_chunk_overlap: int = 32
+    rag_index_limit: int = 200
+    rag_index_budget: int = 60
+    rag_index_margin: int = 10
+    rag_embed_batch_items: int = 64
+    rag_embed_batch_tokens: int = 8000
+    rag_embed_concurrency: int = 4
+    rag_ann_nprobe: int = 8
+    rag_ann_min_rows: int = 20000
+    query_cache_ttl: int = 168
+    rag_result_cache_ttl: int = 600
+    web_base_url: str = ''
+
+    @classmethod
+    def from_params(cls, params):
+        """Build a snapshot from ``{parameter key: value}``."""
+        values = {}
+        for field in dataclasses.fields(cls):
+            key = 'web.base.url' if field.name == 'web_base_url' else PARAM_PREFIX + field.name
+            value = params.get(key)
+            if not value:
+                continue
+            if field.type is bool:
+                # set_param() stores booleans as 'True', and removes False ones
+                values[field.name] = value != 'False'
+            else:
+                values[field.name] = field.type(value)
+        return cls(**values)
+
+
+class CodexConfigSnapshot(models.AbstractModel):
+    """Process-wide snapshot of the Codex settings.
+
+    Built with one query and kept in the registry's ormcache. Writing an
+    ``ir.config_parameter`` clears that cache in this process and, through
+    the registry cache-invalidation signal, in the other workers, so the
+    snapshot never outlives a settings change.
+    """
+    _name = 'codex.config'
+    _description = 'Codex Settings Snapshot'
+
+    @api.model
+    @tools.ormcache()
+    def _get(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        records = ICP.search_read(['|', ('key', '=like', PARAM_PREFIX + '%'), ('key', '=', 'web.base.url')],
+                                  ['key', 'value'])
+        return CodexConfig.from_params({r['key']: r['value'] for r in records})
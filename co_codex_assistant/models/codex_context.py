@@ -0,0 +1,113 @@
+from odoo import api, models
+
+from ..tools.compress import compress_text, dedupe_lines
+from ..tools.text import estimate_tokens, html_to_text, truncate_tokens
+
+# discuss.channel was mail.channel before Odoo 17; old messages may still use it
+CHANNEL_MODELS = ('discuss.channel', 'mail.channel')
+
+
+class CodexContext(models.AbstractModel):
+    """Build the conversation context sent to the LLM.
+
+    Messages are read newest first, with their author names, in one
+    ``search_read`` per page and kept until the token budget is spent, so
+    the oldest messages are the ones left out. Quoted replies, signatures,
+    disclaimers and lines repeated from earlier messages are removed first;
+    the tokens this saves are added to ``stats['saved_tokens']``.
+    """
+    _name = 'codex.context'
+    _description = 'Codex Context Builder'
+
+    @api.model
+    def _budget(self):
+        return self.env['codex.config']._get().context_tokens
+
+    @staticmethod
+    def _format(message):
+        """Return the context line of ``message`` and the tokens compression saved on it."""
+        text = compress_text(html_to_text(message['body'], skip_quotes=True))
+        if not text:
+            # tracking values, attachments only
+            return '', 0
+        author = message['author_id'][1] if message['author_id'] else 'System'
+        return f"{author}: {text}", estimate_tokens(html_to_text(message['body'])) - estimate_tokens(text)
+
+    @staticmethod
+    def _fit(lines, budget, stats):
+        """Keep the first (newest) of ``lines`` within ``budget`` tokens; return them oldest first.
+
+        ``lines`` yields ``_format()`` results. The newest message is always
+        kept, cut to the budget if needed.
+        """
+        kept, used, saved = [], 0, 0
+        for line, line_saved in lines:
+            if not line:
+                continue
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                if not kept:
+                    kept.append(truncate_tokens(line, budget))
+                    saved += line_saved
+                break
+            kept.append(line)
+            used += cost
+            saved += line_saved
+        text = '\n'.join(reversed(kept))
+        deduped = '\n'.join(dedupe_lines(list(reversed(kept))))
+        saved += estimate_tokens(text) - estimate_tokens(deduped)
+        stats['saved_tokens'] = stats.get('saved_tokens', 0) + saved
+        return deduped
+
+    @api.model
+    def _thread_context(self, model, res_id, budget=None, page=50, stats=None):
+        """Context of the discussion of one record (``model`` may be a tuple of model names)."""
+        budget = self._budget() if budget is None else budget
+        stats = stats if stats is not None else {}
+        domain = [('model', 'in', [model] if isinstance(model, str) else list(model)), ('res_id', '=', res_id)]
+        Message = self.env['mail.message']
+
+        def lines():
+            offset = 0
+            while True:
+                messages = Message.search_read(domain, ['author_id', 'body'], offset=offset, limit=page,
+                                               order='date desc, id desc')
+                for message in messages:
+                    yield self._format(message)
+                if len(messages) < page:
+                    return
+                offset += page
+
+        return self._fit(lines(), budget, stats)
+
+    @api.model
+    def _threads_context(self, model, res_ids, budget=None, limit=50, stats=None):
+        """Contexts of many records of ``model`` at once: ``{res_id: text}``.
+
+        The last ``limit`` messages of every record are selected with one
+        query and read with one ``read()``. When ``stats`` is a dict, it gets
+        the statistics of each record under its id.
+        """
+        budget = self._budget() if budget is None else budget
+        stats = stats if stats is not None else {}
+        if not res_ids:
+            return {}
+        Message = self.env['mail.message']
+        Message.flush_model(['model', 'res_id', 'date'])
+        self.env.cr.execute("""
+            SELECT id FROM (
+                SELECT id, row_number() OVER (PARTITION BY res_id ORDER BY date DESC, id DESC) AS rank
+                FROM mail_message
+                WHERE model = %s AND res_id = ANY(%s)
+            ) ranked
+            WHERE rank <= %s
+        """, (model, list(res_ids), limit))
+        messages = Message.browse([row[0] for row in self.env.cr.fetchall()]).read(
+            ['res_id', 'author_id', 'body', 'date'])
+        messages.sort(key=lambda m: (m['date'], m['id']), reverse=True)
+        lines = {res_id: [] for res_id in res_ids}
+        for message in messages:
+            lines[message['res_id']].append(self._format(message))
+        for res_id in res_ids:
+            stats[res_id] = {}
+        return {res_id: self._fit(record_lines, budget, stats[res_id]) for res_id, record_lines in lines.items()}
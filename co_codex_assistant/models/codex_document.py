@@ -1,7 +1,17 @@
 import json
+from collections import defaultdict
+
+import numpy as np
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 
+from ..tools.text import query_terms
+
+# Structured filters accepted by codex.client.rag_retrieve
+RAG_FILTERS = ('models', 'tags', 'language', 'max_age_days', 'partner_id')
+# Changing one of these changes retrieval results: the stores' generation is bumped
+RETRIEVAL_FIELDS = {'active', 'title', 'body', 'model', 'tags', 'language', 'partner_id', 'source_date'}
+
 class CodexDocument(models.Model):
     _name = 'codex.document'
     _description = 'Codex RAG Document'
@@ -13,21 +23,234 @@ class CodexDocument(models.Model):
     res_id = fields.Integer(index=True)
     company_id = fields.Many2one('res.company', index=True)
     body = fields.Text(help='Indexed text content')
-    embedding = fields.Json(help='Vector embedding as list[float]')
+    field_set = fields.Char(readonly=True, help='Source fields this chunk was built from.')
+    chunk_index = fields.Integer(readonly=True, help='Position of this chunk in the source text.')
+    content_hash = fields.Char(readonly=True, help='SHA-256 of the chunk text; unchanged chunks are not re-embedded.')
+    embedding = fields.Json(help='Legacy vector embedding as list[float]. New vectors go to the binary '
+                                 'store (see Embedding Stores); use Rebuild to migrate old rows.')
+    index_id = fields.Many2one('codex.index', string='Embedding Store', index=True, readonly=True,
+                               ondelete='set null')
+    embedding_row = fields.Integer(string='Store Row', default=-1, readonly=True,
+                                   help='Row of this document\'s vector in the embedding store file.')
+    embed_model = fields.Char(related='index_id.embed_model', string='Embeddings Model')
+    embed_dim = fields.Integer(related='index_id.dim', string='Dimension')
+    next_index_id = fields.Many2one('codex.index', string='Migration Store', index=True, readonly=True,
+                                    ondelete='set null',
+                                    help='Store of the vector computed with the model being migrated to.')
+    next_embedding_row = fields.Integer(string='Migration Store Row', default=-1, readonly=True)
     url = fields.Char(help='Smart URL to the record')
     tags = fields.Char(help='Comma separated tags')
     language = fields.Char(help='Detected language or set language')
+    partner_id = fields.Many2one('res.partner', string='Partner', index=True, readonly=True,
+                                 help='Customer (or author) of the source record.')
+    source_date = fields.Datetime(readonly=True, help='Date of the source record, used by age filters.')
     active = fields.Boolean(default=True)
 
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS codex_document_source_idx
+            ON codex_document (model, res_id, field_set, chunk_index)
+        """)
+        # Full-text search column, maintained by PostgreSQL and unknown to the ORM.
+        # The 'simple' configuration does no stemming, which suits mixed English/Turkish
+        # text and keeps identifiers (ticket numbers, IMEIs, error codes) intact.
+        self.env.cr.execute("""
+            ALTER TABLE codex_document ADD COLUMN IF NOT EXISTS search_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(body, ''))) STORED
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS codex_document_search_tsv_idx
+            ON codex_document USING gin (search_tsv)
+        """)
+
+    @api.model
+    def _filter_clauses(self, filters):
+        """SQL conditions for the ``rag_retrieve`` filters, as ``[(name, sql, params)]``.
+
+        - ``models``: source model names
+        - ``tags``: documents having any of these tags
+        - ``language``: language code
+        - ``max_age_days``: source records at most this old
+        - ``partner_id``: documents of this partner, or of no partner (knowledge
+          base) when their model has no partner field
+        """
+        unknown = set(filters or ()) - set(RAG_FILTERS)
+        if unknown:
+            raise ValueError(_('Unknown retrieval filters: %s') % ', '.join(sorted(unknown)))
+        filters = {key: value for key, value in (filters or {}).items() if value}
+        clauses = []
+        if 'models' in filters:
+            clauses.append(('models', 'model = ANY(%s)', [list(filters['models'])]))
+        if 'tags' in filters:
+            clauses.append(('tags', "string_to_array(replace(coalesce(tags, ''), ' ', ''), ',') && %s::varchar[]",
+                            [list(filters['tags'])]))
+        if 'language' in filters:
+            clauses.append(('language', 'language = %s', [filters['language']]))
+        if 'max_age_days' in filters:
+            clauses.append(('max_age_days',
+                            "coalesce(source_date, create_date) >= (now() AT TIME ZONE 'UTC') - %s * interval '1 day'",
+                            [int(filters['max_age_days'])]))
+        if 'partner_id' in filters:
+            # chunks without a partner are shared knowledge, unless their model has a partner field
+            clauses.append(('partner_id', '(partner_id = %s OR (partner_id IS NULL AND coalesce(model, '') <> ALL(%s)))',
+                            [filters['partner_id'], self._partner_models()]))
+        return clauses
+
+    @api.model
+    def _partner_models(self):
+        """Indexed models whose records have a customer (or author) field."""
+        conf = self.env['codex.config']._get()
+        Client = self.env['codex.client']
+        names = [name.strip() for name in conf.rag_models.split(',') if name.strip()]
+        return [name for name in names if name in self.env and Client._rag_partner_field(self.env[name])]
+
+    @api.model
+    def _filtered_rows(self, filters, company_id, stats=None):
+        """Store rows of the documents passing ``filters``: ``{index_id: row array}``.
+
+        When ``stats`` is a dict, it gets the number of ``candidates`` (active
+        documents of the company), the number ``kept`` and, per filter, how
+        many candidates it ``excluded`` on its own, i.e. the similarity
+        computations it saves.
+        """
+        clauses = self._filter_clauses(filters)
+        self.flush_model()
+        base = "active AND (company_id IS NULL OR company_id = %s)"
+        if stats is not None:
+            # a clause that is NULL for a row (e.g. no language) excludes it, as in the WHERE
+            columns = ', '.join([f"count(*) FILTER (WHERE NOT coalesce({sql}, false))" for _name, sql, _params in clauses]
+                                + [f"count(*) FILTER (WHERE {' AND '.join(sql for _n, sql, _p in clauses) or 'true'})"])
+            self.env.cr.execute(
+                f"SELECT count(*), {columns} FROM codex_document WHERE {base}",
+                [p for _name, _sql, params in clauses for p in params]
+                + [p for _name, _sql, params in clauses for p in params] + [company_id])
+            counts = self.env.cr.fetchone()
+            stats.update({
+                'candidates': counts[0],
+                'kept': counts[-1],
+                'excluded': {name: count for (name, _sql, _params), count in zip(clauses, counts[1:-1])},
+            })
+        self.env.cr.execute(f"""
+            SELECT index_id, array_agg(embedding_row) FROM codex_document
+            WHERE {base} AND index_id IS NOT NULL AND embedding_row >= 0
+                  {''.join(f' AND {sql}' for _name, sql, _params in clauses)}
+            GROUP BY index_id
+        """, [company_id] + [p for _name, _sql, params in clauses for p in params])
+        return {index_id: np.array(rows, dtype=np.int64) for index_id, rows in self.env.cr.fetchall()}
+
+    @api.model
+    def _lexical_search(self, query_text, company_id, limit, filters=None):
+        """Ids of the active documents matching any term of ``query_text``, best first.
+
+        Ranked by ``ts_rank_cd`` (term proximity and frequency, normalized by
+        document length) over the GIN-indexed ``search_tsv`` column; shared
+        documents and those of ``company_id`` passing ``filters`` are searched.
+        """
+        terms = query_terms(query_text)
+        if not terms:
+            return []
+        clauses = self._filter_clauses(filters)
+        self.flush_model()
+        self.env.cr.execute(f"""
+            SELECT id FROM codex_document, to_tsquery('simple', %s) query
+            WHERE search_tsv @@ query AND active AND (company_id IS NULL OR company_id = %s)
+                  {''.join(f' AND {sql}' for _name, sql, _params in clauses)}
+            ORDER BY ts_rank_cd(search_tsv, query, 1) DESC, id DESC
+            LIMIT %s
+        """, [' | '.join(f"'{term}'" for term in terms), company_id]
+            + [p for _name, _sql, params in clauses for p in params] + [limit])
+        return [row[0] for row in self.env.cr.fetchall()]
+
     def name_get(self):
         return [(r.id, f"{r.title} [{r.model},{r.res_id}]") for r in self]
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        # vectors are kept out of the table and appended to the binary store
+        vals_list = [dict(vals) for vals in vals_list]
+        vectors = [vals.pop('embedding', None) for vals in vals_list]
+        docs = super().create(vals_list)
+        docs._set_vectors(vectors)
+        return docs
+
+    def write(self, vals):
+        vector = vals.get('embedding')
+        if vector:
+            vals = dict(vals)
+            del vals['embedding']
+        moved_vectors = None
+        if 'company_id' in vals and not vector:
+            moved_vectors = self._get_vectors()
+        stores = self.index_id
+        res = super().write(vals)
+        if vector:
+            self._set_vectors([vector] * len(self))
+        elif moved_vectors is not None:
+            self._set_vectors([moved_vectors.get(d.id) for d in self])
+        elif RETRIEVAL_FIELDS & set(vals):
+            stores._bump_generation()
+        return res
+
+    def unlink(self):
+        stores = self.index_id
+        res = super().unlink()
+        stores._bump_generation()
+        return res
+
+    def _set_vectors(self, vectors, embed_model=None, shadow=False):
+        """Append ``vectors`` (one per record, ``None`` to skip) to the stores.
+
+        Records are grouped by company and vector dimension so each group is a
+        single append to the matching ``codex.index`` file. With ``shadow``,
+        the vectors are those of an embeddings model being migrated to and
+        only the ``next_*`` fields are set; otherwise a new current vector
+        also discards the migrated one, which was computed from older text.
+        """
+        embed_model = embed_model or self.env['codex.config']._get().embed_model
+        groups = defaultdict(list)
+        for doc, vec in zip(self, vectors):
+            if vec is not None and len(vec):
+                groups[(doc.company_id.id, len(vec))].append((doc.id, vec))
+        if not groups:
+            return
+        if not embed_model:
+            raise UserError(_('Embeddings model is not set in Settings.'))
+        Index = self.env['codex.index']
+        touched = self.index_id
+        for (company_id, dim), items in groups.items():
+            index = Index._get_for(company_id, embed_model, dim)
+            first = index._append([vec for _id, vec in items])
+            if shadow:
+                assign = "next_index_id = %s, next_embedding_row = v.row"
+            else:
+                assign = "index_id = %s, embedding_row = v.row, next_index_id = NULL, next_embedding_row = -1"
+            self.env.cr.execute(f"""
+                UPDATE codex_document d SET {assign}
+                FROM unnest(%s::int[], %s::int[]) AS v(id, row)
+                WHERE d.id = v.id
+            """, (index.id, [doc_id for doc_id, _vec in items], list(range(first, first + len(items)))))
+            touched |= index
+        self.invalidate_recordset(['index_id', 'embedding_row', 'next_index_id', 'next_embedding_row'])
+        touched._bump_generation()
+
+    def _get_vectors(self):
+        """Return ``{id: vector}`` for these documents, from the store or the legacy JSON."""
+        res = {}
+        for index in self.index_id:
+            res.update(index._read_vectors(self.filtered(lambda d: d.index_id == index)))
+        for doc in self:
+            if doc.id not in res and doc.embedding:
+                res[doc.id] = doc.embedding
+        return res
+
 class ResConfigSettings(models.TransientModel):
     _inherit = 'res.config.settings'
 
     codex_embed_model = fields.Char(
         string='Embeddings Model',
-        help='Model name for embeddings (e.g., text-embedding-3-small).')
+        help='Model name for embeddings (e.g., text-embedding-3-small). Changing it once documents are '
+             'embedded re-embeds them in the background; retrieval switches when all are done.')
+    codex_embed_migration = fields.Char(string='Embeddings Migration', readonly=True)
     codex_rag_models = fields.Char(
         string='Models to Index (CSV)',
         help='Comma-separated list of model names to index, e.g.: helpdesk.ticket,mail.message')
@@ -37,28 +260,118 @@ class ResConfigSettings(models.TransientModel):
     codex_rag_topk = fields.Integer(
         string='Retrieve Top-K', default=5,
         help='How many chunks to retrieve as context.')
-    codex_rag_chunk = fields.Integer(
-        string='Chunk Size (chars)', default=1000,
-        help='Split long texts into chunks of this size.')
+    codex_rag_mode = fields.Selection([
+        ('hybrid', 'Hybrid (full-text + embeddings)'),
+        ('vector', 'Embeddings only'),
+        ('lexical', 'Full-text only'),
+    ], string='Retrieval Mode', default='hybrid',
+        help='Hybrid fuses the full-text and embedding rankings and falls back to full-text '
+             'when the embeddings model is not configured or unavailable. Full-text only never '
+             'calls the embeddings API.')
+    codex_rag_ticket_models = fields.Char(
+        string='Models Searched for Tickets (CSV)',
+        help='Source models of the documents retrieved for a helpdesk ticket, e.g. helpdesk.ticket,knowledge.article. '
+             'Empty: all indexed models.')
+    codex_rag_same_partner = fields.Boolean(
+        string='Same Customer Only',
+        help='For a helpdesk ticket, leave out documents of other customers. Documents without a customer are kept.')
+    codex_rag_max_age_days = fields.Integer(
+        string='Maximum Document Age (days)',
+        help='Leave out documents whose source record is older than this. 0: no limit.')
+    codex_rag_chunk_tokens = fields.Integer(
+        string='Chunk Size (tokens)', default=256,
+        help='Approximate token budget of one chunk. Texts are split between paragraphs, '
+             'then sentences, to stay within it.')
+    codex_rag_chunk_overlap = fields.Integer(
+        string='Chunk Overlap (tokens)', default=32,
+        help='Trailing sentences of a chunk, up to this many tokens, repeated at the start of the next one.')
+    codex_rag_embed_batch_items = fields.Integer(
+        string='Embedding Batch Size', default=64,
+        help='Maximum number of chunks sent in one embeddings request while indexing.')
+    codex_rag_embed_batch_tokens = fields.Integer(
+        string='Embedding Batch Tokens', default=8000,
+        help='Approximate token budget of one embeddings request while indexing.')
+    codex_rag_embed_concurrency = fields.Integer(
+        string='Concurrent Embedding Requests', default=4,
+        help='Embedding batches sent in parallel while indexing. Keep within your provider\'s rate limits.')
+    codex_query_cache_ttl = fields.Integer(
+        string='Query Cache TTL (hours)', default=168,
+        help='How long a query embedding is reused before it is requested again.')
+    codex_rag_result_cache_ttl = fields.Integer(
+        string='Retrieval Cache TTL (seconds)', default=600,
+        help='Retrieval results are reused for this long while the index is unchanged. 0 disables the cache.')
+    codex_query_cache_size = fields.Integer(
+        string='Query Cache Size', default=10000,
+        help='Entries kept by the query embedding cache; the least recently used are dropped first.')
+    codex_rag_ann_nprobe = fields.Integer(
+        string='ANN Probes', default=8,
+        help='Inverted lists scanned per query once a store uses the approximate index. '
+             'Higher values improve recall at the cost of latency.')
+    codex_rag_ann_min_rows = fields.Integer(
+        string='ANN Threshold (chunks)', default=20000,
+        help='Stores with fewer chunks than this are searched exactly.')
 
     def set_values(self):
         super().set_values()
         p = self.env['ir.config_parameter'].sudo()
-        p.set_param('co_codex_assistant.embed_model', self.codex_embed_model or '')
+        Index = self.env['codex.index']
+        embed_model = self.codex_embed_model or ''
+        current = p.get_param('co_codex_assistant.embed_model', '')
+        if embed_model != Index._migration_target():
+            if embed_model and current and embed_model != current \
+                    and Index.sudo().search_count([('embed_model', '=', current)]):
+                # vectors of different models are not comparable: keep searching the
+                # current ones until all documents have a vector of the new model
+                Index._start_migration(embed_model)
+            else:
+                Index._cancel_migration()
+                p.set_param('co_codex_assistant.embed_model', embed_model)
         p.set_param('co_codex_assistant.rag_models', self.codex_rag_models or '')
         p.set_param('co_codex_assistant.rag_fields', self.codex_rag_fields or '')
         p.set_param('co_codex_assistant.rag_topk', str(self.codex_rag_topk or 5))
-        p.set_param('co_codex_assistant.rag_chunk', str(self.codex_rag_chunk or 1000))
+        p.set_param('co_codex_assistant.rag_mode', self.codex_rag_mode or 'hybrid')
+        p.set_param('co_codex_assistant.rag_ticket_models', self.codex_rag_ticket_models or '')
+        p.set_param('co_codex_assistant.rag_same_partner', self.codex_rag_same_partner)
+        p.set_param('co_codex_assistant.rag_max_age_days', str(self.codex_rag_max_age_days or 0))
+        p.set_param('co_codex_assistant.rag_chunk_tokens', str(self.codex_rag_chunk_tokens or 256))
+        p.set_param('co_codex_assistant.rag_chunk_overlap', str(self.codex_rag_chunk_overlap or 0))
+        p.set_param('co_codex_assistant.rag_embed_batch_items', str(self.codex_rag_embed_batch_items or 64))
+        p.set_param('co_codex_assistant.rag_embed_batch_tokens', str(self.codex_rag_embed_batch_tokens or 8000))
+        p.set_param('co_codex_assistant.rag_embed_concurrency', str(self.codex_rag_embed_concurrency or 1))
+        p.set_param('co_codex_assistant.query_cache_ttl', str(self.codex_query_cache_ttl or 0))
+        p.set_param('co_codex_assistant.query_cache_size', str(self.codex_query_cache_size or 0))
+        p.set_param('co_codex_assistant.rag_result_cache_ttl', str(self.codex_rag_result_cache_ttl or 0))
+        p.set_param('co_codex_assistant.rag_ann_nprobe', str(self.codex_rag_ann_nprobe or 8))
+        p.set_param('co_codex_assistant.rag_ann_min_rows', str(self.codex_rag_ann_min_rows or 20000))
 
     @api.model
     def get_values(self):
         res = super().get_values()
         p = self.env['ir.config_parameter'].sudo()
+        Index = self.env['codex.index']
         res.update(
-            codex_embed_model=p.get_param('co_codex_assistant.embed_model', default=''),
+            codex_embed_model=Index._migration_target() or p.get_param('co_codex_assistant.embed_model', default=''),
+            codex_embed_migration=Index._migration_status(),
             codex_rag_models=p.get_param('co_codex_assistant.rag_models', default='helpdesk.ticket,mail.message'),
             codex_rag_fields=p.get_param('co_codex_assistant.rag_fields', default='name,description,body'),
             codex_rag_topk=int(p.get_param('co_codex_assistant.rag_topk', default='5')),
-            codex_rag_chunk=int(p.get_param('co_codex_assistant.rag_chunk', default='1000')),
+            codex_rag_mode=p.get_param('co_codex_assistant.rag_mode', default='hybrid'),
+            codex_rag_ticket_models=p.get_param('co_codex_assistant.rag_ticket_models', default=''),
+            codex_rag_same_partner=bool(p.get_param('co_codex_assistant.rag_same_partner')),
+            codex_rag_max_age_days=int(p.get_param('co_codex_assistant.rag_max_age_days', default='0')),
+            codex_rag_chunk_tokens=int(p.get_param('co_codex_assistant.rag_chunk_tokens', default='256')),
+            codex_rag_chunk_overlap=int(p.get_param('co_codex_assistant.rag_chunk_overlap', default='32')),
+            codex_rag_embed_batch_items=int(p.get_param('co_codex_assistant.rag_embed_batch_items', default='64')),
+            codex_rag_embed_batch_tokens=int(p.get_param('co_codex_assistant.rag_embed_batch_tokens', default='8000')),
+            codex_rag_embed_concurrency=int(p.get_param('co_codex_assistant.rag_embed_concurrency', default='4')),
+            codex_query_cache_ttl=int(p.get_param('co_codex_assistant.query_cache_ttl', default='168')),
+            codex_query_cache_size=int(p.get_param('co_codex_assistant.query_cache_size', default='10000')),
+            codex_rag_result_cache_ttl=int(p.get_param('co_codex_assistant.rag_result_cache_ttl', default='600')),
+            codex_rag_ann_nprobe=int(p.get_param('co_codex_assistant.rag_ann_nprobe', default='8')),
+            codex_rag_ann_min_rows=int(p.get_param('co_codex_assistant.rag_ann_min_rows', default='20000')),
         )
         return res
+
+    def action_codex_cancel_embed_migration(self):
+        self.env['codex.index']._cancel_migration()
+        return {'type': 'ir.actions.client', 'tag': 'reload'}
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Per-worker front of the shared cache: key -> (expires_at, vector)
+_LOCAL = OrderedDict()
+_LOCAL_SIZE = 256
+_LOCAL_LOCK = threading.Lock()
+# Per-worker counters, see CodexEmbeddingCache._stats()
+_COUNTERS = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+
+class CodexEmbeddingCache(models.Model):
+    """Query embeddings shared by all workers, with LRU eviction and a TTL.
+
+    Lookups and inserts run on their own short transaction, so an entry is
+    visible to other workers as soon as it is computed and a wizard opening
+    never holds a lock on the cache table.
+    """
+    _name = 'codex.embedding.cache'
+    _description = 'Codex Query Embedding Cache'
+    _order = 'last_used desc'
+    _log_access = False
+
+    key = fields.Char(required=True, index=True, readonly=True, help='SHA-256 of the embeddings model and text.')
+    embed_model = fields.Char(readonly=True)
+    vector = fields.Json(readonly=True)
+    hits = fields.Integer(default=0, readonly=True)
+    created = fields.Datetime(default=fields.Datetime.now, readonly=True)
+    last_used = fields.Datetime(default=fields.Datetime.now, index=True, readonly=True)
+
+    _sql_constraints = [
+        ('key_uniq', 'unique(key)', 'Embedding cache keys must be unique.'),
+    ]
+
+    @staticmethod
+    def _make_key(text, embed_model):
+        return hashlib.sha256(f"{embed_model}\0{text}".encode()).hexdigest()
+
+    @api.model
+    def _ttl(self):
+        return self.env['codex.config']._get().query_cache_ttl * 3600
+
+    @api.model
+    def _lookup(self, text, embed_model):
+        """Return the cached vector of ``text`` or ``None``."""
+        key = self._make_key(text, embed_model)
+        now = time.time()
+        with _LOCAL_LOCK:
+            entry = _LOCAL.get(key)
+            if entry and entry[0] > now:
+                _LOCAL.move_to_end(key)
+                _COUNTERS['local_hits'] += 1
+                return entry[1]
+        ttl = self._ttl()
+        with self.pool.cursor() as cr:
+            cr.execute("""
+                UPDATE codex_embedding_cache
+                SET hits = hits + 1, last_used = now() AT TIME ZONE 'UTC'
+                WHERE key = %s AND created > (now() AT TIME ZONE 'UTC') - %s * interval '1 second'
+                RETURNING vector, extract(epoch FROM created)
+            """, (key, ttl))
+            row = cr.fetchone()
+        if not row:
+            with _LOCAL_LOCK:
+                _COUNTERS['misses'] += 1
+            return None
+        self._remember(key, row[0], float(row[1]) + ttl)
+        with _LOCAL_LOCK:
+            _COUNTERS['shared_hits'] += 1
+        return row[0]
+
+    @api.model
+    def _store(self, text, embed_model, vector):
+        key = self._make_key(text, embed_model)
+        with self.pool.cursor() as cr:
+            cr.execute("""
+                INSERT INTO codex_embedding_cache (key, embed_model, vector, hits, created, last_used)
+                VALUES (%s, %s, %s, 0, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC')
+                ON CONFLICT (key) DO UPDATE
+                SET vector = EXCLUDED.vector, created = EXCLUDED.created, last_used = EXCLUDED.last_used
+            """, (key, embed_model, json.dumps(vector)))
+        self._remember(key, vector, time.time() + self._ttl())
+
+    @staticmethod
+    def _remember(key, vector, expires_at):
+        with _LOCAL_LOCK:
+            _LOCAL[key] = (expires_at, vector)
+            _LOCAL.move_to_end(key)
+            while len(_LOCAL) > _LOCAL_SIZE:
+                _LOCAL.popitem(last=False)
+
+    @api.model
+    def _stats(self):
+        """Hit/miss counters of this worker since it started."""
+        with _LOCAL_LOCK:
+            stats = dict(_COUNTERS)
+        lookups = sum(stats.values())
+        stats['hit_rate'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+    @api.model
+    def _gc(self):
+        """Drop expired entries, then the least recently used ones beyond the size limit."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        size = int(ICP.get_param('co_codex_assistant.query_cache_size', '10000'))
+        cr = self.env.cr
+        cr.execute("""
+            DELETE FROM codex_embedding_cache
+            WHERE created <= (now() AT TIME ZONE 'UTC') - %s * interval '1 second'
+        """, (self._ttl(),))
+        expired = cr.rowcount
+        cr.execute("""
+            DELETE FROM codex_embedding_cache WHERE id IN (
+                SELECT id FROM codex_embedding_cache ORDER BY last_used DESC OFFSET %s
+            )
+        """, (size,))
+        _logger.info('Codex query cache: %s expired and %s least recently used entries removed; worker stats %s',
+                     expired, cr.rowcount, self._stats())
+        return True
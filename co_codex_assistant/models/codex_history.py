@@ -1,12 +1,23 @@
-﻿from odoo import api, fields, models
+import logging
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+from ..tools.archive import pack_texts, unpack_texts
+
+_logger = logging.getLogger(__name__)
+
+# Columns moved to the archive attachment of a row
+ARCHIVED_FIELDS = ('context', 'response')
+
 
 class CodexHistory(models.Model):
     _name = 'codex.history'
     _description = 'Codex Assistant History'
-    _order = 'create_date desc'
+    _order = 'create_date desc, id desc'
 
     name = fields.Char(string='Title', compute='_compute_name', store=True)
-    user_id = fields.Many2one('res.users', string='User', default=lambda self: self.env.user, index=True)
+    user_id = fields.Many2one('res.users', string='User', default=lambda self: self.env.user)
     ticket_id = fields.Many2one('helpdesk.ticket', string='Helpdesk Ticket')
     channel_id = fields.Many2one('discuss.channel', string='Discuss Channel')
     purpose = fields.Selection([
@@ -19,6 +30,39 @@ class CodexHistory(models.Model):
     response = fields.Text(string='Response')
     input_tokens = fields.Integer('Input Tokens')
     output_tokens = fields.Integer('Output Tokens')
+    api_model = fields.Char('Model', readonly=True, help='Model of the provider that answered.')
+    cached = fields.Boolean('Cached', help='Served from the response cache; no tokens were used.')
+    saved_tokens = fields.Integer('Saved Tokens', help='Input tokens removed by context compression: quotes, signatures, '
+                                                       'repeated lines, RAG documents and text beyond the input budget.')
+    archived_date = fields.Datetime('Archived On', readonly=True,
+                                    help='The context and response were moved to a compressed attachment.')
+    archive_id = fields.Many2one('ir.attachment', string='Archive', readonly=True, ondelete='set null')
+    context_text = fields.Text(string='Context', compute='_compute_archived_texts')
+    response_text = fields.Text(string='Response', compute='_compute_archived_texts')
+
+    def init(self):
+        cr = self.env.cr
+        # the list order, and the lists of a user, ticket or channel
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS codex_history_date_idx ON codex_history (create_date DESC, id DESC)
+        """)
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS codex_history_user_date_idx
+            ON codex_history (user_id, create_date DESC, id DESC)
+        """)
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS codex_history_ticket_date_idx
+            ON codex_history (ticket_id, create_date DESC, id DESC) WHERE ticket_id IS NOT NULL
+        """)
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS codex_history_channel_date_idx
+            ON codex_history (channel_id, create_date DESC, id DESC) WHERE channel_id IS NOT NULL
+        """)
+        # rows still to archive; archived rows leave this index
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS codex_history_unarchived_idx
+            ON codex_history (create_date) WHERE archived_date IS NULL
+        """)
 
     @api.depends('purpose', 'ticket_id', 'channel_id', 'create_date')
     def _compute_name(self):
@@ -27,3 +71,81 @@ class CodexHistory(models.Model):
             target = rec.ticket_id.display_name if rec.ticket_id else (rec.channel_id.display_name if rec.channel_id else 'General')
             rec.name = f"{base} -> {target}"
 
+    @api.depends('context', 'response', 'archive_id')
+    def _compute_archived_texts(self):
+        archives = {attachment.id: unpack_texts(attachment.raw) for attachment in self.archive_id.sudo()}
+        for rec in self:
+            texts = archives.get(rec.archive_id.id, {})
+            rec.context_text = rec.context or texts.get('context')
+            rec.response_text = rec.response or texts.get('response')
+
+    def _archive(self):
+        """Move the context and response of these rows to one gzip'ed attachment each.
+
+        Returns the compressed size, in bytes.
+        """
+        todo = self.filtered(lambda r: any(r[f] for f in ARCHIVED_FIELDS))
+        attachments = self.env['ir.attachment'].sudo().create([{
+            'name': f"codex-history-{rec.id}.json.gz",
+            'res_model': self._name,
+            'res_id': rec.id,
+            'mimetype': 'application/gzip',
+            'raw': pack_texts({f: rec[f] or '' for f in ARCHIVED_FIELDS}),
+        } for rec in todo])
+        archive_ids = dict(zip(todo.ids, attachments.ids))
+        # archiving is not an edit: write_date and write_uid stay as they were
+        self.env.cr.execute("""
+            UPDATE codex_history h
+            SET context = NULL, response = NULL, archived_date = now() AT TIME ZONE 'UTC',
+                archive_id = NULLIF(v.archive_id, 0)
+            FROM unnest(%s::int[], %s::int[]) AS v(id, archive_id)
+            WHERE h.id = v.id
+        """, (self.ids, [archive_ids.get(id_, 0) for id_ in self.ids]))
+        self.invalidate_recordset(['context', 'response', 'archived_date', 'archive_id'])
+        return sum(attachments.mapped('file_size'))
+
+    @api.model
+    def _archive_step(self):
+        """Cron: archive, then delete, one bounded batch of old rows.
+
+        At most ``history_archive_batch`` rows (default 200) older than
+        ``history_archive_days`` (default 90, 0 disables) are archived, and as
+        many older than ``history_retention_days`` (default 0: kept forever)
+        are deleted with their archive. While full batches are found the
+        cron is triggered again, so a backlog is worked off in short
+        transactions.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        batch = max(1, int(ICP.get_param('co_codex_assistant.history_archive_batch', '200')))
+        archive_days = int(ICP.get_param('co_codex_assistant.history_archive_days', '90'))
+        retention_days = int(ICP.get_param('co_codex_assistant.history_retention_days', '0'))
+        now = fields.Datetime.now()
+        cr = self.env.cr
+        more = False
+        if archive_days > 0:
+            cr.execute("""
+                SELECT id FROM codex_history
+                WHERE archived_date IS NULL AND create_date < %s
+                ORDER BY create_date LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (now - timedelta(days=archive_days), batch))
+            records = self.sudo().browse([r[0] for r in cr.fetchall()])
+            if records:
+                size = records._archive()
+                _logger.info('Codex history: %s rows archived (%.1f KB compressed)', len(records), size / 1024)
+                more = len(records) == batch
+        if retention_days > 0:
+            cr.execute("""
+                SELECT id FROM codex_history WHERE create_date < %s
+                ORDER BY create_date LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (now - timedelta(days=retention_days), batch))
+            records = self.sudo().browse([r[0] for r in cr.fetchall()])
+            if records:
+                # unlink() removes the archive attachments too
+                records.unlink()
+                _logger.info('Codex history: %s rows older than %s days deleted', len(records), retention_days)
+                more = more or len(records) == batch
+        if more:
+            self.env.ref('co_codex_assistant.ir_cron_codex_history_archive')._trigger()
+        return True
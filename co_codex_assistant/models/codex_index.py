@@ -0,0 +1,461 @@
+import logging
+import os
+import re
+from datetime import timedelta
+
+import numpy as np
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+from ..tools.embedding_store import EmbeddingStore
+from ..tools.ivf import IVFIndex
+from ..tools.vector_engine import VectorMatrix
+
+_logger = logging.getLogger(__name__)
+
+STORE_DIR = 'codex_rag'
+# Rows copied per block while rewriting a store file
+COPY_BLOCK = 4096
+
+
+class CodexIndex(models.Model):
+    _name = 'codex.index'
+    _description = 'Codex Embedding Store'
+    _order = 'company_id, embed_model'
+
+    name = fields.Char(compute='_compute_name', store=True)
+    company_id = fields.Many2one('res.company', index=True, readonly=True)
+    embed_model = fields.Char(string='Embeddings Model', required=True, index=True, readonly=True)
+    dim = fields.Integer(string='Dimension', required=True, readonly=True)
+    store_fname = fields.Char(string='Store File', readonly=True,
+                              help='Path of the float32 row file, relative to the filestore.')
+    store_version = fields.Integer(default=0, readonly=True)
+    row_count = fields.Integer(string='Rows Written', readonly=True,
+                               help='Rows appended to the store file, including rows no longer used by a document.')
+    generation = fields.Integer(default=0, readonly=True,
+                                help='Bumped whenever the documents of this store change; workers reload on change.')
+    document_ids = fields.One2many('codex.document', 'index_id', string='Documents')
+    document_count = fields.Integer(compute='_compute_document_count')
+    ann_lists = fields.Integer(string='ANN Lists', readonly=True,
+                               help='Inverted lists of the approximate index; 0 means exact (brute-force) search.')
+    ann_trained_rows = fields.Integer(string='ANN Trained On', readonly=True)
+    last_check = fields.Text(string='Last Consistency Check', readonly=True)
+
+    def init(self):
+        # NULL company_id means "shared"; a plain UNIQUE would allow duplicates
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS codex_index_company_model_uniq
+            ON codex_index (COALESCE(company_id, 0), embed_model)
+        """)
+
+    def unlink(self):
+        paths = [path for index in self if index.store_fname
+                 for path in (index._store().path, index._ann_path())]
+        res = super().unlink()
+        for path in paths:
+            self.env.cr.postcommit.add(lambda p=path: _remove_file(p))
+        return res
+
+    @api.depends('company_id', 'embed_model', 'dim')
+    def _compute_name(self):
+        for rec in self:
+            company = rec.company_id.name or _('Shared')
+            rec.name = f"{company} / {rec.embed_model} ({rec.dim})"
+
+    def _compute_document_count(self):
+        data = self.env['codex.document'].with_context(active_test=False)._read_group(
+            [('index_id', 'in', self.ids)], ['index_id'], ['__count'])
+        counts = {index.id: count for index, count in data}
+        for rec in self:
+            rec.document_count = counts.get(rec.id, 0)
+
+    # ------------------------------------------------------------------
+    # Store files
+    # ------------------------------------------------------------------
+    def _make_fname(self, version):
+        self.ensure_one()
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', self.embed_model)
+        return os.path.join(STORE_DIR, str(self.company_id.id or 0), f"{slug}-{self.dim}.{version}.f32")
+
+    def _store(self, fname=None):
+        self.ensure_one()
+        path = os.path.join(self.env['ir.attachment']._filestore(), fname or self.store_fname)
+        return EmbeddingStore(path, self.dim)
+
+    def _ann_path(self, fname=None):
+        return self._store(fname).path + '.ivf.npz'
+
+    def _load_ann(self, fname=None):
+        path = self._ann_path(fname)
+        if not os.path.exists(path):
+            return None
+        try:
+            return IVFIndex.load(path)
+        except (OSError, ValueError, KeyError):
+            _logger.warning('Codex: ignoring unreadable ANN index %s', path, exc_info=True)
+            return None
+
+    @api.model
+    def _get_for(self, company_id, embed_model, dim):
+        index = self.sudo().search([
+            ('company_id', '=', company_id or False),
+            ('embed_model', '=', embed_model),
+        ], limit=1)
+        if index:
+            if index.dim != dim:
+                raise UserError(_('Embeddings model %(model)s returned %(got)s-dimensional vectors, '
+                                  'but its store holds %(dim)s-dimensional ones.',
+                                  model=embed_model, got=dim, dim=index.dim))
+            return index
+        index = self.sudo().create({
+            'company_id': company_id or False,
+            'embed_model': embed_model,
+            'dim': dim,
+        })
+        index.store_fname = index._make_fname(0)
+        return index
+
+    def _append(self, vectors):
+        """Append ``vectors`` to the store file; return the first row number."""
+        self.ensure_one()
+        self._lock()
+        store = self._store()
+        first = store.append(vectors)
+        ann = self._load_ann()
+        if ann is not None:
+            # rows are append-only, so new rows only need their nearest list
+            ann.extend(store.open())
+            ann.save(self._ann_path())
+        self.env.cr.execute(
+            "UPDATE codex_index SET row_count = GREATEST(row_count, %s) WHERE id = %s",
+            (first + len(vectors), self.id))
+        self.invalidate_recordset(['row_count'])
+        return first
+
+    def _lock(self):
+        """Row-lock the stores so appends and compaction never interleave."""
+        self.env.cr.execute("SELECT id FROM codex_index WHERE id IN %s FOR UPDATE", (tuple(self.ids),))
+
+    def _bump_generation(self):
+        if not self:
+            return
+        self.env.cr.execute(
+            "UPDATE codex_index SET generation = generation + 1 WHERE id IN %s", (tuple(self.ids),))
+        self.invalidate_recordset(['generation'])
+
+    def _load_matrix(self):
+        """Map the store read-only and attach the live document id of every row.
+
+        The ANN index is attached once the store reaches the configured
+        threshold; smaller stores are searched exactly.
+        """
+        self.ensure_one()
+        mm = self._store().open()
+        row_ids = np.full(mm.shape[0], -1, dtype=np.int64)
+        self.env.cr.execute("""
+            SELECT embedding_row, id FROM codex_document
+            WHERE index_id = %s AND active AND embedding_row < %s
+        """, (self.id, mm.shape[0]))
+        rows = self.env.cr.fetchall()
+        if rows:
+            arr = np.array(rows, dtype=np.int64)
+            row_ids[arr[:, 0]] = arr[:, 1]
+        ann = self._load_ann() if mm.shape[0] >= self._ann_min_rows() else None
+        return VectorMatrix(row_ids, mm, ann=ann)
+
+    def _read_vectors(self, docs):
+        """Return ``{doc_id: float32 vector}`` for ``docs`` stored in this index."""
+        self.ensure_one()
+        mm = self._store().open()
+        pairs = [(d.id, d.embedding_row) for d in docs if 0 <= d.embedding_row < mm.shape[0]]
+        if not pairs:
+            return {}
+        block = np.array(mm[[row for _id, row in pairs]])
+        return {doc_id: block[n] for n, (doc_id, _row) in enumerate(pairs)}
+
+    # ------------------------------------------------------------------
+    # Commands
+    # ------------------------------------------------------------------
+    def action_compact(self):
+        """Rewrite each store with only the rows still used by a document.
+
+        The new file gets a new version number, so workers still mapping the
+        old one keep a consistent view until this transaction commits; the old
+        file is removed after commit.
+        """
+        Doc = self.env['codex.document'].sudo().with_context(active_test=False)
+        target = self._migration_target()
+        for index in self.sudo():
+            if index.embed_model == target:
+                # rows of a migration target are referenced by next_embedding_row
+                _logger.info('Codex store %s not compacted: embeddings migration in progress', index.name)
+                continue
+            index._lock()
+            docs = Doc.search([('index_id', '=', index.id), ('embedding_row', '>=', 0)], order='embedding_row')
+            old_fname = index.store_fname
+            old_mm = index._store().open()
+            docs = docs.filtered(lambda d: d.embedding_row < old_mm.shape[0])
+            rows = docs.mapped('embedding_row')
+            version = index.store_version + 1
+            new_fname = index._make_fname(version)
+            written = index._store(new_fname).write(
+                old_mm[rows[i:i + COPY_BLOCK]] for i in range(0, len(rows), COPY_BLOCK))
+            ann = index._load_ann()
+            if ann is not None:
+                ann.remap(rows).save(index._ann_path(new_fname))
+            # documents pointing outside the file have lost their vector
+            self.env.cr.execute("""
+                UPDATE codex_document SET embedding_row = -1, index_id = NULL
+                WHERE index_id = %s AND id NOT IN %s
+            """, (index.id, tuple(docs.ids) or (0,)))
+            if docs:
+                self.env.cr.execute("""
+                    UPDATE codex_document d SET embedding_row = v.row
+                    FROM unnest(%s::int[], %s::int[]) AS v(id, row)
+                    WHERE d.id = v.id
+                """, (docs.ids, list(range(len(docs)))))
+            Doc.invalidate_model(['embedding_row', 'index_id'])
+            index.write({'store_fname': new_fname, 'store_version': version, 'row_count': written})
+            index._bump_generation()
+            _logger.info('Codex store %s compacted: %s -> %s rows', index.name, len(old_mm), written)
+            if old_fname and old_fname != new_fname:
+                for old_path in (index._store(old_fname).path, index._ann_path(old_fname)):
+                    self.env.cr.postcommit.add(lambda p=old_path: _remove_file(p))
+        self._maintain_ann()
+        return True
+
+    @api.model
+    def action_rebuild(self):
+        """Move legacy JSON embeddings into the binary stores, then compact all stores."""
+        self._migrate_legacy_embeddings()
+        self.sudo().search([]).action_compact()
+        return True
+
+    @api.model
+    def _migrate_legacy_embeddings(self, batch=500):
+        Doc = self.env['codex.document'].sudo().with_context(active_test=False)
+        moved = 0
+        while True:
+            self.env.cr.execute("""
+                SELECT id FROM codex_document
+                WHERE index_id IS NULL AND embedding IS NOT NULL
+                ORDER BY id LIMIT %s
+            """, (batch,))
+            docs = Doc.browse([r[0] for r in self.env.cr.fetchall()])
+            if not docs:
+                break
+            docs._set_vectors([d.embedding for d in docs])
+            docs.write({'embedding': False})
+            moved += len(docs)
+        if moved:
+            _logger.info('Codex: moved %s legacy JSON embeddings to the binary store', moved)
+        return moved
+
+    @api.model
+    def _ann_min_rows(self):
+        return self.env['codex.config']._get().rag_ann_min_rows
+
+    def action_train_ann(self):
+        """(Re)train the IVF index of each store from its current rows."""
+        for index in self.sudo():
+            index._lock()
+            mm = index._store().open()
+            if not mm.shape[0]:
+                continue
+            ann = IVFIndex.train(mm)
+            ann.save(index._ann_path())
+            index.write({'ann_lists': ann.nlist, 'ann_trained_rows': len(ann)})
+            index._bump_generation()
+            _logger.info('Codex store %s: trained ANN index with %s lists on %s rows',
+                         index.name, ann.nlist, len(ann))
+        return True
+
+    @api.model
+    def _maintain_ann(self):
+        """Train stores that reached the ANN threshold, retrain those that doubled since."""
+        min_rows = self._ann_min_rows()
+        todo = self.sudo().search([]).filtered(
+            lambda i: i.row_count >= min_rows
+            and (not i.ann_lists or i.row_count >= 2 * i.ann_trained_rows))
+        todo.action_train_ann()
+        return todo
+
+    def action_check(self):
+        """Check every store against ``codex.document`` and record the findings."""
+        target = self._migration_target()
+        for index in self.sudo():
+            store = index._store()
+            prefix = 'next_' if index.embed_model == target else ''
+            issues = []
+            size = os.path.getsize(store.path) if os.path.exists(store.path) else 0
+            if size % store.row_bytes:
+                issues.append(_('file size %s is not a multiple of the row size %s', size, store.row_bytes))
+            rows = store.rows
+            self.env.cr.execute(f"""
+                SELECT count(*), count(DISTINCT {prefix}embedding_row),
+                       count(*) FILTER (WHERE {prefix}embedding_row < 0 OR {prefix}embedding_row >= %s),
+                       count(*) FILTER (WHERE active)
+                FROM codex_document WHERE {prefix}index_id = %s
+            """, (rows, index.id))
+            total, distinct, out_of_range, active = self.env.cr.fetchone()
+            if distinct != total:
+                issues.append(_('%s document(s) share a row with another document', total - distinct))
+            if out_of_range:
+                issues.append(_('%s document(s) point outside the file (%s rows)', out_of_range, rows))
+            if rows < index.row_count:
+                issues.append(_('file has %s rows but %s were recorded as written', rows, index.row_count))
+            unused = rows - distinct
+            report = [
+                _('Rows in file: %s', rows),
+                _('Documents: %s (%s active)', total, active),
+                _('Unused rows: %s', max(unused, 0)),
+            ]
+            if prefix:
+                report.append(_('Embeddings migration target: documents are counted by their migration row.'))
+            report += [_('ERROR: %s', issue) for issue in issues] or [_('OK')]
+            index.last_check = '\n'.join(report)
+        return True
+
+    # ------------------------------------------------------------------
+    # Embeddings model migration
+    # ------------------------------------------------------------------
+    @api.model
+    def _migration_target(self):
+        """Embeddings model being migrated to, or an empty string."""
+        return self.env['codex.config']._get().embed_model_next
+
+    @api.model
+    def _migration_todo(self, limit=None):
+        """Ids of the active documents still without a vector of the migration target."""
+        self.env['codex.document'].flush_model(['active', 'body', 'next_index_id'])
+        self.env.cr.execute("""
+            SELECT id FROM codex_document
+            WHERE active AND next_index_id IS NULL AND coalesce(body, '') != ''
+            ORDER BY id
+            LIMIT %s
+        """, (limit,))
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _start_migration(self, embed_model):
+        """Re-embed all documents with ``embed_model`` in the background, then switch to it.
+
+        Until the cutover, retrieval and the indexer keep using the current
+        model and its stores. The new vectors are appended to the stores of
+        ``embed_model`` and referenced by ``next_index_id``, so vectors of
+        the two models are never searched together.
+        """
+        self._cancel_migration()
+        self.env['ir.config_parameter'].sudo().set_param('co_codex_assistant.embed_model_next', embed_model)
+        self.env.ref('co_codex_assistant.ir_cron_codex_migrate_embeddings').sudo()._trigger()
+        _logger.info('Codex: embeddings migration to %s started', embed_model)
+
+    @api.model
+    def _cancel_migration(self):
+        """Forget the vectors computed for the migration target and drop its stores."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        target = self._migration_target()
+        self.env['codex.document'].flush_model(['next_index_id', 'next_embedding_row'])
+        self.env.cr.execute("""
+            UPDATE codex_document SET next_index_id = NULL, next_embedding_row = -1
+            WHERE next_index_id IS NOT NULL
+        """)
+        self.env['codex.document'].invalidate_model(['next_index_id', 'next_embedding_row'])
+        if target and target != ICP.get_param('co_codex_assistant.embed_model', ''):
+            self.sudo().search([('embed_model', '=', target)]).unlink()
+        if target:
+            ICP.set_param('co_codex_assistant.embed_model_next', '')
+            _logger.info('Codex: embeddings migration to %s cancelled', target)
+
+    @api.model
+    def _migrate_step(self):
+        """Cron step of the migration: embed one batch of documents with the target model.
+
+        ``rag_migrate_batch`` documents (default 500) are embedded per run,
+        then the cron is re-triggered ``rag_migrate_pause`` seconds later
+        (default 60), which bounds both the transaction and the load on the
+        embeddings provider. The run that finds nothing left does the cutover.
+        """
+        target = self._migration_target()
+        if not target:
+            return False
+        ICP = self.env['ir.config_parameter'].sudo()
+        batch = max(1, int(ICP.get_param('co_codex_assistant.rag_migrate_batch', '500')))
+        pause = max(0, int(ICP.get_param('co_codex_assistant.rag_migrate_pause', '60')))
+        Doc = self.env['codex.document'].sudo().with_context(active_test=False)
+        docs = Doc.browse(self._migration_todo(batch))
+        if docs:
+            stats = {}
+            vectors = self.env['codex.client']._embed_many(docs.mapped('body'), embed_model=target, stats=stats)
+            docs._set_vectors(vectors, embed_model=target, shadow=True)
+            left = len(self._migration_todo())
+            _logger.info('Codex: embeddings migration to %s: %s documents embedded in %.1fs, %s left',
+                         target, len(docs), stats.get('wall', 0.0), left)
+            if left:
+                self.env.ref('co_codex_assistant.ir_cron_codex_migrate_embeddings')._trigger(
+                    fields.Datetime.now() + timedelta(seconds=pause))
+                return True
+        return self._cutover_migration()
+
+    @api.model
+    def _cutover_migration(self):
+        """Switch documents, retrieval and the indexer to the migration target in one transaction.
+
+        The current stores are locked first, so the indexer cannot add an
+        old-model vector between the last check and the switch. Archived
+        documents without a target vector lose their vector; the indexer
+        embeds them again if their record comes back.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        target = self._migration_target()
+        if not target:
+            return False
+        old = self.sudo().search([('embed_model', '!=', target)])
+        if old:
+            old._lock()
+        if self._migration_todo(1):
+            self.env.ref('co_codex_assistant.ir_cron_codex_migrate_embeddings')._trigger()
+            return False
+        Doc = self.env['codex.document']
+        Doc.flush_model()
+        self.env.cr.execute("""
+            UPDATE codex_document
+            SET index_id = next_index_id, embedding_row = next_embedding_row,
+                next_index_id = NULL, next_embedding_row = -1
+            WHERE index_id IS NOT NULL OR next_index_id IS NOT NULL
+        """)
+        Doc.invalidate_model(['index_id', 'embedding_row', 'next_index_id', 'next_embedding_row'])
+        previous = ICP.get_param('co_codex_assistant.embed_model', '')
+        ICP.set_param('co_codex_assistant.embed_model', target)
+        ICP.set_param('co_codex_assistant.embed_model_next', '')
+        self.sudo().search([('embed_model', '=', target)])._bump_generation()
+        old.unlink()
+        _logger.info('Codex: embeddings migration from %s to %s done', previous or '-', target)
+        return True
+
+    @api.model
+    def _migration_status(self):
+        """Progress of the running migration, for the settings, or an empty string."""
+        target = self._migration_target()
+        if not target:
+            return ''
+        self.env['codex.document'].flush_model(['active', 'body', 'next_index_id'])
+        self.env.cr.execute("""
+            SELECT count(*) FILTER (WHERE next_index_id IS NOT NULL), count(*)
+            FROM codex_document WHERE active AND coalesce(body, '') != ''
+        """)
+        done, total = self.env.cr.fetchone()
+        return _('Re-embedding with %(model)s: %(done)s of %(total)s documents. '
+                 'Retrieval uses %(current)s until all are done.',
+                 model=target, done=done, total=total,
+                 current=self.env['ir.config_parameter'].sudo().get_param('co_codex_assistant.embed_model', ''))
+
+
+def _remove_file(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        _logger.warning('Codex: could not remove old store file %s', path, exc_info=True)
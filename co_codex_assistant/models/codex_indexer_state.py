@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+
+class CodexIndexerState(models.Model):
+    _name = 'codex.indexer.state'
+    _description = 'Codex RAG Indexer State'
+    _rec_name = 'model'
+    _order = 'model'
+
+    model = fields.Char(required=True, index=True, readonly=True)
+    field_set = fields.Char(readonly=True, help='Sorted, comma separated fields indexed for this model.')
+    chunker = fields.Char(readonly=True, help='Chunking strategy and parameters used for this model.')
+    watermark = fields.Datetime(readonly=True, help='write_date of the last record indexed.')
+    watermark_id = fields.Integer(readonly=True, help='Id of the last record indexed (tie-breaker on equal write_date).')
+    last_run = fields.Datetime(readonly=True)
+    last_error = fields.Text(readonly=True, help='Error of the last slice that failed; cleared by the next one that succeeds.')
+    pending_count = fields.Integer(string='Pending', compute='_compute_pending_count',
+                                   help='Records written after the watermark, still to be indexed.')
+
+    _sql_constraints = [
+        ('model_uniq', 'unique(model)', 'There is already an indexer state for this model.'),
+    ]
+
+    def _compute_pending_count(self):
+        for state in self:
+            if state.model in self.env:
+                state.pending_count = self.env[state.model].search_count(state._pending_domain())
+            else:
+                state.pending_count = 0
+
+    @api.model
+    def _get_for(self, model_name, field_set, chunker=None):
+        state = self.sudo().search([('model', '=', model_name)], limit=1)
+        if not state:
+            return self.sudo().create({'model': model_name, 'field_set': field_set, 'chunker': chunker})
+        if state.field_set != field_set or state.chunker != chunker:
+            # different fields or chunking means different chunks: start over
+            state.write({'field_set': field_set, 'chunker': chunker, 'watermark': False, 'watermark_id': 0})
+        return state
+
+    def _pending_domain(self, margin=0):
+        """Domain of records written after the watermark.
+
+        ``write_date`` is the start time of the writing transaction, so a
+        record committed after the watermark passed that time is missed by
+        the strict domain. With ``margin`` (minutes), the records written
+        in the last ``margin`` minutes before the watermark are included
+        again; their unchanged chunks are not re-embedded.
+        """
+        self.ensure_one()
+        if not self.watermark:
+            return []
+        if margin > 0:
+            return [('write_date', '>', self.watermark - timedelta(minutes=margin))]
+        return ['|', ('write_date', '>', self.watermark),
+                '&', ('write_date', '=', self.watermark), ('id', '>', self.watermark_id)]
+
+    def _advance(self, record):
+        """Move the watermark to ``record``, never back: a slice re-checking
+        the margin may end before the current watermark."""
+        self.ensure_one()
+        values = {'last_run': fields.Datetime.now(), 'last_error': False}
+        if not self.watermark or (record.write_date, record.id) > (self.watermark, self.watermark_id):
+            values.update(watermark=record.write_date, watermark_id=record.id)
+        self.write(values)
+
+    @api.model
+    def _record_error(self, model_name, message):
+        """Keep the error of a failed slice on the state of ``model_name``; its watermark stays."""
+        self.sudo().search([('model', '=', model_name)], limit=1).write({
+            'last_error': message,
+            'last_run': fields.Datetime.now(),
+        })
+
+    def action_reset(self):
+        """Forget the watermark so the next run re-checks every record."""
+        self.write({'watermark': False, 'watermark_id': 0})
+        return True
@@ -0,0 +1,263 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# pg_advisory_xact_lock key serializing the claim step of all job workers
+CLAIM_LOCK = 0x636F646578  # 'codex'
+
+
+class CodexJob(models.Model):
+    """A generation queued by the wizard and run by the job cron.
+
+    The cron claims queued jobs under an advisory lock so several cron
+    workers can share the queue, within the global and per-user
+    concurrency limits, and runs ``codex.client.generate`` for each claimed
+    job in a thread with its own cursor. Web workers only insert the job.
+    """
+    _name = 'codex.job'
+    _description = 'Codex Generation Job'
+    _order = 'id desc'
+
+    name = fields.Char(required=True, readonly=True)
+    user_id = fields.Many2one('res.users', string='User', required=True, index=True, readonly=True,
+                              default=lambda self: self.env.user)
+    state = fields.Selection([
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], default='queued', required=True, index=True, readonly=True)
+    messages = fields.Json(readonly=True)
+    options = fields.Json(readonly=True, help='Keyword arguments passed to codex.client.generate.')
+    wizard_id = fields.Integer(readonly=True, help='Wizard waiting for the result, if still open.')
+    ticket_id = fields.Many2one('helpdesk.ticket', string='Helpdesk Ticket', readonly=True)
+    channel_id = fields.Many2one('discuss.channel', string='Discuss Channel', readonly=True)
+    purpose = fields.Selection([
+        ('reply', 'Reply Draft'),
+        ('summary', 'Summary'),
+        ('report', 'Report'),
+    ], readonly=True)
+    prompt = fields.Text(readonly=True)
+    context = fields.Text(readonly=True)
+    saved_tokens = fields.Integer(readonly=True, help='Tokens saved while building the context.')
+    history_id = fields.Many2one('codex.history', string='History', readonly=True, ondelete='set null')
+    error = fields.Text(readonly=True)
+    attempts = fields.Integer(default=0, readonly=True)
+    batch_id = fields.Many2one('codex.batch', string='Batch', index=True, readonly=True, ondelete='cascade')
+    notify = fields.Boolean(default=True, readonly=True, help='Notify the user when the job ends.')
+    date_started = fields.Datetime(readonly=True)
+    date_done = fields.Datetime(readonly=True)
+
+    @api.model
+    def _submit(self, messages, values, **options):
+        """Queue a generation of ``messages`` and wake the job cron up."""
+        return self._submit_many([(messages, values)], **options)
+
+    @api.model
+    def _submit_many(self, items, **options):
+        """Queue one generation per ``(messages, values)`` of ``items`` in one insert."""
+        jobs = self.sudo().create([dict(values, messages=messages, options=options or {})
+                                   for messages, values in items])
+        self.env.ref('co_codex_assistant.ir_cron_codex_jobs').sudo()._trigger()
+        return jobs
+
+    def _limits(self):
+        conf = self.env['codex.config']._get()
+        return conf.job_concurrency, conf.job_user_concurrency, conf.job_batch_concurrency
+
+    @api.model
+    def _claim(self, slots):
+        """Mark up to ``slots`` queued jobs as running and return their ids.
+
+        Runs on its own transaction, committed at once, so other workers see
+        the jobs as running. Claims are serialized by a transaction-level
+        advisory lock. The per-user limit is applied in SQL, before the
+        oldest jobs are picked: a user with many queued jobs does not hide
+        the jobs of the others.
+
+        Jobs of a batch form a lane of their own: they do not count against
+        their user's limit, run at most ``job_batch_concurrency`` at once,
+        and are only claimed when no interactive job can be.
+        """
+        max_jobs, max_per_user, max_batch = self._limits()
+        with self.pool.cursor() as cr:
+            cr.execute("SELECT pg_advisory_xact_lock(%s)", (CLAIM_LOCK,))
+            cr.execute("SELECT user_id, count(*) FROM codex_job WHERE state = 'running' GROUP BY user_id")
+            running = dict(cr.fetchall())
+            slots = min(slots, max_jobs - sum(running.values()))
+            if slots <= 0:
+                return []
+            # the lane of a job: its user, or NULL for all batch jobs
+            cr.execute("""
+                WITH running AS (
+                    SELECT batch_id IS NOT NULL AS batch, CASE WHEN batch_id IS NULL THEN user_id END AS lane,
+                           count(*) AS n
+                    FROM codex_job
+                    WHERE state = 'running'
+                    GROUP BY 1, 2
+                )
+                SELECT queued.id
+                FROM (
+                    SELECT id, batch_id IS NOT NULL AS batch, CASE WHEN batch_id IS NULL THEN user_id END AS lane,
+                           row_number() OVER (PARTITION BY batch_id IS NOT NULL,
+                                                           CASE WHEN batch_id IS NULL THEN user_id END
+                                              ORDER BY id) AS rn
+                    FROM codex_job
+                    WHERE state = 'queued'
+                ) queued
+                LEFT JOIN running ON running.batch = queued.batch AND running.lane IS NOT DISTINCT FROM queued.lane
+                WHERE queued.rn <= CASE WHEN queued.batch THEN %s ELSE %s END - coalesce(running.n, 0)
+                ORDER BY queued.batch, queued.id
+                LIMIT %s
+            """, (max_batch, max_per_user, slots))
+            claimed = [job_id for job_id, in cr.fetchall()]
+            if claimed:
+                cr.execute("""
+                    UPDATE codex_job
+                    SET state = 'running', attempts = attempts + 1,
+                        date_started = now() AT TIME ZONE 'UTC'
+                    WHERE id IN %s
+                """, (tuple(claimed),))
+        return claimed
+
+    @api.model
+    def _requeue_stale(self):
+        """Put back jobs left running by a worker that died; fail them after 3 attempts.
+
+        A run lasts ``job_run_seconds`` and a completion at most ``timeout``,
+        so a job still running after twice the longest of both was lost.
+        """
+        conf = self.env['codex.config']._get()
+        stale = max(conf.job_run_seconds, conf.timeout) * 2
+        self.env.cr.execute("""
+            UPDATE codex_job
+            SET state = CASE WHEN attempts >= 3 THEN 'failed' ELSE 'queued' END,
+                error = CASE WHEN attempts >= 3 THEN 'Worker lost' ELSE error END
+            WHERE state = 'running'
+              AND date_started < (now() AT TIME ZONE 'UTC') - %s * interval '1 second'
+        """, (stale,))
+        if self.env.cr.rowcount:
+            _logger.warning('Codex jobs: %s stale running jobs requeued or failed', self.env.cr.rowcount)
+
+    @api.model
+    def _run_jobs(self, max_seconds=None):
+        """Cron entry point: run queued jobs for at most ``max_seconds``.
+
+        Defaults to ``co_codex_assistant.job_run_seconds``, which must stay
+        below the cron time limit (``limit_time_real_cron``, else
+        ``limit_time_real``). Jobs are only claimed while they can finish
+        within that time, a completion lasting at most ``timeout``; the run
+        then waits for the running ones and re-triggers itself when jobs
+        are still queued.
+        """
+        conf = self.env['codex.config']._get()
+        self._requeue_stale()
+        self.env.cr.execute("""
+            DELETE FROM codex_job
+            WHERE state IN ('done', 'failed')
+              AND date_done < (now() AT TIME ZONE 'UTC') - interval '7 days'
+        """)
+        self.env.cr.execute("""
+            DELETE FROM codex_batch b
+            WHERE create_date < (now() AT TIME ZONE 'UTC') - interval '7 days'
+              AND NOT EXISTS (SELECT 1 FROM codex_job j WHERE j.batch_id = b.id)
+        """)
+        self.env.cr.commit()
+        max_jobs = self._limits()[0]
+        deadline = time.monotonic() + (max_seconds or conf.job_run_seconds) - conf.timeout
+        started = 0
+        with ThreadPoolExecutor(max_workers=max(max_jobs, 1)) as pool:
+            pending = set()
+            while True:
+                pending = {f for f in pending if not f.done()}
+                job_ids = []
+                # the first claim always happens, even with a timeout longer than the run
+                if not started or time.monotonic() < deadline:
+                    job_ids = self._claim(max_jobs - len(pending))
+                pending.update(pool.submit(self._run_one, job_id) for job_id in job_ids)
+                if not pending:
+                    break
+                started += len(job_ids)
+                time.sleep(0.5)
+        self.env.cr.execute("SELECT 1 FROM codex_job WHERE state = 'queued' LIMIT 1")
+        if self.env.cr.fetchone():
+            self.env.ref('co_codex_assistant.ir_cron_codex_jobs')._trigger()
+        _logger.info('Codex jobs: %s jobs run', started)
+        return True
+
+    def _run_one(self, job_id):
+        """Run one claimed job, on a cursor of this thread and as the job's user."""
+        try:
+            with self.pool.cursor() as cr:
+                env = api.Environment(cr, self.env.uid, self.env.context)
+                job = env['codex.job'].browse(job_id)
+                try:
+                    out = job.with_user(job.user_id).env['codex.client'].generate(
+                        job.messages, **dict({'purpose': job.purpose}, **(job.options or {})))
+                except Exception as e:
+                    _logger.warning('Codex job %s failed: %s', job_id, e)
+                    cr.rollback()
+                    job._fail(str(e))
+                    return
+                job._finish(out)
+        except Exception:
+            _logger.exception('Codex job %s could not be saved', job_id)
+
+    def _finish(self, out):
+        self.ensure_one()
+        text = out.get('text') or ''
+        history = self.env['codex.history'].sudo().create({
+            'user_id': self.user_id.id,
+            'ticket_id': self.ticket_id.id,
+            'channel_id': self.channel_id.id,
+            'purpose': self.purpose or 'reply',
+            'prompt': self.prompt,
+            'context': self.context,
+            'response': text,
+            'input_tokens': out.get('input_tokens') or 0,
+            'output_tokens': out.get('output_tokens') or 0,
+            'api_model': out.get('model'),
+            'cached': bool(out.get('cached')),
+            'saved_tokens': self.saved_tokens + (out.get('saved_tokens') or 0),
+        })
+        self.write({'state': 'done', 'history_id': history.id, 'error': False,
+                    'date_done': fields.Datetime.now()})
+        wizard = self.env['codex.generate.wizard'].sudo().browse(self.wizard_id).exists()
+        if wizard:
+            wizard.write({'result': text})
+        self._notify()
+
+    def _fail(self, message):
+        self.ensure_one()
+        self.write({'state': 'failed', 'error': message, 'date_done': fields.Datetime.now()})
+        self._notify()
+
+    def _notify(self):
+        if not self.notify:
+            return
+        self.env['bus.bus']._sendone(self.user_id.partner_id, 'codex.job/done', {
+            'job_id': self.id,
+            'name': self.name,
+            'state': self.state,
+            'error': self.error or False,
+            'history_id': self.history_id.id,
+            'wizard_id': self.wizard_id,
+        })
+
+    def action_retry(self):
+        self.filtered(lambda j: j.state == 'failed').write({'state': 'queued', 'error': False, 'attempts': 0})
+        self.env.ref('co_codex_assistant.ir_cron_codex_jobs').sudo()._trigger()
+        return True
+
+    def action_open_history(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'codex.history',
+            'view_mode': 'form',
+            'res_id': self.history_id.id,
+        }
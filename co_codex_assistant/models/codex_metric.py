@@ -0,0 +1,167 @@
+import json
+import logging
+import threading
+from datetime import datetime
+
+from odoo import api, fields, models
+from odoo.modules.registry import Registry
+
+from ..tools.metrics import empty_histogram, histogram_percentile, latency_bucket
+
+_logger = logging.getLogger(__name__)
+
+# Measurements of this worker not written yet: dbname -> {aggregate key: totals}
+_PENDING = {}
+_PENDING_LOCK = threading.Lock()
+# dbname -> timer writing _PENDING[dbname]
+_TIMERS = {}
+# A measurement is written at most this many seconds after it was taken
+FLUSH_SECONDS = 30
+
+OPERATIONS = [
+    ('generate', 'Generation'),
+    ('embed', 'Embeddings'),
+    ('retrieve', 'Retrieval'),
+]
+COUNTERS = ('calls', 'errors', 'cache_hits', 'retries', 'wall_ms', 'upstream_ms',
+            'sent_kb', 'received_kb', 'input_tokens', 'output_tokens')
+
+
+def record_metric(dbname, operation, meter, user_id, purpose=None, model=None, error=False, cached=False,
+                  input_tokens=0, output_tokens=0):
+    """Add one measurement of ``operation`` to this worker's pending aggregates.
+
+    Does not touch the database, so it is safe to call from worker threads
+    and from streaming responses; the aggregates are written by a timer.
+    """
+    wall_ms = meter.wall * 1000
+    bucket = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    key = (bucket, operation, user_id or None, purpose or None, model or None, meter.endpoint)
+    with _PENDING_LOCK:
+        pending = _PENDING.setdefault(dbname, {})
+        totals = pending.get(key)
+        if totals is None:
+            totals = pending[key] = dict.fromkeys(COUNTERS, 0)
+            totals['latency_hist'] = empty_histogram()
+        totals['calls'] += 1
+        totals['errors'] += int(bool(error))
+        totals['cache_hits'] += int(bool(cached))
+        totals['retries'] += meter.retries
+        totals['wall_ms'] += wall_ms
+        totals['upstream_ms'] += meter.upstream * 1000
+        totals['sent_kb'] += meter.bytes_sent / 1024
+        totals['received_kb'] += meter.bytes_received / 1024
+        totals['input_tokens'] += input_tokens or 0
+        totals['output_tokens'] += output_tokens or 0
+        totals['latency_hist'][latency_bucket(wall_ms)] += 1
+        if dbname not in _TIMERS:
+            timer = threading.Timer(FLUSH_SECONDS, _write_pending, (dbname,))
+            timer.daemon = True
+            _TIMERS[dbname] = timer
+            timer.start()
+
+
+def _write_pending(dbname):
+    with _PENDING_LOCK:
+        timer = _TIMERS.pop(dbname, None)
+        pending = _PENDING.pop(dbname, None)
+    if timer:
+        timer.cancel()
+    if not pending:
+        return
+    try:
+        with Registry(dbname).cursor() as cr:
+            CodexMetric._upsert(cr, pending)
+    except Exception:
+        _logger.warning('Codex: could not write %s usage aggregates', len(pending), exc_info=True)
+
+
+class CodexMetric(models.Model):
+    """Usage and latency of the Codex calls, aggregated per hour.
+
+    One row per (hour, operation, user, purpose, model, endpoint) sums the
+    calls, errors, cache hits, retries, wall and upstream time, bytes and
+    tokens, and keeps a latency histogram from which percentiles are
+    estimated. Each worker aggregates in memory and writes its totals with
+    one upsert per row every ``FLUSH_SECONDS`` at most.
+    """
+    _name = 'codex.metric'
+    _description = 'Codex Usage Metrics'
+    _order = 'bucket desc, operation'
+    _log_access = False
+
+    bucket = fields.Datetime(string='Hour', required=True, index=True, readonly=True)
+    operation = fields.Selection(OPERATIONS, required=True, readonly=True)
+    user_id = fields.Many2one('res.users', string='User', index=True, readonly=True, ondelete='set null')
+    purpose = fields.Selection([
+        ('reply', 'Reply Draft'),
+        ('summary', 'Summary'),
+        ('report', 'Report'),
+    ], readonly=True)
+    api_model = fields.Char(string='Model', readonly=True)
+    endpoint = fields.Char(readonly=True, help='Provider endpoint called: completions (chat), responses or embeddings.')
+    calls = fields.Integer(readonly=True)
+    errors = fields.Integer(readonly=True)
+    cache_hits = fields.Integer(readonly=True)
+    retries = fields.Integer(readonly=True)
+    wall_ms = fields.Float(string='Wall Time (ms)', readonly=True, digits=(16, 1))
+    upstream_ms = fields.Float(string='Upstream Time (ms)', readonly=True, digits=(16, 1),
+                               help='Time spent waiting for the provider, retries included.')
+    sent_kb = fields.Float(string='Sent (KB)', readonly=True, digits=(16, 1))
+    received_kb = fields.Float(string='Received (KB)', readonly=True, digits=(16, 1))
+    input_tokens = fields.Integer(readonly=True)
+    output_tokens = fields.Integer(readonly=True)
+    latency_hist = fields.Json(readonly=True, help='Calls per wall time bucket, see tools.metrics.LATENCY_BOUNDS_MS.')
+    avg_ms = fields.Float(string='Average (ms)', compute='_compute_latency', digits=(16, 1))
+    p50_ms = fields.Float(string='p50 (ms)', compute='_compute_latency', digits=(16, 1))
+    p95_ms = fields.Float(string='p95 (ms)', compute='_compute_latency', digits=(16, 1))
+
+    def init(self):
+        # NULL user/purpose/model/endpoint are values of their own for the upsert
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS codex_metric_key_uniq
+            ON codex_metric (bucket, operation, COALESCE(user_id, 0), COALESCE(purpose, ''),
+                             COALESCE(api_model, ''), COALESCE(endpoint, ''))
+        """)
+
+    @api.depends('calls', 'wall_ms', 'latency_hist')
+    def _compute_latency(self):
+        for rec in self:
+            rec.avg_ms = rec.wall_ms / rec.calls if rec.calls else 0.0
+            rec.p50_ms = histogram_percentile(rec.latency_hist, 50)
+            rec.p95_ms = histogram_percentile(rec.latency_hist, 95)
+
+    @staticmethod
+    def _upsert(cr, pending):
+        """Add the ``{key: totals}`` of ``record_metric`` to their rows."""
+        for (bucket, operation, user_id, purpose, model, endpoint), totals in pending.items():
+            cr.execute(f"""
+                INSERT INTO codex_metric (bucket, operation, user_id, purpose, api_model, endpoint,
+                                          {', '.join(COUNTERS)}, latency_hist)
+                VALUES (%s, %s, %s, %s, %s, %s, {', '.join(['%s'] * len(COUNTERS))}, %s::jsonb)
+                ON CONFLICT (bucket, operation, COALESCE(user_id, 0), COALESCE(purpose, ''),
+                             COALESCE(api_model, ''), COALESCE(endpoint, ''))
+                DO UPDATE SET {', '.join(f'{c} = codex_metric.{c} + EXCLUDED.{c}' for c in COUNTERS)},
+                    latency_hist = (
+                        SELECT jsonb_agg(COALESCE((codex_metric.latency_hist ->> n)::int, 0)
+                                         + (EXCLUDED.latency_hist ->> n)::int ORDER BY n)
+                        FROM generate_series(0, jsonb_array_length(EXCLUDED.latency_hist) - 1) n
+                    )
+            """, [bucket, operation, user_id, purpose, model, endpoint]
+                + [totals[c] for c in COUNTERS] + [json.dumps(totals['latency_hist'])])
+
+    @api.model
+    def _flush_pending(self):
+        """Write this worker's pending measurements now (e.g. before reading the aggregates)."""
+        _write_pending(self.env.cr.dbname)
+
+    @api.model
+    def _gc(self):
+        """Drop the aggregates older than ``metric_retention_days`` (default 90)."""
+        days = int(self.env['ir.config_parameter'].sudo().get_param('co_codex_assistant.metric_retention_days', '90'))
+        if days > 0:
+            self.env.cr.execute("""
+                DELETE FROM codex_metric WHERE bucket < (now() AT TIME ZONE 'UTC') - %s * interval '1 day'
+            """, (days,))
+            _logger.info('Codex metrics: %s old hourly aggregates removed', self.env.cr.rowcount)
+        return True
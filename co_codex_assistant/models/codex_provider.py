@@ -0,0 +1,73 @@
+from odoo import api, fields, models, tools
+
+from ..tools.router import DEFAULT_WEIGHT
+from .codex_client import ROUTER, _router_key
+
+
+class CodexProvider(models.Model):
+    """Additional LLM endpoint the generations are routed to.
+
+    The provider of the settings is always part of the pool; these ones are
+    added to it. ``codex.client`` tries them in an order drawn from their
+    weight and the latency and error rate observed by this worker, see
+    ``tools.router.Router``.
+    """
+    _name = 'codex.provider'
+    _description = 'Codex LLM Provider'
+    _order = 'sequence, id'
+
+    name = fields.Char(required=True)
+    sequence = fields.Integer(default=10)
+    active = fields.Boolean(default=True)
+    api_base = fields.Char(string='API Base URL', required=True,
+                           help='Base URL of an OpenAI-compatible provider (e.g., https://api.openai.com/v1).')
+    api_model = fields.Char(string='Model', required=True)
+    api_key = fields.Char(string='API Key', required=True, groups='base.group_system')
+    weight = fields.Integer(default=DEFAULT_WEIGHT, required=True,
+                            help=f'Share of the calls relative to the other providers, at equal latency. '
+                                 f'The provider of the settings weighs {DEFAULT_WEIGHT}.')
+    router_state = fields.Selection([
+        ('closed', 'Available'),
+        ('half_open', 'Probing'),
+        ('open', 'Circuit Open'),
+    ], string='State', compute='_compute_router', help='As seen by the worker serving this page.')
+    router_latency_ms = fields.Float(string='Latency (ms)', compute='_compute_router', digits=(16, 1),
+                                     help='Exponentially weighted average of the recent successful calls.')
+    router_error_rate = fields.Float(string='Error Rate', compute='_compute_router',
+                                     help='Exponentially weighted share of the recent calls that failed.')
+
+    _sql_constraints = [
+        ('weight_positive', 'CHECK(weight > 0)', 'The weight of a provider must be positive.'),
+    ]
+
+    def _compute_router(self):
+        for rec in self:
+            stats = ROUTER.snapshot(_router_key((rec.api_base or '').rstrip('/'), rec.api_model))
+            rec.router_state = stats['state']
+            rec.router_latency_ms = stats['latency_ms']
+            rec.router_error_rate = stats['error_rate']
+
+    @api.model
+    @tools.ormcache()
+    def _get_pool(self):
+        """``(api_base, model, api_key, weight)`` of the active providers, cached like the settings."""
+        return tuple(
+            (p.api_base.rstrip('/'), p.api_model, p.api_key, p.weight)
+            for p in self.sudo().search([])
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# In-flight generations of this worker: key -> [lock, waiters]
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+# Seconds between two attempts of a waiting caller to take the lock of another worker
+INFLIGHT_POLL = 0.25
+
+
+class CodexResponseCache(models.Model):
+    """Completions of deterministic requests, shared by all workers.
+
+    Like the query embedding cache, reads and writes use their own short
+    transaction so a result is visible to other workers immediately.
+    """
+    _name = 'codex.response.cache'
+    _description = 'Codex Response Cache'
+    _order = 'last_used desc'
+    _log_access = False
+
+    key = fields.Char(required=True, index=True, readonly=True,
+                      help='SHA-256 of the normalized messages, model, temperature and max tokens.')
+    api_model = fields.Char(string='Model', readonly=True)
+    text = fields.Text(readonly=True)
+    input_tokens = fields.Integer(readonly=True, help='Tokens used by the original, uncached call.')
+    output_tokens = fields.Integer(readonly=True)
+    hits = fields.Integer(default=0, readonly=True)
+    created = fields.Datetime(default=fields.Datetime.now, readonly=True)
+    last_used = fields.Datetime(default=fields.Datetime.now, index=True, readonly=True)
+
+    _sql_constraints = [
+        ('key_uniq', 'unique(key)', 'Response cache keys must be unique.'),
+    ]
+
+    @staticmethod
+    def _make_key(request, messages):
+        normalized = [
+            {'role': m.get('role'), 'content': re.sub(r'\s+', ' ', m.get('content') or '').strip()}
+            for m in messages
+        ]
+        blob = json.dumps({
+            'api_base': request['api_base'],
+            'model': request['model'],
+            'temperature': float(request['temperature'] or 0),
+            'max_tokens': int(request['max_tokens'] or 0),
+            'messages': normalized,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    @api.model
+    def _ttl(self):
+        return self.env['codex.config']._get().response_cache_ttl * 3600
+
+    @api.model
+    def _lookup(self, key):
+        """Return a ``generate()`` result for ``key`` (zero tokens, ``cached`` set) or ``None``."""
+        with self.pool.cursor() as cr:
+            cr.execute("""
+                UPDATE codex_response_cache
+                SET hits = hits + 1, last_used = now() AT TIME ZONE 'UTC'
+                WHERE key = %s AND created > (now() AT TIME ZONE 'UTC') - %s * interval '1 second'
+                RETURNING text, api_model
+            """, (key, self._ttl()))
+            row = cr.fetchone()
+        if not row:
+            return None
+        return {'text': row[0], 'model': row[1], 'input_tokens': 0, 'output_tokens': 0, 'raw': None, 'cached': True}
+
+    @api.model
+    def _store(self, key, api_model, out):
+        with self.pool.cursor() as cr:
+            cr.execute("""
+                INSERT INTO codex_response_cache
+                    (key, api_model, text, input_tokens, output_tokens, hits, created, last_used)
+                VALUES (%s, %s, %s, %s, %s, 0, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC')
+                ON CONFLICT (key) DO UPDATE
+                SET text = EXCLUDED.text, input_tokens = EXCLUDED.input_tokens,
+                    output_tokens = EXCLUDED.output_tokens, created = EXCLUDED.created,
+                    last_used = EXCLUDED.last_used
+            """, (key, api_model, out.get('text') or '', out.get('input_tokens') or 0, out.get('output_tokens') or 0))
+
+    @api.model
+    @contextmanager
+    def _inflight(self, key, timeout):
+        """Let only one caller at a time compute ``key``, in this worker and across workers.
+
+        Threads of this worker queue on a local lock; other workers poll a
+        session-level PostgreSQL advisory lock, held on a dedicated connection
+        by the caller doing the upstream call only. Waiting callers hold no
+        connection. After ``timeout`` seconds of waiting, a caller goes on
+        without the lock and calls the provider itself.
+        """
+        deadline = time.monotonic() + max(timeout or 0, 0)
+        with _INFLIGHT_LOCK:
+            entry = _INFLIGHT.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        local = entry[0].acquire(timeout=max(deadline - time.monotonic(), 0))
+        cr = None
+        try:
+            if local:
+                lock_id = int(key[:15], 16)
+                while True:
+                    cr = self.pool.cursor()
+                    cr.execute("SELECT pg_try_advisory_lock(%s)", (lock_id,))
+                    if cr.fetchone()[0]:
+                        # end this transaction so the caller's next lookup sees a fresh snapshot
+                        cr.commit()
+                        break
+                    cr.close()
+                    cr = None
+                    if time.monotonic() >= deadline:
+                        break
+                    time.sleep(INFLIGHT_POLL)
+            if cr is None:
+                _logger.info('Codex response cache: identical request still running after %ss, calling directly',
+                             timeout)
+            yield
+        finally:
+            if cr is not None:
+                try:
+                    cr.execute("SELECT pg_advisory_unlock(%s)", (lock_id,))
+                    cr.commit()
+                finally:
+                    cr.close()
+            if local:
+                entry[0].release()
+            with _INFLIGHT_LOCK:
+                entry[1] -= 1
+                if not entry[1]:
+                    _INFLIGHT.pop(key, None)
+
+    @api.model
+    def _gc(self):
+        """Drop expired entries, then the least recently used ones beyond the size limit."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        size = int(ICP.get_param('co_codex_assistant.response_cache_size', '5000'))
+        cr = self.env.cr
+        cr.execute("""
+            DELETE FROM codex_response_cache
+            WHERE created <= (now() AT TIME ZONE 'UTC') - %s * interval '1 second'
+        """, (self._ttl(),))
+        expired = cr.rowcount
+        cr.execute("""
+            DELETE FROM codex_response_cache WHERE id IN (
+                SELECT id FROM codex_response_cache ORDER BY last_used DESC OFFSET %s
+            )
+        """, (size,))
+        _logger.info('Codex response cache: %s expired and %s least recently used entries removed',
+                     expired, cr.rowcount)
+        return True
@@ -21,6 +21,33 @@ class ResConfigSettings(models.TransientModel):
     codex_timeout = fields.Integer(
         string='HTTP Timeout (sec)', default=60,
         help='Timeout in seconds for the HTTP request.')
+    codex_response_cache_ttl = fields.Integer(
+        string='Response Cache TTL (hours)', default=24,
+        help='Identical requests with temperature 0 are answered from the cache for this long. 0 disables the cache.')
+    codex_max_retries = fields.Integer(
+        string='HTTP Retries', default=3,
+        help='Retries on rate limiting (429, honoring Retry-After), 5xx answers and connection errors.')
+    codex_router_hedge = fields.Boolean(
+        string='Hedged Requests', default=True,
+        help='When other LLM providers are configured, a generation still running after the usual (p95) '
+             'latency of its provider is also sent to the next provider, and the first answer is used.')
+    codex_context_tokens = fields.Integer(
+        string='Context Budget (tokens)', default=3000,
+        help='Conversation context sent to the LLM; the oldest messages are left out beyond this budget.')
+    codex_input_tokens = fields.Integer(
+        string='Input Budget (tokens)', default=6000,
+        help='Maximum prompt size: retrieved documents are added by score until it is reached, '
+             'and longer prompts are shortened in their middle. 0 disables the limit.')
+    codex_job_concurrency = fields.Integer(
+        string='Background Jobs', default=4,
+        help='Generations run at the same time by the background job cron, over all users.')
+    codex_job_user_concurrency = fields.Integer(
+        string='Background Jobs per User', default=2,
+        help='Generations of a single user run at the same time by the background job cron.')
+    codex_job_batch_concurrency = fields.Integer(
+        string='Batch Jobs', default=2,
+        help='Generations of batch runs executed at the same time, over all users. Batch jobs do not count '
+             'against the per-user limit and wait for the interactive jobs.')
 
     def set_values(self):
         super().set_values()
@@ -32,6 +59,17 @@ class ResConfigSettings(models.TransientModel):
         params.set_param('co_codex_assistant.temperature', str(self.codex_temperature or 0.0))
         params.set_param('co_codex_assistant.max_tokens', str(self.codex_max_tokens or 0))
         params.set_param('co_codex_assistant.timeout', str(self.codex_timeout or 60))
+        params.set_param('co_codex_assistant.max_retries', str(self.codex_max_retries or 0))
+        params.set_param('co_codex_assistant.router_hedge', str(bool(self.codex_router_hedge)))
+        params.set_param('co_codex_assistant.response_cache_ttl', str(self.codex_response_cache_ttl or 0))
+        params.set_param('co_codex_assistant.context_tokens', str(self.codex_context_tokens or 3000))
+        params.set_param('co_codex_assistant.input_tokens', str(self.codex_input_tokens or 0))
+        params.set_param('co_codex_assistant.job_concurrency', str(self.codex_job_concurrency or 1))
+        params.set_param('co_codex_assistant.job_user_concurrency', str(self.codex_job_user_concurrency or 1))
+        params.set_param('co_codex_assistant.job_batch_concurrency', str(self.codex_job_batch_concurrency or 1))
+
+    def action_codex_providers(self):
+        return self.env['ir.actions.act_window']._for_xml_id('co_codex_assistant.action_codex_provider')
 
     @api.model
     def get_values(self):
@@ -44,5 +82,13 @@ class ResConfigSettings(models.TransientModel):
             codex_temperature=float(params.get_param('co_codex_assistant.temperature', default='0.3')),
             codex_max_tokens=int(params.get_param('co_codex_assistant.max_tokens', default='512')),
             codex_timeout=int(params.get_param('co_codex_assistant.timeout', default='60')),
+            codex_max_retries=int(params.get_param('co_codex_assistant.max_retries', default='3')),
+            codex_router_hedge=params.get_param('co_codex_assistant.router_hedge', default='True') != 'False',
+            codex_response_cache_ttl=int(params.get_param('co_codex_assistant.response_cache_ttl', default='24')),
+            codex_context_tokens=int(params.get_param('co_codex_assistant.context_tokens', default='3000')),
+            codex_input_tokens=int(params.get_param('co_codex_assistant.input_tokens', default='6000')),
+            codex_job_concurrency=int(params.get_param('co_codex_assistant.job_concurrency', default='4')),
+            codex_job_user_concurrency=int(params.get_param('co_codex_assistant.job_user_concurrency', default='2')),
+            codex_job_batch_concurrency=int(params.get_param('co_codex_assistant.job_batch_concurrency', default='2')),
         )
         return res
@@ -0,0 +1,44 @@
+/** @odoo-module **/
+
+import { _t } from "@web/core/l10n/translation";
+import { registry } from "@web/core/registry";
+
+/**
+ * Tells the user when one of their background generations (codex.job) is
+ * finished, with a button opening the result.
+ */
+export const codexJobService = {
+    dependencies: ["action", "bus_service", "notification"],
+
+    start(env, { action, bus_service, notification }) {
+        bus_service.subscribe("codex.job/done", (payload) => {
+            if (payload.state !== "done") {
+                notification.add(payload.error || payload.name, {
+                    title: _t("Codex generation failed"),
+                    type: "danger",
+                });
+                return;
+            }
+            const close = notification.add(payload.name, {
+                title: _t("Codex generation ready"),
+                type: "success",
+                sticky: true,
+                buttons: [{
+                    name: _t("Open"),
+                    primary: true,
+                    onClick: () => {
+                        close();
+                        action.doAction({
+                            type: "ir.actions.act_window",
+                            res_model: "codex.history",
+                            res_id: payload.history_id,
+                            views: [[false, "form"]],
+                        });
+                    },
+                }],
+            });
+        });
+    },
+};
+
+registry.category("services").add("codex_job", codexJobService);
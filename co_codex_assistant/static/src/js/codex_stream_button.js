@@ -0,0 +1,82 @@
+/** @odoo-module **/
+
+import { Component, useState } from "@odoo/owl";
+import { _t } from "@web/core/l10n/translation";
+import { registry } from "@web/core/registry";
+import { useService } from "@web/core/utils/hooks";
+import { standardWidgetProps } from "@web/views/widgets/standard_widget_props";
+
+/**
+ * Streams a generation of the Codex wizard into its result field as the
+ * provider sends it, see CodexController.generate_stream.
+ */
+export class CodexStreamButton extends Component {
+    static template = "co_codex_assistant.CodexStreamButton";
+    static props = { ...standardWidgetProps };
+
+    setup() {
+        this.notification = useService("notification");
+        this.state = useState({ streaming: false });
+    }
+
+    async onClick() {
+        const record = this.props.record;
+        if (!(await record.save())) {
+            return;
+        }
+        this.state.streaming = true;
+        const body = new FormData();
+        body.append("wizard_id", record.resId);
+        body.append("csrf_token", odoo.csrf_token);
+        let text = "";
+        try {
+            const response = await fetch("/codex/generate/stream", { method: "POST", body });
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) {
+                    break;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                let end;
+                while ((end = buffer.indexOf("\n\n")) >= 0) {
+                    const event = parseEvent(buffer.slice(0, end));
+                    buffer = buffer.slice(end + 2);
+                    if (event.name === "delta") {
+                        text += event.data.text;
+                        await record.update({ result: text });
+                    } else if (event.name === "error") {
+                        this.notification.add(event.data.message, { type: "danger" });
+                    }
+                }
+            }
+        } catch (error) {
+            this.notification.add(_t("Streaming failed: %s", error.message), { type: "danger" });
+        } finally {
+            this.state.streaming = false;
+            // the server saved the final result and usage
+            await record.load();
+        }
+    }
+}
+
+function parseEvent(block) {
+    const event = { name: "message", data: null };
+    const data = [];
+    for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) {
+            event.name = line.slice(6).trim();
+        } else if (line.startsWith("data:")) {
+            data.push(line.slice(5).trim());
+        }
+    }
+    event.data = data.length ? JSON.parse(data.join("\n")) : {};
+    return event;
+}
+
+registry.category("view_widgets").add("codex_stream_button", { component: CodexStreamButton });
@@ -0,0 +1,10 @@
+# Pure-Python/NumPy helpers used by the Codex models.
+# Nothing in this package imports odoo, so the benchmarks can load it standalone.
+from . import vector_engine
+from . import embedding_store
+from . import ivf
+from . import text
+from . import compress
+from . import metrics
+from . import router
+from . import archive
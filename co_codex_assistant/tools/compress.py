@@ -0,0 +1,126 @@
+import re
+
+from .text import estimate_tokens, truncate_tokens
+
+# Start of the quoted original in a plain text reply; everything after is dropped
+_REPLY_HEADER_RE = re.compile(
+    r'^(On .{0,200}wrote:|-{2,} ?Original Message ?-{2,}|-{2,} ?Forwarded message ?-{2,}'
+    r'|From: .+\n(Sent|Date): .+|.{0,200}tarihinde .{0,200}(şunu )?yazdı:)\s*$',
+    re.IGNORECASE | re.MULTILINE)
+# First line of a signature block
+_SIGNATURE_RE = re.compile(
+    r'^(-- ?|(best|kind|warm) regards,?|regards,?|thanks( and regards)?,?|cheers,?|sent from my .+'
+    r'|saygılarımla,?|saygılarımızla,?|iyi çalışmalar( dilerim)?,?)\s*$',
+    re.IGNORECASE | re.MULTILINE)
+# Paragraphs that are legal boilerplate
+_DISCLAIMER_RE = re.compile(
+    r'(confidential|intended (solely |only )?for the (use of the )?(addressee|recipient)|disclaimer'
+    r'|gizli(dir| bilgi)|yasal uyarı|bu e-?posta (mesajı )?ve)', re.IGNORECASE)
+# Lines shorter than this are too common to be deduplicated ("Hello,", "Thanks!")
+MIN_DEDUPE_CHARS = 40
+
+
+def strip_quoted(text):
+    """Drop ``>`` quoted lines and the original message below a reply header."""
+    match = _REPLY_HEADER_RE.search(text)
+    if match and match.start() > 0:
+        text = text[:match.start()]
+    return '\n'.join(line for line in text.split('\n') if not line.lstrip().startswith('>')).strip()
+
+
+def strip_signature(text):
+    """Cut the signature block and drop disclaimer paragraphs.
+
+    A signature marker on the first line is ignored, so a message is never
+    emptied.
+    """
+    match = _SIGNATURE_RE.search(text)
+    if match and match.start() > 0:
+        text = text[:match.start()]
+    paragraphs = re.split(r'\n\s*\n', text)
+    kept = [p for p in paragraphs if not _DISCLAIMER_RE.search(p)] or paragraphs[:1]
+    return '\n\n'.join(kept).strip()
+
+
+def compress_text(text):
+    return strip_signature(strip_quoted(text or ''))
+
+
+def dedupe_lines(texts):
+    """Remove from each text (oldest first) the long lines already present in an earlier one."""
+    seen = set()
+    out = []
+    for text in texts:
+        kept = []
+        for line in text.split('\n'):
+            key = ' '.join(line.lower().split())
+            if len(key) >= MIN_DEDUPE_CHARS:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(line)
+        out.append('\n'.join(kept).strip())
+    return out
+
+
+def _last_words(text, max_tokens):
+    """Keep the end of ``text``, cut on a word boundary ~``max_tokens`` tokens before it."""
+    words, size = [], 0
+    for word in reversed(text.split()):
+        size += estimate_tokens(word)
+        if words and size > max_tokens:
+            break
+        words.insert(0, word)
+    return '… ' + ' '.join(words)
+
+
+def truncate_middle(text, max_tokens):
+    """Fit ``text`` in ~``max_tokens`` tokens by cutting out its middle.
+
+    The first third of the budget keeps the beginning (instructions), the
+    rest keeps the end (the most recent messages). Whole lines are kept
+    while they fit; the line where the budget runs out is cut at word
+    level, so a single long line still keeps its beginning and its end.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.split('\n')
+    head, size = [], 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if size + cost > max_tokens // 3:
+            break
+        head.append(line)
+        size += cost
+    whole = len(head)
+    if whole < len(lines) and max_tokens // 3 - size > 0:
+        head.append(truncate_tokens(lines[whole], max_tokens // 3 - size))
+        size += estimate_tokens(head[-1]) + 1
+    tail = []
+    for line in reversed(lines[whole:]):
+        cost = estimate_tokens(line) + 1
+        if size + cost > max_tokens:
+            if max_tokens - size > 0:
+                fits = estimate_tokens(line) <= max_tokens - size
+                tail.insert(0, line if fits else _last_words(line, max_tokens - size))
+            break
+        tail.insert(0, line)
+        size += cost
+    return '\n'.join(head + ['[…]'] + tail)
+
+
+def take_within(texts, budget):
+    """Keep ``texts`` in the given (ranked) order while they fit in ``budget`` tokens.
+
+    Returns ``(kept, skipped_tokens)``; a text that does not fit is skipped
+    and the following, smaller ones may still be kept.
+    """
+    kept, used, skipped = [], 0, 0
+    for text in texts:
+        cost = estimate_tokens(text)
+        if used + cost > budget:
+            skipped += cost
+            continue
+        kept.append(text)
+        used += cost
+    return kept, skipped
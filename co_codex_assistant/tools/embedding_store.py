@@ -0,0 +1,82 @@
+import fcntl
+import os
+
+import numpy as np
+
+from .vector_engine import normalize_rows
+
+DTYPE = np.dtype('<f4')
+
+
+class EmbeddingStore:
+    """Append-only file of L2-normalised float32 rows (raw, no header).
+
+    Every worker maps the file read-only, so the pages are shared through
+    the OS page cache. Appends are serialised with an exclusive ``flock``;
+    rows are never rewritten in place, compaction writes a new file.
+    """
+
+    def __init__(self, path, dim):
+        self.path = path
+        self.dim = dim
+        self.row_bytes = dim * DTYPE.itemsize
+
+    @property
+    def rows(self):
+        try:
+            return os.path.getsize(self.path) // self.row_bytes
+        except FileNotFoundError:
+            return 0
+
+    def _prepare(self, vectors):
+        arr = np.array(vectors, dtype=DTYPE)
+        if arr.ndim != 2 or arr.shape[1] != self.dim:
+            raise ValueError('expected vectors of dimension %s, got shape %s' % (self.dim, arr.shape))
+        return normalize_rows(arr)
+
+    def append(self, vectors):
+        """Append ``vectors`` and return the row number of the first one."""
+        arr = self._prepare(vectors)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'ab') as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                end = fh.seek(0, os.SEEK_END)
+                torn = end % self.row_bytes
+                if torn:
+                    # a previous writer died mid-row; drop the partial row
+                    end -= torn
+                    fh.truncate(end)
+                fh.write(arr.tobytes())
+                fh.flush()
+                os.fsync(fh.fileno())
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+        return end // self.row_bytes
+
+    def open(self):
+        """Map the rows written so far, read-only."""
+        rows = self.rows
+        if not rows:
+            return np.empty((0, self.dim), dtype=DTYPE)
+        return np.memmap(self.path, dtype=DTYPE, mode='r', shape=(rows, self.dim))
+
+    def write(self, blocks):
+        """Write a fresh file from an iterable of vector blocks; return its row count.
+
+        The file is written next to its final name and renamed into place, so
+        readers never see it half-written.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        rows = 0
+        with open(tmp, 'wb') as fh:
+            for block in blocks:
+                if len(block):
+                    arr = self._prepare(block)
+                    fh.write(arr.tobytes())
+                    rows += arr.shape[0]
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.path)
+        return rows
@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+
+from .vector_engine import normalize_rows, top_k
+
+# Rows scored per block when assigning rows to centroids
+ASSIGN_BLOCK = 16384
+
+
+def default_nlist(rows):
+    """Number of inverted lists for ``rows`` vectors (about sqrt(n), bounded)."""
+    return int(min(4096, max(16, round(rows ** 0.5))))
+
+
+def assign(matrix, centroids, start=0):
+    """Return the nearest centroid of every row of ``matrix[start:]``."""
+    n = matrix.shape[0]
+    labels = np.empty(max(n - start, 0), dtype=np.int32)
+    for lo in range(start, n, ASSIGN_BLOCK):
+        hi = min(lo + ASSIGN_BLOCK, n)
+        labels[lo - start:hi - start] = np.argmax(np.asarray(matrix[lo:hi]) @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """Inverted-file (IVF-flat) index over the rows of one embedding matrix.
+
+    Rows are bucketed by their nearest centroid (spherical k-means); a query
+    only scores the rows of its ``nprobe`` closest buckets. ``nprobe`` is the
+    recall/latency trade-off: more probes, more rows scored, better recall.
+    """
+
+    def __init__(self, centroids, labels, trained_rows=None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.trained_rows = trained_rows if trained_rows is not None else self.labels.shape[0]
+        self._build_lists()
+
+    def __len__(self):
+        return self.labels.shape[0]
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    def _build_lists(self):
+        self.order = np.argsort(self.labels, kind='stable')
+        counts = np.bincount(self.labels, minlength=self.nlist)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    @classmethod
+    def train(cls, matrix, nlist=None, iters=10, seed=0):
+        n = matrix.shape[0]
+        nlist = min(nlist or default_nlist(n), n)
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, min(n, max(nlist * 40, 10000)), replace=False))
+        data = np.array(matrix[sample], dtype=np.float32)
+        centroids = data[rng.choice(data.shape[0], nlist, replace=False)].copy()
+        for _ in range(iters):
+            labels = assign(data, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            if empty.any():
+                sums[empty] = data[rng.choice(data.shape[0], int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+        return cls(centroids, assign(matrix, centroids))
+
+    def extend(self, matrix):
+        """Assign rows appended to ``matrix`` since the index was built."""
+        if matrix.shape[0] > len(self):
+            self.labels = np.concatenate((self.labels, assign(matrix, self.centroids, len(self))))
+            self._build_lists()
+
+    def remap(self, rows):
+        """Return a copy for a matrix rewritten to contain only ``rows``, in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows < len(self)]
+        return IVFIndex(self.centroids, self.labels[rows], self.trained_rows)
+
+    def candidates(self, query, nprobe):
+        """Rows of the ``nprobe`` lists closest to the normalised ``query``, sorted."""
+        probes = top_k(self.centroids @ query, nprobe)
+        parts = [self.order[self.offsets[p]:self.offsets[p + 1]] for p in probes]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def save(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as fh:
+            np.savez(fh, centroids=self.centroids, labels=self.labels,
+                     trained_rows=np.array(self.trained_rows))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['labels'], int(data['trained_rows']))
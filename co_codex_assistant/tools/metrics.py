@@ -0,0 +1,74 @@
+import bisect
+import threading
+import time
+
+# Upper bounds (ms) of the latency histogram buckets; a last bucket holds everything slower
+LATENCY_BOUNDS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+def latency_bucket(ms):
+    """Index of the histogram bucket of a ``ms`` milliseconds measurement."""
+    return bisect.bisect_left(LATENCY_BOUNDS_MS, ms)
+
+
+def empty_histogram():
+    return [0] * (len(LATENCY_BOUNDS_MS) + 1)
+
+
+def merge_histograms(histograms):
+    """Element-wise sum of histograms; missing or short ones count as zeros."""
+    merged = empty_histogram()
+    for hist in histograms:
+        for i, count in enumerate((hist or [])[:len(merged)]):
+            merged[i] += count
+    return merged
+
+
+def histogram_percentile(hist, q):
+    """Approximate ``q``-th percentile (0-100) in ms, interpolated inside its bucket.
+
+    Returns 0.0 for an empty histogram. Values in the last, unbounded bucket
+    are reported as its lower bound.
+    """
+    total = sum(hist or ())
+    if not total:
+        return 0.0
+    rank = q / 100.0 * total
+    seen = 0
+    for i, count in enumerate(hist):
+        if count and seen + count >= rank:
+            low = LATENCY_BOUNDS_MS[i - 1] if i else 0
+            if i >= len(LATENCY_BOUNDS_MS):
+                return float(low)
+            return low + (LATENCY_BOUNDS_MS[i] - low) * max(rank - seen, 0) / count
+        seen += count
+    return float(LATENCY_BOUNDS_MS[-1])
+
+
+class Meter:
+    """Upstream time, bytes and retries of the HTTP calls made for one operation.
+
+    Thread-safe, so the batches of one operation may be sent from a pool.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.upstream = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.endpoint = None
+        self._lock = threading.Lock()
+
+    def add(self, seconds, sent=0, received=0, retries=0, endpoint=None):
+        with self._lock:
+            self.upstream += seconds
+            self.bytes_sent += sent
+            self.bytes_received += received
+            self.retries += retries
+            if endpoint:
+                self.endpoint = endpoint
+
+    @property
+    def wall(self):
+        return time.monotonic() - self.started
@@ -0,0 +1,198 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+_logger = logging.getLogger(__name__)
+
+# Weight of a provider unless configured otherwise
+DEFAULT_WEIGHT = 10
+# Weight of the newest call in the latency and error averages
+EWMA_ALPHA = 0.2
+# An error rate of 100% makes a provider look this many times slower
+ERROR_PENALTY = 4.0
+# Consecutive failures opening a provider's circuit breaker, and how long it stays open
+BREAKER_FAILURES = 3
+BREAKER_COOLDOWN = 30.0
+# Latencies kept per provider to estimate the hedging delay
+LATENCY_WINDOW = 64
+# Hedge only once this many latencies are known, and never sooner than this (seconds)
+HEDGE_MIN_SAMPLES = 8
+HEDGE_MIN_DELAY = 0.25
+HEDGE_PERCENTILE = 95
+
+
+class ProviderStats:
+    """Latency, error rate and circuit breaker of one provider."""
+
+    def __init__(self):
+        self.latency = None     # EWMA of the successful calls (seconds)
+        self.error_rate = 0.0   # EWMA of the failures (0-1)
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.failures = 0       # consecutive
+        self.opened_at = None   # breaker opened at (monotonic), None when closed
+        self.probing = False    # a half-open trial call is running
+
+    def state(self, now):
+        if self.opened_at is None:
+            return 'closed'
+        if self.probing or now - self.opened_at < BREAKER_COOLDOWN:
+            return 'open'
+        return 'half_open'
+
+
+class Router:
+    """Order providers by weight and observed health; thread-safe, one per process.
+
+    Providers are identified by a key (any hashable). Each one is scored by
+    ``weight / (latency * (1 + ERROR_PENALTY * error_rate))``, the averages
+    being exponentially weighted over the outcomes recorded by ``record``,
+    and the call order is a weighted random draw on that score: the fastest
+    healthy provider gets most calls without starving the others, whose
+    averages keep being refreshed.
+
+    After ``BREAKER_FAILURES`` consecutive failures a provider's breaker
+    opens: it is only tried after the healthy ones, until
+    ``BREAKER_COOLDOWN`` seconds have passed, when a single trial call may
+    close it again (half-open).
+    """
+
+    def __init__(self, rng=None):
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._rng = rng or random.Random()
+
+    def _get(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = ProviderStats()
+        return stats
+
+    def order(self, weights):
+        """Return the keys of ``{key: weight}`` in the order they should be tried."""
+        now = time.monotonic()
+        with self._lock:
+            stats = {key: self._get(key) for key in weights}
+            known = sorted(s.latency for s in stats.values() if s.latency is not None)
+            # a provider without measurement is assumed as fast as the median one
+            default = known[len(known) // 2] if known else 1.0
+            ready, blocked = [], []
+            for key, weight in weights.items():
+                s = stats[key]
+                if s.state(now) == 'open':
+                    blocked.append((s.opened_at, key))
+                    continue
+                score = max(weight, 0.0) / (max(s.latency or default, 1e-3) * (1 + ERROR_PENALTY * s.error_rate))
+                # weighted draw without replacement (Efraimidis-Spirakis)
+                draw = self._rng.random() ** (1.0 / score) if score > 0 else 0.0
+                ready.append((draw, key))
+        ready.sort(key=lambda item: item[0], reverse=True)
+        blocked.sort(key=lambda item: item[0])
+        return [key for _d, key in ready] + [key for _t, key in blocked]
+
+    def begin(self, key):
+        """Note that a call to ``key`` starts; it is the trial call of a half-open breaker."""
+        with self._lock:
+            stats = self._get(key)
+            if stats.state(time.monotonic()) == 'half_open':
+                stats.probing = True
+
+    def record(self, key, seconds, ok):
+        """Record the outcome of a call; ``seconds`` may be None when its duration means nothing."""
+        with self._lock:
+            stats = self._get(key)
+            stats.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - stats.error_rate)
+            if ok:
+                if seconds is not None:
+                    stats.latency = seconds if stats.latency is None else \
+                        stats.latency + EWMA_ALPHA * (seconds - stats.latency)
+                    stats.samples.append(seconds)
+                if stats.opened_at is not None:
+                    _logger.info('Codex router: %s is back, closing its circuit breaker', key)
+                stats.failures, stats.opened_at, stats.probing = 0, None, False
+                return
+            stats.failures += 1
+            if stats.probing or (stats.opened_at is None and stats.failures >= BREAKER_FAILURES):
+                _logger.warning('Codex router: %s failed %s times in a row, opening its circuit breaker for %ss',
+                                key, stats.failures, BREAKER_COOLDOWN)
+                stats.opened_at = time.monotonic()
+            stats.probing = False
+
+    def hedge_delay(self, key):
+        """Seconds to wait for ``key`` before hedging: its recent p95, or None while unknown."""
+        with self._lock:
+            samples = sorted(self._get(key).samples)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        p95 = samples[min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE / 100))]
+        return max(p95, HEDGE_MIN_DELAY)
+
+    def snapshot(self, key):
+        """``{'state', 'latency_ms', 'error_rate', 'calls'}`` of ``key`` in this process."""
+        with self._lock:
+            stats = self._get(key)
+            return {
+                'state': stats.state(time.monotonic()),
+                'latency_ms': (stats.latency or 0.0) * 1000,
+                'error_rate': stats.error_rate,
+                'calls': len(stats.samples),
+            }
+
+    def call(self, providers, call, hedge=False):
+        """Run ``call(provider)`` on the best provider, failing over to the next ones.
+
+        ``providers`` is a list of ``(key, weight, provider)``. When ``hedge``
+        is set and the first call is still running after that provider's
+        recent p95 latency, the same call is sent to the next provider and
+        the first answer wins; the other one is left to finish in the
+        background, its outcome still feeding the averages. A failed call is
+        retried on the next provider, in order, until one succeeds; the last
+        error is raised when all have failed.
+
+        Returns ``(key, result)``, ``key`` being the provider that answered.
+        """
+        by_key = {key: provider for key, _w, provider in providers}
+        queue = self.order({key: weight for key, weight, _p in providers})
+
+        def run(key):
+            self.begin(key)
+            t0 = time.monotonic()
+            try:
+                result = call(by_key[key])
+            except Exception:
+                self.record(key, time.monotonic() - t0, False)
+                raise
+            self.record(key, time.monotonic() - t0, True)
+            return result
+
+        if len(queue) == 1:
+            return queue[0], run(queue[0])
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='codex-route')
+        try:
+            pending, error = {}, None
+            while pending or queue:
+                if not pending:
+                    key = queue.pop(0)
+                    pending[pool.submit(run, key)] = key
+                delay = None
+                if hedge and queue and len(pending) == 1:
+                    delay = self.hedge_delay(next(iter(pending.values())))
+                done, _running = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+                if not done:
+                    key = queue.pop(0)
+                    _logger.info('Codex router: no answer after %.2fs, hedging on %s', delay, key)
+                    pending[pool.submit(run, key)] = key
+                    continue
+                for future in done:
+                    key = pending.pop(future)
+                    try:
+                        return key, future.result()
+                    except Exception as e:
+                        _logger.warning('Codex router: %s failed (%s), %s', key, e,
+                                        'failing over' if queue or pending else 'no provider left')
+                        error = e
+            raise error
+        finally:
+            pool.shutdown(wait=False)
@@ -0,0 +1,160 @@
+import numpy as np
+
+# A row subset smaller than 1/SUBSET_RATIO of the matrix is gathered and scored
+# alone; a larger one is cheaper to apply as a mask after the full product.
+SUBSET_RATIO = 4
+
+
+def top_k(scores, k):
+    """Return the indices of the ``k`` highest scores, best first."""
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind='stable')
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind='stable')]
+
+
+def normalize_rows(matrix):
+    """L2-normalise rows in place; all-zero rows are left as zeros."""
+    norms = np.linalg.norm(matrix, axis=1)
+    nz = norms > 0
+    matrix[nz] /= norms[nz, None]
+    return matrix
+
+
+def normalize_vector(vec, dim=None):
+    q = np.asarray(vec, dtype=np.float32).ravel()
+    if dim is not None and q.shape[0] != dim:
+        return None
+    n = float(np.linalg.norm(q))
+    if n <= 0:
+        return None
+    return q / n
+
+
+def merge_results(results, k):
+    """Merge several ``(ids, scores)`` results into one top-``k`` list."""
+    pairs = [p for ids, scores in results for p in zip(ids, scores)]
+    pairs.sort(key=lambda p: p[1], reverse=True)
+    pairs = pairs[:k]
+    return [p[0] for p in pairs], [p[1] for p in pairs]
+
+
+def rrf_fuse(rankings, k, c=60):
+    """Fuse ranked id lists by reciprocal rank fusion; return the top-``k`` ``(ids, scores)``.
+
+    Each id scores ``sum(1 / (c + rank))`` over the rankings it appears in,
+    so no score calibration between rankings is needed.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (c + rank)
+    ids = sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)[:k]
+    return ids, [scores[doc_id] for doc_id in ids]
+
+
+class VectorMatrix:
+    """Embeddings of one corpus held as a contiguous float32 matrix.
+
+    Rows are L2-normalised, so a cosine similarity against every document
+    is a single matrix-vector product. ``matrix`` may be a read-only
+    ``np.memmap``; rows whose id is negative (no live document) are never
+    returned. With an ``ann`` index attached, searches given ``nprobe``
+    only score the candidate rows it returns. Searches given ``rows`` only
+    return those rows: a small subset is gathered and scored alone, a large
+    one is applied as a mask after the full product.
+    """
+
+    __slots__ = ('ids', 'matrix', 'dim', 'dead', 'ann')
+
+    def __init__(self, ids, matrix, ann=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.matrix = matrix
+        self.dim = matrix.shape[1] if matrix.ndim == 2 else 0
+        dead = self.ids < 0
+        self.dead = dead if dead.any() else None
+        self.ann = ann
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + self.ids.nbytes
+
+    @classmethod
+    def from_rows(cls, rows, dim=None):
+        """Build from ``(id, vector)`` pairs.
+
+        Vectors whose length differs from ``dim`` (default: the most common
+        length) are skipped instead of being truncated.
+        Returns ``(matrix, skipped_count)``.
+        """
+        rows = [(i, v) for i, v in rows if v]
+        if dim is None and rows:
+            lengths = {}
+            for _i, v in rows:
+                lengths[len(v)] = lengths.get(len(v), 0) + 1
+            dim = max(lengths, key=lengths.get)
+        kept = [(i, v) for i, v in rows if len(v) == dim]
+        skipped = len(rows) - len(kept)
+        if not kept:
+            return cls(np.empty(0, dtype=np.int64), np.empty((0, dim or 0), dtype=np.float32)), skipped
+        matrix = np.empty((len(kept), dim), dtype=np.float32)
+        for n, (_i, v) in enumerate(kept):
+            matrix[n] = v
+        normalize_rows(matrix)
+        return cls([i for i, _v in kept], matrix), skipped
+
+    def _candidates(self, q, nprobe):
+        rows = self.ann.candidates(q, nprobe)
+        rows = rows[rows < len(self)]
+        if len(self.ann) < len(self):
+            # rows appended after the index was last extended are always scored
+            rows = np.concatenate((rows, np.arange(len(self.ann), len(self))))
+        return rows
+
+    def _score_rows(self, q, rows, k):
+        ids = self.ids[rows]
+        live = ids >= 0
+        rows, ids = rows[live], ids[live]
+        scores = np.asarray(self.matrix[rows]) @ q
+        idx = top_k(scores, k)
+        return ids[idx].tolist(), scores[idx].tolist()
+
+    def search(self, query, k, nprobe=None, rows=None):
+        """Return ``(ids, scores)`` of the ``k`` closest rows by cosine similarity.
+
+        ``rows``, when given, restricts the search to these row numbers.
+        """
+        q = normalize_vector(query, self.dim)
+        if q is None or not len(self):
+            return [], []
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+            rows = rows[rows < len(self)]
+            if not len(rows):
+                return [], []
+        if self.ann is not None and nprobe:
+            candidates = self._candidates(q, nprobe)
+            if rows is not None:
+                candidates = np.intersect1d(candidates, rows)
+            return self._score_rows(q, candidates, k)
+        if rows is not None and len(rows) * SUBSET_RATIO < len(self):
+            return self._score_rows(q, rows, k)
+        scores = self.matrix @ q
+        mask = self.dead
+        if rows is not None:
+            mask = np.ones(len(self), dtype=bool)
+            mask[rows] = False
+            if self.dead is not None:
+                mask |= self.dead
+        if mask is not None:
+            scores[mask] = -np.inf
+        idx = top_k(scores, k)
+        if mask is not None:
+            idx = idx[~mask[idx]]
+        return self.ids[idx].tolist(), scores[idx].tolist()
@@ -1 +1,3 @@
 from . import codex_generate_wizard
+from . import codex_batch_wizard
+from . import codex_metric_summary
@@ -0,0 +1,121 @@
+import logging
+import time
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from odoo.tools.safe_eval import safe_eval
+
+_logger = logging.getLogger(__name__)
+
+OPEN_TICKETS_DOMAIN = "[('stage_id.fold', '=', False)]"
+
+
+class CodexBatchWizard(models.TransientModel):
+    """Generate one summary (or reply draft, report) per helpdesk ticket of a domain."""
+    _name = 'codex.batch.wizard'
+    _description = 'Codex Batch Generation'
+
+    ticket_domain = fields.Char('Tickets', default=OPEN_TICKETS_DOMAIN, required=True)
+    ticket_count = fields.Integer(compute='_compute_ticket_count')
+    purpose = fields.Selection([
+        ('reply', 'Reply Draft'),
+        ('summary', 'Summary'),
+        ('report', 'Report'),
+    ], default='summary', required=True)
+    language = fields.Selection([
+        ('auto', 'Auto'),
+        ('en', 'English'),
+        ('tr', 'Turkish'),
+    ], default='auto', required=True)
+    tone = fields.Selection([
+        ('neutral', 'Neutral/Professional'),
+        ('friendly', 'Friendly'),
+        ('formal', 'Formal'),
+    ], default='neutral', required=True)
+    prompt = fields.Text('Extra Instructions')
+    message_limit = fields.Integer('Messages per Ticket', default=50,
+                                   help='Most recent messages considered; the context token budget applies on top.')
+    ticket_limit = fields.Integer('Max Tickets', default=500)
+
+    @api.model
+    def default_get(self, fields_list):
+        res = super().default_get(fields_list)
+        if self.env.context.get('active_model') == 'helpdesk.ticket' and self.env.context.get('active_ids'):
+            res['ticket_domain'] = repr([('id', 'in', self.env.context['active_ids'])])
+        return res
+
+    @api.depends('ticket_domain')
+    def _compute_ticket_count(self):
+        for wizard in self:
+            wizard.ticket_count = self.env['helpdesk.ticket'].search_count(wizard._domain())
+
+    def _domain(self):
+        return safe_eval(self.ticket_domain or '[]')
+
+    def action_run(self):
+        self.ensure_one()
+        tickets = self.env['helpdesk.ticket'].search(self._domain(), limit=self.ticket_limit or None)
+        if not tickets:
+            raise UserError(_('No ticket matches the domain.'))
+        batch = self._run_batch(tickets)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'codex.batch',
+            'view_mode': 'form',
+            'res_id': batch.id,
+        }
+
+    def _run_batch(self, tickets):
+        """Queue one background job per ticket and return their ``codex.batch``.
+
+        The contexts of all tickets are built at once, then the generations
+        go through the job queue, in its batch lane: they use the response
+        cache, and each result is added to the history as soon as its job is
+        done, so a killed worker loses no finished work. The batch shows
+        the progress and, once finished, the report of the run.
+        """
+        t0 = time.monotonic()
+        stats = {}
+        contexts = self.env['codex.context']._threads_context('helpdesk.ticket', tickets.ids,
+                                                              limit=self.message_limit or 50, stats=stats)
+        Wizard = self.env['codex.generate.wizard']
+        purpose = dict(self._fields['purpose'].selection).get(self.purpose)
+        items = []
+        for ticket in tickets:
+            wizard = Wizard.new({
+                'purpose': self.purpose,
+                'language': self.language,
+                'tone': self.tone,
+                'prompt': self.prompt,
+                'context_text': contexts[ticket.id],
+            })
+            items.append((wizard._build_messages(), {
+                'name': f"{purpose} -> {ticket.display_name}",
+                'user_id': self.env.user.id,
+                'ticket_id': ticket.id,
+                'purpose': self.purpose,
+                'prompt': self.prompt,
+                'context': contexts[ticket.id],
+                'saved_tokens': stats[ticket.id].get('saved_tokens', 0),
+                'notify': False,
+            }))
+        batch = self.env['codex.batch'].sudo().create({
+            'name': f"{purpose}: {len(tickets)} tickets",
+            'user_id': self.env.user.id,
+            'purpose': self.purpose,
+            'prepare_seconds': time.monotonic() - t0,
+            'saved_tokens': sum(s.get('saved_tokens', 0) for s in stats.values()),
+        })
+        self.env['codex.job']._submit_many([(messages, dict(values, batch_id=batch.id))
+                                            for messages, values in items])
+        _logger.info('Codex batch %s: %s jobs queued in %.2fs', batch.id, len(items), batch.prepare_seconds)
+        return batch
+
+    @api.model
+    def _cron_summarize_open_tickets(self):
+        """Daily summaries of the open helpdesk queue, see the 'Codex: Summarize Open Tickets' cron."""
+        wizard = self.create({'purpose': 'summary'})
+        tickets = self.env['helpdesk.ticket'].search(wizard._domain(), limit=wizard.ticket_limit)
+        if tickets:
+            wizard._run_batch(tickets)
+        return True
@@ -1,6 +1,12 @@
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 
+from ..models.codex_context import CHANNEL_MODELS
+from ..tools.text import estimate_tokens
+
+# Tokens kept free for the system prompt and the instructions around the context
+PROMPT_RESERVE = 300
+
 class CodexGenerateWizard(models.TransientModel):
     _name = 'codex.generate.wizard'
     _description = 'Generate with Codex'
@@ -23,9 +29,13 @@ class CodexGenerateWizard(models.TransientModel):
     context_text = fields.Text('Context', readonly=True)
     prompt = fields.Text('Extra Instructions')
     result = fields.Text('Result', readonly=True)
+    saved_tokens = fields.Integer('Saved Tokens', readonly=True,
+                                  help='Tokens removed from the context by compression.')
 
     ticket_id = fields.Many2one('helpdesk.ticket', string='Helpdesk Ticket', readonly=True)
     channel_id = fields.Many2one('discuss.channel', string='Discuss Channel', readonly=True)
+    job_id = fields.Many2one('codex.job', string='Background Job', readonly=True)
+    job_state = fields.Selection(related='job_id.state', string='Job Status')
 
     def _build_messages(self):
         system = 'You are a helpful assistant for Odoo. Always produce concise, actionable text. If purpose is report, structure with headings and bullet points.'
@@ -57,19 +67,31 @@ class CodexGenerateWizard(models.TransientModel):
     def action_generate(self):
         client = self.env['codex.client']
         messages = self._build_messages()
-        out = client.generate(messages)
-        text = out.get('text') or ''
-        self.write({'result': text})
-        self.env['codex.history'].create({
+        out = client.generate(messages, purpose=self.purpose)
+        self._record_result(out)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'codex.generate.wizard',
+            'view_mode': 'form',
+            'res_id': self.id,
+            'target': 'new',
+        }
+
+    def action_submit(self):
+        """Queue the generation as a background job; the result arrives through the bus."""
+        self.ensure_one()
+        purpose = dict(self._fields['purpose'].selection).get(self.purpose)
+        target = self.ticket_id.display_name or self.channel_id.display_name or _('General')
+        self.job_id = self.env['codex.job']._submit(self._build_messages(), {
+            'name': f"{purpose} -> {target}",
             'user_id': self.env.user.id,
-            'ticket_id': self.ticket_id.id if self.ticket_id else False,
-            'channel_id': self.channel_id.id if self.channel_id else False,
+            'wizard_id': self.id,
+            'ticket_id': self.ticket_id.id,
+            'channel_id': self.channel_id.id,
             'purpose': self.purpose,
             'prompt': self.prompt,
             'context': self.context_text,
-            'response': text,
-            'input_tokens': out.get('input_tokens') or 0,
-            'output_tokens': out.get('output_tokens') or 0,
+            'saved_tokens': self.saved_tokens,
         })
         return {
             'type': 'ir.actions.act_window',
@@ -79,6 +101,26 @@ class CodexGenerateWizard(models.TransientModel):
             'target': 'new',
         }
 
+    def _record_result(self, out):
+        """Store a ``generate()``-style result on the wizard and in the history."""
+        self.ensure_one()
+        text = out.get('text') or ''
+        self.write({'result': text})
+        return self.env['codex.history'].create({
+            'user_id': self.env.user.id,
+            'ticket_id': self.ticket_id.id if self.ticket_id else False,
+            'channel_id': self.channel_id.id if self.channel_id else False,
+            'purpose': self.purpose,
+            'prompt': self.prompt,
+            'context': self.context_text,
+            'response': text,
+            'input_tokens': out.get('input_tokens') or 0,
+            'output_tokens': out.get('output_tokens') or 0,
+            'api_model': out.get('model'),
+            'cached': bool(out.get('cached')),
+            'saved_tokens': self.saved_tokens + (out.get('saved_tokens') or 0),
+        })
+
     def action_use_in_composer(self):
         # Insert result into the chatter composer on helpdesk ticket if present
         self.ensure_one()
@@ -98,48 +140,30 @@ class CodexGenerateWizard(models.TransientModel):
         res = super().default_get(fields_list)
         ticket_id = self.env.context.get('default_ticket_id')
         channel_id = self.env.context.get('default_channel_id')
-        ctx_text = ''
+        builder = self.env['codex.context']
+        stats = {}
         if ticket_id:
-            ticket = self.env['helpdesk.ticket'].browse(ticket_id)
-            # collect last 20 messages (excluding internal notes if needed later)
-            msgs = self.env['mail.message'].search([('model','=','helpdesk.ticket'),('res_id','=',ticket.id)], order='date desc', limit=20)
-            lines = []
-            for m in reversed(msgs):
-                author = m.author_id.name or 'System'
-                body = (m.body or '').replace('<p>','').replace('</p>','').replace('<br/>','\n')
-                lines.append(f"{author}: {body}")
-            ctx_text = '\n'.join(lines).strip()
-            res['context_text'] = ctx_text
+            res['context_text'] = builder._thread_context('helpdesk.ticket', ticket_id, stats=stats)
         elif channel_id:
-            channel = self.env['discuss.channel'].browse(channel_id)
-            msgs = self.env['mail.message'].search(
-                [('model', '=', 'discuss.channel'), ('res_id', '=', channel.id)],
-                order='date desc', limit=30,
-            )
-            if not msgs:
-                msgs = self.env['mail.message'].search(
-                    [('model', '=', 'mail.channel'), ('res_id', '=', channel.id)],
-                    order='date desc', limit=30,
-                )
-            lines = []
-            for m in reversed(msgs):
-                author = m.author_id.name or 'System'
-                body = (m.body or '').replace('<p>','').replace('</p>','').replace('<br/>','\n')
-                lines.append(f"{author}: {body}")
-            ctx_text = '\n'.join(lines).strip()
-            res['context_text'] = ctx_text
+            res['context_text'] = builder._thread_context(CHANNEL_MODELS, channel_id, stats=stats)
         try:
             retriever = self.env['codex.client']
-            query = (res.get('context_text') or '')[:1000] or (self.env.user.company_id.name or '')
-            docs = retriever.rag_retrieve(query)
-            if docs:
-                rag_lines = []
-                for d in docs:
-                    rag_lines.append(f"[RAG:{d.model}#{d.res_id}] {d.title}\n{d.body}\n---")
-                rag_block = '\n'.join(rag_lines)
-                existing = res.get('context_text') or ''
+            existing = res.get('context_text') or ''
+            query = existing[:1000] or (self.env.user.company_id.name or '')
+            # documents get what the conversation and the instructions leave of the input
+            # budget; a budget of 0 disables the limit
+            budget = retriever._input_budget()
+            if budget > 0:
+                budget -= estimate_tokens(existing) + PROMPT_RESERVE
+            else:
+                budget = None
+            record = (self.env['helpdesk.ticket'].browse(ticket_id) if ticket_id
+                      else self.env['discuss.channel'].browse(channel_id) if channel_id else None)
+            rag_block = retriever._rag_context(query, budget, stats, filters=retriever._rag_filters(record))
+            if rag_block:
                 res['context_text'] = (rag_block + '\n' + existing).strip()
         except Exception:
             # fail open; do not block if RAG retrieval fails
             pass
+        res['saved_tokens'] = stats.get('saved_tokens', 0)
         return res
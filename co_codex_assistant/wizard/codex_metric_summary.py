@@ -0,0 +1,84 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from markupsafe import Markup, escape
+
+from odoo import api, fields, models, _
+
+from ..models.codex_metric import OPERATIONS
+from ..tools.metrics import histogram_percentile, merge_histograms
+
+
+class CodexMetricSummary(models.TransientModel):
+    """Latency percentiles and usage of a period, per user, purpose or model.
+
+    Percentiles cannot be summed like the other measures of a pivot view, so
+    the hourly histograms of each group are merged here first.
+    """
+    _name = 'codex.metric.summary'
+    _description = 'Codex Usage Summary'
+
+    date_from = fields.Datetime(required=True, default=lambda self: fields.Datetime.now() - timedelta(days=7))
+    date_to = fields.Datetime(required=True, default=fields.Datetime.now)
+    group_by = fields.Selection([
+        ('user_id', 'User'),
+        ('purpose', 'Purpose'),
+        ('api_model', 'Model'),
+        ('endpoint', 'Endpoint'),
+    ], default='user_id', required=True)
+    operation = fields.Selection(OPERATIONS, help='Leave empty for all operations.')
+    summary = fields.Html(compute='_compute_summary', sanitize=False)
+
+    @api.depends('date_from', 'date_to', 'group_by', 'operation')
+    def _compute_summary(self):
+        self.env['codex.metric']._flush_pending()
+        # the flushed rows were committed after this transaction's snapshot: read them on a new one
+        with self.pool.cursor() as cr:
+            self._render_summary(self.env(cr=cr)['codex.metric'])
+
+    def _render_summary(self, Metric):
+        operations = dict(OPERATIONS)
+        headers = [_('Operation'), _('Group'), _('Calls'), _('Errors'), _('Cache Hits'), _('Retries'),
+                   _('Avg (ms)'), _('Upstream Avg (ms)'), _('p50 (ms)'), _('p95 (ms)'), _('p99 (ms)'),
+                   _('Input Tokens'), _('Output Tokens'), _('Received (KB)')]
+        for wizard in self:
+            domain = [('bucket', '>=', wizard.date_from), ('bucket', '<=', wizard.date_to)]
+            if wizard.operation:
+                domain.append(('operation', '=', wizard.operation))
+            field = Metric._fields[wizard.group_by]
+            groups = defaultdict(list)
+            for row in Metric.search_read(domain, [wizard.group_by, 'operation', 'calls', 'errors', 'cache_hits',
+                                                   'retries', 'wall_ms', 'upstream_ms', 'received_kb',
+                                                   'input_tokens', 'output_tokens', 'latency_hist']):
+                value = row[wizard.group_by]
+                if field.type == 'many2one':
+                    label = value[1] if value else _('None')
+                elif field.type == 'selection':
+                    label = dict(field.selection).get(value, _('None'))
+                else:
+                    label = value or _('None')
+                groups[(row['operation'], label)].append(row)
+            lines = []
+            for (operation, label), rows in sorted(groups.items()):
+                calls = sum(r['calls'] for r in rows)
+                hist = merge_histograms(r['latency_hist'] for r in rows)
+                lines.append([
+                    operations.get(operation, operation), label, calls,
+                    sum(r['errors'] for r in rows), sum(r['cache_hits'] for r in rows),
+                    sum(r['retries'] for r in rows),
+                    round(sum(r['wall_ms'] for r in rows) / calls) if calls else 0,
+                    round(sum(r['upstream_ms'] for r in rows) / calls) if calls else 0,
+                    round(histogram_percentile(hist, 50)), round(histogram_percentile(hist, 95)),
+                    round(histogram_percentile(hist, 99)),
+                    sum(r['input_tokens'] for r in rows), sum(r['output_tokens'] for r in rows),
+                    round(sum(r['received_kb'] for r in rows)),
+                ])
+            if not lines:
+                wizard.summary = Markup('<p class="text-muted">%s</p>') % _('No measurement in this period.')
+                continue
+            head = Markup('').join(Markup('<th>%s</th>') % h for h in headers)
+            body = Markup('').join(
+                Markup('<tr>%s</tr>') % Markup('').join(Markup('<td>%s</td>') % escape(v) for v in line)
+                for line in lines)
+            wizard.summary = Markup('<table class="table table-sm table-striped o_list_table">'
+                                    '<thead><tr>%s</tr></thead><tbody>%s</tbody></table>') % (head, body)